@@ -11,9 +11,12 @@ urlpatterns = [
     path('favorites/', views.user_favorites, name='lp-user-favorites'),
     path('favorites/check/<int:video_id>/', views.check_favorite_status, name='lp-check-favorite'),
     path('user/progress/', views.user_progress, name='lp-user-progress'),
+    path('user/progress/sync/', views.sync_progress, name='lp-user-progress-sync'),
     path('dashboard/', views.dashboard_stats, name='lp-dashboard'),
     # GPT Chat endpoints
     path('chat/', views.chat_with_gpt, name='lp-chat-gpt'),
+    path('chat/stream/', views.chat_stream, name='lp-chat-stream'),
+    path('chat/jobs/<slug:job_id>/', views.chat_job_status, name='lp-chat-job'),
     path('chat/history/', views.chat_history, name='lp-chat-history'),
     path('chat/clear/', views.clear_chat_history, name='lp-chat-clear'),
 ]
@@ -140,6 +140,12 @@ def check_startup_connections():
 # Выполняем проверку при импорте
 check_startup_connections()
 
+# Прогрев GPT в фоне: первый запрос чата не ждет импорта g4f и поиска провайдеров
+from django.conf import settings
+if settings.GPT_WARMUP:
+    from .gpt_service import start_background_warm_up
+    start_background_warm_up()
+
 # Get the ASGI application
 django_asgi_app = get_asgi_application()
 
@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.http import urlencode
+from django_redis import get_redis_connection
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+# Ключи Redis (без KEY_PREFIX кэша - храним готовые байты JSON без сериализатора кэша)
+VERSION_KEY = 'learning_platform:catalog:version'
+MODIFIED_KEY = 'learning_platform:catalog:modified'
+STATS_KEY = 'learning_platform:catalog:stats'
+RESPONSE_KEY_TEMPLATE = 'learning_platform:catalog:{version}:{endpoint}:{variant}'
+PUBLISHED_KEY_TEMPLATE = 'learning_platform:catalog:{version}:published'
+
+
+def _connection():
+    return get_redis_connection('default')
+
+
+def _ttl():
+    return getattr(settings, 'CATALOG_CACHE_TTL', 3600)
+
+
+def get_version(client=None):
+    """Текущая версия каталога видео"""
+    client = client or _connection()
+    version = client.get(VERSION_KEY)
+    if version is None:
+        # Первое обращение: инициализируем версию, не перетирая уже выставленную
+        client.set(VERSION_KEY, 1, nx=True)
+        version = client.get(VERSION_KEY)
+    return int(version)
+
+
+def bump_version():
+    """Инвалидировать все закэшированные ответы каталога"""
+    try:
+        pipe = _connection().pipeline()
+        pipe.incr(VERSION_KEY)
+        pipe.set(MODIFIED_KEY, time.time())
+        return pipe.execute()[0]
+    except Exception as e:
+        logger.error(f"Не удалось обновить версию каталога: {e}")
+        return None
+
+
+def get_last_modified(client=None):
+    """Время последнего изменения каталога (None, если версия еще не менялась)"""
+    client = client or _connection()
+    value = client.get(MODIFIED_KEY)
+    if value is None:
+        return None
+    return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+
+
+def render_json(data):
+    """Рендеринг данных в те же байты, что отдает DRF Response"""
+    return JSONRenderer().render(data)
+
+
+def _variant(request, params):
+    # Абсолютные URL превью зависят от хоста, пагинация - только от своих параметров:
+    # произвольная строка запроса не должна порождать новые записи кэша
+    query = urlencode([(name, request.GET[name]) for name in params if name in request.GET])
+    url = f"{request.build_absolute_uri(request.path)}?{query}"
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def cached_response(endpoint, request, render, params=()):
+    """Ответ каталога из кэша или через render() с сохранением в кэш
+
+    render - функция без аргументов, возвращающая данные для JSON; params -
+    параметры запроса, которые читает представление. При попадании в кэш не
+    выполняются ни запросы к БД, ни сериализация. Ответ на запрос с другими
+    параметрами не сохраняется: ссылки пагинации в нем повторяют весь URL.
+    """
+    try:
+        client = _connection()
+        key = RESPONSE_KEY_TEMPLATE.format(
+            version=get_version(client),
+            endpoint=endpoint,
+            variant=_variant(request, params)
+        )
+        body = client.get(key)
+    except Exception as e:
+        logger.warning(f"Кэш каталога недоступен: {e}")
+        return HttpResponse(render_json(render()), content_type='application/json')
+
+    if body is not None:
+        _count(client, endpoint, 'hits')
+        return HttpResponse(body, content_type='application/json')
+
+    body = render_json(render())
+    if not set(request.GET).issubset(params):
+        return HttpResponse(body, content_type='application/json')
+    try:
+        client.set(key, body, ex=_ttl())
+        _count(client, endpoint, 'misses')
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить ответ каталога в кэш: {e}")
+    return HttpResponse(body, content_type='application/json')
+
+
+def published_video_categories(video_ids):
+    """Категории (ключи API) для тех из video_ids, что опубликованы
+
+    Хэш ID -> категория строится один раз на версию каталога,
+    дальше проверка списка ID стоит один HMGET.
+    """
+    from .models import Video
+    from .progress_service import API_CATEGORY_KEYS
+
+    video_ids = list(dict.fromkeys(video_ids))
+    if not video_ids:
+        return {}
+
+    client = _connection()
+    key = PUBLISHED_KEY_TEMPLATE.format(version=get_version(client))
+
+    if not client.exists(key):
+        published = {
+            video_id: API_CATEGORY_KEYS.get(category_name, '')
+            for video_id, category_name in Video.objects.published().values_list('id', 'category__name')
+        }
+        pipe = client.pipeline()
+        # Пустой маркер, чтобы каталог без видео тоже считался построенным
+        pipe.hset(key, mapping={'-': '', **published})
+        pipe.expire(key, _ttl())
+        pipe.execute()
+
+    categories = client.hmget(key, video_ids)
+    return {
+        video_id: category.decode() if isinstance(category, bytes) else category
+        for video_id, category in zip(video_ids, categories)
+        if category
+    }
+
+
+def _count(client, endpoint, outcome):
+    try:
+        client.hincrby(STATS_KEY, f'{endpoint}:{outcome}', 1)
+    except Exception:
+        pass
+
+
+def get_stats():
+    """Счетчики попаданий/промахов по эндпоинтам"""
+    raw = _connection().hgetall(STATS_KEY)
+    stats = {}
+    for field, value in raw.items():
+        field = field.decode() if isinstance(field, bytes) else field
+        endpoint, _, outcome = field.rpartition(':')
+        stats.setdefault(endpoint, {'hits': 0, 'misses': 0})[outcome] = int(value)
+    for counters in stats.values():
+        total = counters['hits'] + counters['misses']
+        counters['hit_ratio'] = round(counters['hits'] / total, 4) if total else 0.0
+    return stats
+
+
+def reset_stats():
+    """Сбросить счетчики попаданий"""
+    _connection().delete(STATS_KEY)
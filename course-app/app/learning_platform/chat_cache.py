@@ -0,0 +1,351 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# Ключи Redis (без KEY_PREFIX кэша - работаем с соединением напрямую)
+ENTRY_KEY_TEMPLATE = 'learning_platform:chat_cache:entry:{digest}'
+LRU_KEY = 'learning_platform:chat_cache:lru'
+STATS_KEY = 'learning_platform:chat_cache:stats'
+
+EXACT_HIT = 'exact_hits'
+FUZZY_HIT = 'fuzzy_hits'
+MISS = 'misses'
+BYPASS = 'bypassed'
+
+# Реплики, которые продолжают разговор ("а если...", "объясни подробнее",
+# "перепиши это") - их ответ зависит от истории, такие сообщения не кэшируются
+_FOLLOW_UP_PATTERN = re.compile(
+    r'\b(это\w*|этот|эта|эти|этого|этой|этим|его|ее|их|он|она|оно|они|там|тут|выше|ниже|'
+    r'предыдущ\w*|прошл\w*|продолж\w*|подробнее|еще|ещё|снова|опять|тоже|также|'
+    r'перепиши|переделай|исправь|сократи|дополни|поясни|'
+    r'it|its|this|that|these|those|above|previous|continue|more|again|also|rewrite|shorter)\b'
+    r'|^(а|и|но|а если|а как|а что|а почему|and|but|what about|how about)\b'
+)
+
+# Код и операторы: "a && b" и "a || b" близки посимвольно, но ответы разные
+_CODE_PATTERN = re.compile(r'[`{}<>=;$&|\[\]\\]')
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = re.compile(r'[\s?!.…]+$')
+
+_SHINGLE_SIZE = 3
+_MINHASH_PERMUTATIONS = 64
+_LSH_BANDS = 16
+_LSH_ROWS = _MINHASH_PERMUTATIONS // _LSH_BANDS
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def _connection():
+    return get_redis_connection('default')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enabled():
+    return _setting('CHAT_CACHE_ENABLED', True)
+
+
+def normalize(message):
+    """Текст вопроса для ключа кэша: регистр, ё, пробелы и финальная пунктуация"""
+    text = _WHITESPACE.sub(' ', message.lower().replace('ё', 'е')).strip()
+    return _TRAILING_PUNCTUATION.sub('', text)
+
+
+def context_hash(history, summary=''):
+    """Хэш контекста, который уйдет провайдеру вместе с вопросом"""
+    payload = json.dumps(
+        [summary] + [[turn['message'], turn['response']] for turn in history],
+        ensure_ascii=False
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def is_standalone(normalized):
+    """Вопрос понятен без истории разговора
+
+    Эвристика с перекосом в безопасную сторону: лишний промах дешевле, чем
+    ответ на чужой контекст.
+    """
+    return len(normalized.split()) >= 2 and not _FOLLOW_UP_PATTERN.search(normalized)
+
+
+def cache_context(message, history):
+    """(нормализованный текст, хэш контекста) или None, если кэш нужно обойти
+
+    Самостоятельный вопрос кэшируется с пустым контекстом - "что такое flexbox"
+    одинаково отвечается в любом разговоре. Реплика-продолжение при непустой
+    истории по умолчанию обходит кэш; с CHAT_CACHE_CONTEXT_TURNS > 0 она
+    кэшируется только точно, с хэшем последних ходов в ключе.
+    """
+    normalized = normalize(message)
+    if not normalized:
+        return None
+    if not history or is_standalone(normalized):
+        return normalized, ''
+
+    turns = _setting('CHAT_CACHE_CONTEXT_TURNS', 0)
+    if turns <= 0:
+        return None
+    return normalized, context_hash(history[-turns:])
+
+
+def _entry_key(normalized, ctx_hash):
+    digest = hashlib.sha1(f'{ctx_hash}|{normalized}'.encode('utf-8')).hexdigest()
+    return ENTRY_KEY_TEMPLATE.format(digest=digest)
+
+
+def _incr(client, field):
+    try:
+        client.hincrby(STATS_KEY, field, 1)
+    except Exception as e:
+        logger.warning(f"Не удалось обновить статистику кэша чата: {e}")
+
+
+class _NearDuplicateIndex:
+    """Локальный индекс похожих вопросов: MinHash по символьным шинглам + LSH
+
+    Строится лениво из последних ChatMessage и дополняется новыми ответами.
+    Хранит только id сообщений - сам ответ берется из базы при попадании.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._entries = OrderedDict()  # id -> (сигнатура, время создания)
+        self._buckets = {}  # (полоса, значения) -> множество id
+        seeds = hashlib.sha256(b'learning_platform:minhash').digest()
+        self._coefficients = []
+        for i in range(_MINHASH_PERMUTATIONS):
+            seed = hashlib.sha256(seeds + i.to_bytes(2, 'big')).digest()
+            a = int.from_bytes(seed[:8], 'big') % _MERSENNE_PRIME or 1
+            b = int.from_bytes(seed[8:16], 'big') % _MERSENNE_PRIME
+            self._coefficients.append((a, b))
+
+    def _signature(self, normalized):
+        text = f' {normalized} '
+        shingles = {text[i:i + _SHINGLE_SIZE] for i in range(max(len(text) - _SHINGLE_SIZE + 1, 1))}
+        hashes = [
+            int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+            for shingle in shingles
+        ]
+        return tuple(
+            min((a * value + b) % _MERSENNE_PRIME for value in hashes)
+            for a, b in self._coefficients
+        )
+
+    def _bands(self, signature):
+        for band in range(_LSH_BANDS):
+            yield band, signature[band * _LSH_ROWS:(band + 1) * _LSH_ROWS]
+
+    def _add(self, entry_id, signature, created_at):
+        if entry_id in self._entries:
+            return
+        self._entries[entry_id] = (signature, created_at)
+        for band in self._bands(signature):
+            self._buckets.setdefault(band, set()).add(entry_id)
+
+        while len(self._entries) > _setting('CHAT_CACHE_FUZZY_MAX_ENTRIES', 5000):
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for band in self._bands(entry[0]):
+            ids = self._buckets.get(band)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._buckets[band]
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        from .models import ChatMessage
+
+        rows = (ChatMessage.objects
+                .order_by('-id')
+                .values_list('id', 'message', 'created_at')[:_setting('CHAT_CACHE_FUZZY_ROWS', 2000)])
+        for entry_id, message, created_at in reversed(list(rows)):
+            normalized = normalize(str(message))
+            if is_standalone(normalized) and not _CODE_PATTERN.search(normalized):
+                self._add(entry_id, self._signature(normalized), created_at.timestamp())
+        self._loaded = True
+
+    def add(self, entry_id, normalized):
+        if _CODE_PATTERN.search(normalized):
+            return
+        signature = self._signature(normalized)
+        with self._lock:
+            self._add(entry_id, signature, time.time())
+
+    def discard(self, entry_id):
+        with self._lock:
+            self._discard(entry_id)
+
+    def find(self, normalized):
+        """id самого похожего сохраненного вопроса или None"""
+        if _CODE_PATTERN.search(normalized):
+            return None
+        signature = self._signature(normalized)
+        threshold = _setting('CHAT_CACHE_FUZZY_THRESHOLD', 0.8)
+        oldest = time.time() - _setting('CHAT_CACHE_TTL', 86400)
+
+        with self._lock:
+            self._ensure_loaded()
+            candidates = set()
+            for band in self._bands(signature):
+                candidates |= self._buckets.get(band, set())
+
+            best_id, best_score = None, threshold
+            for entry_id in candidates:
+                other, created_at = self._entries[entry_id]
+                if created_at < oldest:
+                    continue
+                score = sum(x == y for x, y in zip(signature, other)) / _MINHASH_PERMUTATIONS
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            return best_id
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._loaded = False
+
+
+_index = _NearDuplicateIndex()
+
+
+def _fuzzy_lookup(normalized):
+    from .models import ChatMessage
+
+    entry_id = _index.find(normalized)
+    if entry_id is None:
+        return None
+    row = ChatMessage.objects.filter(id=entry_id).values('response', 'model_used').first()
+    if row is None:
+        # Сообщение удалено вместе с историей пользователя
+        _index.discard(entry_id)
+        return None
+    return {
+        'response': row['response'],
+        'model_used': row['model_used'],
+        'provider_used': 'cache',
+    }
+
+
+def lookup(message, history):
+    """Закэшированный ответ GPT в формате get_response_async или None
+
+    Синхронная: Redis и (для нечетких попаданий) база данных.
+    """
+    if not enabled():
+        return None
+    context = cache_context(message, history)
+    client = _connection()
+    if context is None:
+        _incr(client, BYPASS)
+        return None
+
+    normalized, ctx_hash = context
+    key = _entry_key(normalized, ctx_hash)
+    try:
+        raw = client.get(key)
+        if raw is not None:
+            pipe = client.pipeline(transaction=False)
+            pipe.zadd(LRU_KEY, {key: time.time()})
+            pipe.expire(key, _setting('CHAT_CACHE_TTL', 86400))
+            pipe.hincrby(STATS_KEY, EXACT_HIT, 1)
+            pipe.execute()
+            return {**json.loads(raw), 'success': True, 'cached': True}
+    except Exception as e:
+        logger.warning(f"Кэш чата недоступен: {e}")
+        return None
+
+    if not ctx_hash and _setting('CHAT_CACHE_FUZZY', True):
+        try:
+            cached = _fuzzy_lookup(normalized)
+        except Exception as e:
+            logger.warning(f"Ошибка поиска похожего вопроса: {e}")
+            cached = None
+        if cached is not None:
+            _incr(client, FUZZY_HIT)
+            return {**cached, 'success': True, 'cached': True}
+
+    _incr(client, MISS)
+    return None
+
+
+def store(message, history, gpt_response, chat_message_id=None):
+    """Сохранить успешный ответ GPT; старые записи вытесняются по LRU"""
+    if not enabled() or not gpt_response.get('success') or gpt_response.get('cached'):
+        return
+    context = cache_context(message, history)
+    if context is None:
+        return
+
+    normalized, ctx_hash = context
+    key = _entry_key(normalized, ctx_hash)
+    entry = {
+        'response': gpt_response['response'],
+        'model_used': gpt_response.get('model_used', 'gpt-default'),
+        'provider_used': gpt_response.get('provider_used', 'unknown'),
+    }
+    try:
+        client = _connection()
+        pipe = client.pipeline(transaction=False)
+        pipe.set(key, json.dumps(entry, ensure_ascii=False), ex=_setting('CHAT_CACHE_TTL', 86400))
+        pipe.zadd(LRU_KEY, {key: time.time()})
+        pipe.zcard(LRU_KEY)
+        size = pipe.execute()[-1]
+
+        overflow = size - _setting('CHAT_CACHE_MAX_ENTRIES', 5000)
+        if overflow > 0:
+            evicted = [member for member, _ in client.zpopmin(LRU_KEY, overflow)]
+            if evicted:
+                client.delete(*evicted)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить ответ в кэш чата: {e}")
+
+    if chat_message_id is not None and is_standalone(normalized) and _setting('CHAT_CACHE_FUZZY', True):
+        _index.add(chat_message_id, normalized)
+
+
+def get_stats():
+    """Счетчики попаданий кэша чата и число записей"""
+    client = _connection()
+    raw = {
+        (field.decode() if isinstance(field, bytes) else field): int(value)
+        for field, value in client.hgetall(STATS_KEY).items()
+    }
+    stats = {field: raw.get(field, 0) for field in (EXACT_HIT, FUZZY_HIT, MISS, BYPASS)}
+    lookups = stats[EXACT_HIT] + stats[FUZZY_HIT] + stats[MISS]
+    stats['hit_ratio'] = round((stats[EXACT_HIT] + stats[FUZZY_HIT]) / lookups, 4) if lookups else 0.0
+    stats['entries'] = client.zcard(LRU_KEY)
+    return stats
+
+
+def reset_stats():
+    """Сбросить счетчики попаданий"""
+    _connection().delete(STATS_KEY)
+
+
+def clear():
+    """Удалить все закэшированные ответы и локальный индекс"""
+    client = _connection()
+    keys = client.zrange(LRU_KEY, 0, -1)
+    if keys:
+        client.delete(*keys)
+    client.delete(LRU_KEY)
+    _index.clear()
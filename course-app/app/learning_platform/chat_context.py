@@ -0,0 +1,159 @@
+import logging
+import re
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from .models import ChatMessage, ChatSummary
+
+logger = logging.getLogger(__name__)
+
+# Служебные токены на каждое сообщение (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Длина вопроса и ответа в строке краткого содержания, символы
+SUMMARY_QUESTION_CHARS = 200
+SUMMARY_ANSWER_CHARS = 120
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def estimate_tokens(text):
+    """Грубая оценка числа токенов без токенизатора
+
+    Около 4 символов латиницы или 2 символов кириллицы на токен - это
+    примерно 4 байта UTF-8 в обоих случаях.
+    """
+    return len(str(text).encode('utf-8')) // 4 + 1
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Начало текста, помещающееся в max_tokens"""
+    encoded = str(text).encode('utf-8')
+    limit = max(max_tokens, 1) * 4
+    if len(encoded) <= limit:
+        return str(text)
+    return encoded[:limit].decode('utf-8', errors='ignore').rstrip() + '…'
+
+
+def turn_tokens(message, response):
+    return estimate_tokens(message) + estimate_tokens(response) + 2 * MESSAGE_OVERHEAD_TOKENS
+
+
+def history_queryset(user=None, session_id=None):
+    """Сообщения разговора: по пользователю или по session_id анонимного клиента"""
+    if user is not None and user.is_authenticated:
+        return ChatMessage.objects.filter(user=user)
+    if session_id:
+        return ChatMessage.objects.filter(session_id=session_id)
+    return None
+
+
+def summary_queryset(user=None, session_id=None):
+    if user is not None and user.is_authenticated:
+        return ChatSummary.objects.filter(user=user)
+    if session_id:
+        return ChatSummary.objects.filter(user__isnull=True, session_id=session_id)
+    return None
+
+
+def _summary_line(message, response):
+    question = _WHITESPACE.sub(' ', str(message)).strip()
+    answer = _WHITESPACE.sub(' ', str(response)).strip()
+    if len(question) > SUMMARY_QUESTION_CHARS:
+        question = question[:SUMMARY_QUESTION_CHARS].rstrip() + '…'
+    if len(answer) > SUMMARY_ANSWER_CHARS:
+        answer = answer[:SUMMARY_ANSWER_CHARS].rstrip() + '…'
+    return f"- {question} → {answer}" if answer else f"- {question}"
+
+
+def _fit_summary(lines, max_tokens):
+    """Последние строки краткого содержания в пределах бюджета"""
+    while lines and estimate_tokens('\n'.join(lines)) > max_tokens:
+        lines = lines[1:]
+    return '\n'.join(lines)
+
+
+async def _save_summary(user, session_id, summary_obj, summary, covered_until_id):
+    if summary_obj is not None:
+        await ChatSummary.objects.filter(pk=summary_obj.pk).aupdate(
+            summary=summary,
+            covered_until_id=covered_until_id,
+            updated_at=timezone.now()
+        )
+        return
+    try:
+        await ChatSummary.objects.acreate(
+            user=user if user is not None and user.is_authenticated else None,
+            session_id='' if user is not None and user.is_authenticated else session_id,
+            summary=summary,
+            covered_until_id=covered_until_id
+        )
+    except IntegrityError:
+        # Параллельный запрос того же пользователя уже создал запись
+        logger.info(f"Краткое содержание чата уже создано: user={user}, session={session_id}")
+
+
+async def build_context(user=None, session_id=None):
+    """Контекст для провайдера: (краткое содержание, последние ходы)
+
+    Из базы читаются только последние CHAT_CONTEXT_MAX_TURNS ходов. Самые
+    свежие из них помещаются в CHAT_CONTEXT_TOKEN_BUDGET, вытесненные
+    дописываются в сохраненное краткое содержание (по строке на ход, в
+    пределах CHAT_CONTEXT_SUMMARY_TOKENS, старые строки забываются). Самый
+    свежий ход передается всегда, при необходимости обрезанным.
+    """
+    messages = history_queryset(user, session_id)
+    if messages is None:
+        return '', []
+
+    max_turns = _setting('CHAT_CONTEXT_MAX_TURNS', 20)
+    budget = _setting('CHAT_CONTEXT_TOKEN_BUDGET', 3000)
+    summary_budget = _setting('CHAT_CONTEXT_SUMMARY_TOKENS', 500)
+
+    rows = messages.order_by('-created_at', '-id').values_list('id', 'message', 'response')[:max_turns]
+    recent = [(turn_id, str(message), str(response)) async for turn_id, message, response in rows]
+
+    summary_obj = await summary_queryset(user, session_id).afirst()
+    covered_until_id = summary_obj.covered_until_id if summary_obj else 0
+    summary = summary_obj.summary if summary_obj else ''
+
+    # Свежие ходы, еще не учтенные в кратком содержании, от новых к старым
+    recent = [row for row in recent if row[0] > covered_until_id]
+    turns = []
+    used = 0
+    for turn_id, message, response in recent:
+        cost = turn_tokens(message, response)
+        if used + cost > budget:
+            if not turns:
+                message = truncate_to_tokens(message, budget // 3)
+                response = truncate_to_tokens(response, budget // 2)
+                turns.append({'message': message, 'response': response})
+            break
+        turns.append({'message': message, 'response': response})
+        used += cost
+
+    dropped = recent[len(turns):]
+    if len(recent) == max_turns and recent:
+        # Ходы между кратким содержанием и окном последних сообщений:
+        # в сводку попадут не больше строк, чем в нее поместится
+        oldest_id = recent[-1][0]
+        gap = (messages
+               .filter(id__gt=covered_until_id, id__lt=oldest_id)
+               .order_by('-id')
+               .values_list('id', 'message', 'response')[:_setting('CHAT_CONTEXT_SUMMARY_LINES', 20)])
+        dropped += [(turn_id, str(message), str(response)) async for turn_id, message, response in gap]
+
+    if dropped:
+        lines = summary.splitlines() if summary else []
+        lines += [_summary_line(message, response) for _, message, response in reversed(dropped)]
+        summary = _fit_summary(lines, summary_budget)
+        covered_until_id = max(turn_id for turn_id, _, _ in dropped)
+        await _save_summary(user, session_id, summary_obj, summary, covered_until_id)
+
+    turns.reverse()
+    return summary, turns
+
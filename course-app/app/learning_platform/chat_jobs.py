@@ -0,0 +1,339 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth.models import User
+from django_redis import get_redis_connection
+from . import chat_service
+
+logger = logging.getLogger(__name__)
+
+# Ключи Redis (без KEY_PREFIX кэша - работаем с соединением напрямую)
+QUEUE_KEY = 'learning_platform:chat_jobs:queue'
+JOB_KEY_TEMPLATE = 'learning_platform:chat_jobs:job:{job_id}'
+# Взятые воркером, но еще не выполненные задачи; реестр воркеров и их пульс
+PROCESSING_KEY_TEMPLATE = 'learning_platform:chat_jobs:processing:{worker_id}'
+WORKERS_KEY = 'learning_platform:chat_jobs:workers'
+HEARTBEAT_KEY_TEMPLATE = 'learning_platform:chat_jobs:worker:{worker_id}'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def job_group(job_id):
+    """Группа Channels, в которую отправляется результат задачи"""
+    return f"chat_job_{job_id}"
+
+
+def user_group(user_id):
+    """Группа Channels всех чат-сокетов пользователя"""
+    return f"chat_user_{user_id}"
+
+
+class RedisJobQueue:
+    """Очередь в списке Redis, задачи - JSON-строки с TTL
+
+    Общая для веб-процессов и воркеров chat_worker. Взятая задача атомарно
+    переносится в список обработки воркера и удаляется из него только после
+    выполнения (ack). Задачи воркера, переставшего обновлять пульс (упал),
+    возвращаются в очередь при старте любого другого воркера (recover).
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.processing_key = PROCESSING_KEY_TEMPLATE.format(worker_id=self.worker_id)
+
+    def _connection(self):
+        return get_redis_connection('default')
+
+    def push(self, job):
+        pipe = self._connection().pipeline()
+        pipe.set(JOB_KEY_TEMPLATE.format(job_id=job['id']), json.dumps(job, ensure_ascii=False),
+                 ex=_setting('CHAT_JOB_TTL', 3600))
+        pipe.lpush(QUEUE_KEY, job['id'])
+        pipe.execute()
+
+    def pop(self, timeout):
+        job_id = self._connection().brpoplpush(QUEUE_KEY, self.processing_key, timeout=max(int(timeout), 1))
+        if job_id is None:
+            return None
+        return job_id.decode() if isinstance(job_id, bytes) else job_id
+
+    def ack(self, job_id):
+        self._connection().lrem(self.processing_key, 1, job_id)
+
+    def heartbeat(self):
+        pipe = self._connection().pipeline()
+        pipe.sadd(WORKERS_KEY, self.worker_id)
+        pipe.set(HEARTBEAT_KEY_TEMPLATE.format(worker_id=self.worker_id), 1,
+                 ex=_setting('CHAT_WORKER_HEARTBEAT_TTL', 30))
+        pipe.execute()
+
+    def recover(self):
+        """Вернуть в очередь задачи воркеров без пульса; возвращает их число"""
+        client = self._connection()
+        recovered = 0
+        for worker_id in client.smembers(WORKERS_KEY):
+            worker_id = worker_id.decode() if isinstance(worker_id, bytes) else worker_id
+            if worker_id == self.worker_id or client.exists(HEARTBEAT_KEY_TEMPLATE.format(worker_id=worker_id)):
+                continue
+            processing_key = PROCESSING_KEY_TEMPLATE.format(worker_id=worker_id)
+            # RPOPLPUSH по одной задаче: перенос атомарен, задача не теряется и не дублируется
+            while client.rpoplpush(processing_key, QUEUE_KEY) is not None:
+                recovered += 1
+            client.srem(WORKERS_KEY, worker_id)
+        return recovered
+
+    def get(self, job_id):
+        raw = self._connection().get(JOB_KEY_TEMPLATE.format(job_id=job_id))
+        return json.loads(raw) if raw is not None else None
+
+    def save(self, job):
+        self._connection().set(JOB_KEY_TEMPLATE.format(job_id=job['id']), json.dumps(job, ensure_ascii=False),
+                               ex=_setting('CHAT_JOB_TTL', 3600))
+
+    def size(self):
+        return self._connection().llen(QUEUE_KEY)
+
+
+class InMemoryJobQueue:
+    """Очередь в памяти процесса - для тестов и запуска без Redis
+
+    Воркеры должны работать в том же процессе, что и веб-запросы.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def push(self, job):
+        self.save(job)
+        self._queue.put(job['id'])
+
+    def pop(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    # Задачи не переживают процесс - восстанавливать после сбоя нечего
+    def ack(self, job_id):
+        pass
+
+    def heartbeat(self):
+        pass
+
+    def recover(self):
+        return 0
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def save(self, job):
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+
+    def size(self):
+        return self._queue.qsize()
+
+
+BACKENDS = {
+    'redis': RedisJobQueue,
+    'memory': InMemoryJobQueue,
+}
+
+_backend = None
+
+
+def get_backend():
+    """Очередь, выбранная в CHAT_JOB_BACKEND (создается один раз на процесс)"""
+    global _backend
+    if _backend is None:
+        _backend = BACKENDS[_setting('CHAT_JOB_BACKEND', 'redis')]()
+    return _backend
+
+
+def create_job(user, message, session_id=None):
+    """Поставить сообщение чата в очередь; возвращает запись задачи"""
+    authenticated = user is not None and user.is_authenticated
+    job = {
+        'id': uuid.uuid4().hex,
+        'status': QUEUED,
+        'user_id': user.id if authenticated else None,
+        'session_id': chat_service.new_session(user, session_id),
+        'message': message,
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+        'status_code': None,
+        'result': None,
+    }
+    get_backend().push(job)
+    logger.info(f"Chat job queued: id={job['id']}, user={job['user_id'] or 'anonymous'}")
+    return job
+
+
+def get_job(job_id):
+    return get_backend().get(job_id)
+
+
+def can_access(job, user, session_id=None):
+    """Задачу видит только ее автор: пользователь или владелец session_id"""
+    if job['user_id'] is not None:
+        return user is not None and user.is_authenticated and user.id == job['user_id']
+    return bool(session_id) and session_id == job['session_id']
+
+
+def public_state(job):
+    """Данные задачи для клиента (без текста вопроса и служебных полей)"""
+    state = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'session_id': job['session_id'],
+    }
+    if job['status'] == DONE:
+        state['status_code'] = job['status_code']
+        state['result'] = job['result']
+    return state
+
+
+async def _notify(job):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    event = {'type': 'chat_job_result', 'job': public_state(job)}
+    groups = [job_group(job['id'])]
+    if job['user_id'] is not None:
+        groups.append(user_group(job['user_id']))
+    for group in groups:
+        try:
+            await channel_layer.group_send(group, event)
+        except Exception as e:
+            logger.warning(f"Не удалось отправить результат задачи {job['id']}: {e}")
+
+
+async def run_job(job_id):
+    """Выполнить задачу: тот же конвейер, что и у синхронного /api/chat/"""
+    backend = get_backend()
+    job = await sync_to_async(backend.get, thread_sensitive=False)(job_id)
+    if job is None:
+        logger.warning(f"Chat job {job_id} expired before processing")
+        return None
+    if job['status'] == DONE:
+        # Возвращена в очередь после сбоя воркера, но результат уже сохранен
+        return job
+
+    job.update(status=RUNNING, started_at=time.time())
+    await sync_to_async(backend.save, thread_sensitive=False)(job)
+
+    user = None
+    if job['user_id'] is not None:
+        user = await User.objects.filter(id=job['user_id']).afirst()
+
+    if job['user_id'] is not None and user is None:
+        status_code, payload = 404, {'success': False, 'error': 'Пользователь не найден'}
+    else:
+        status_code, payload = await chat_service.handle_message(user, job['message'], job['session_id'])
+
+    job.update(status=DONE, finished_at=time.time(), status_code=status_code, result=payload)
+    await sync_to_async(backend.save, thread_sensitive=False)(job)
+    logger.info(f"Chat job done: id={job_id}, status={status_code}, "
+               f"waited={round(job['started_at'] - job['created_at'], 2)}с, "
+               f"took={round(job['finished_at'] - job['started_at'], 2)}с")
+    await _notify(job)
+    return job
+
+
+class WorkerPool:
+    """Пул asyncio-воркеров, разбирающих очередь задач чата
+
+    Очередь читает один диспетчер; задача берется, только когда есть
+    свободное место, поэтому одновременно выполняется не больше concurrency
+    задач. Запросы к одному провайдеру дополнительно ограничивает GPTService.
+    """
+
+    def __init__(self, concurrency=None, poll_timeout=1.0):
+        self.concurrency = concurrency or _setting('CHAT_WORKER_CONCURRENCY', 8)
+        self.poll_timeout = poll_timeout
+        self.processed = 0
+        self._stopping = False
+
+    def stop(self):
+        self._stopping = True
+
+    async def run(self, max_jobs=None):
+        """Разбирать очередь до stop() (или до max_jobs задач), затем дождаться текущих"""
+        backend = get_backend()
+        pop = sync_to_async(backend.pop, thread_sensitive=False)
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        taken = 0
+
+        await sync_to_async(backend.heartbeat, thread_sensitive=False)()
+        recovered = await sync_to_async(backend.recover, thread_sensitive=False)()
+        if recovered:
+            logger.warning(f"Returned {recovered} chat jobs of stopped workers to the queue")
+        heartbeat = asyncio.create_task(self._heartbeat(backend))
+
+        try:
+            while not self._stopping and (max_jobs is None or taken < max_jobs):
+                await slots.acquire()
+                try:
+                    job_id = await pop(self.poll_timeout)
+                except Exception as e:
+                    slots.release()
+                    logger.error(f"Ошибка чтения очереди задач чата: {e}")
+                    await asyncio.sleep(self.poll_timeout)
+                    continue
+                if job_id is None:
+                    slots.release()
+                    continue
+
+                taken += 1
+                task = asyncio.create_task(self._run_one(job_id, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            heartbeat.cancel()
+
+    async def _heartbeat(self, backend):
+        # Пульс идет отдельно от диспетчера: тот может долго ждать свободного места
+        interval = _setting('CHAT_WORKER_HEARTBEAT_TTL', 30) / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await sync_to_async(backend.heartbeat, thread_sensitive=False)()
+            except Exception as e:
+                logger.warning(f"Не удалось обновить пульс воркера чата: {e}")
+
+    async def _run_one(self, job_id, slots):
+        backend = get_backend()
+        try:
+            await run_job(job_id)
+            self.processed += 1
+        except Exception as e:
+            logger.error(f"Chat job {job_id} failed: {e}")
+        finally:
+            slots.release()
+            try:
+                await sync_to_async(backend.ack, thread_sensitive=False)(job_id)
+            except Exception as e:
+                logger.warning(f"Не удалось подтвердить задачу {job_id}: {e}")
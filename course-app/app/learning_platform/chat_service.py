@@ -0,0 +1,233 @@
+import logging
+import uuid
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.settings import api_settings
+from .models import ChatMessage
+from .chat_context import build_context
+from .gpt_service import gpt_service
+from . import chat_cache, single_flight
+
+logger = logging.getLogger(__name__)
+
+
+def throttle_wait(request):
+    """Проверка троттлов DRF по умолчанию (как у @api_view)
+
+    Возвращает время ожидания в секундах, если лимит превышен, иначе None.
+    Синхронная: троттлы хранят историю запросов в кэше.
+    """
+    for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, None):
+            return throttle.wait() or 0
+    return None
+
+
+def _user_label(user):
+    return user if user is not None and user.is_authenticated else 'anonymous'
+
+
+def new_session(user, session_id):
+    # Если пользователь не авторизован и нет session_id, создаем новый
+    if not (user is not None and user.is_authenticated) and not session_id:
+        return str(uuid.uuid4())
+    return session_id
+
+
+async def _save_message(user, session_id, message, gpt_response):
+    return await ChatMessage.objects.acreate(
+        user=user if user is not None and user.is_authenticated else None,
+        session_id=session_id or '',
+        message=message,
+        response=gpt_response['response'],
+        model_used=gpt_response.get('model_used', 'gpt-default')
+    )
+
+
+def _success_payload(message, session_id, gpt_response, chat_message):
+    return {
+        'success': True,
+        'message': message,
+        'response': gpt_response['response'],
+        'session_id': session_id,
+        'chat_id': chat_message.id,
+        'provider_used': gpt_response.get('provider_used', 'unknown'),
+        'cached': gpt_response.get('cached', False),
+        'created_at': chat_message.created_at.isoformat()
+    }
+
+
+def _error_result(session_id, gpt_response):
+    """(HTTP-статус, данные) для неуспешного ответа GPT"""
+    error_message = gpt_response.get('response', 'Извините, произошла ошибка.')
+    error_details = gpt_response.get('error', 'Unknown error')
+    logger.warning(f"Chat GPT error: {error_details}")
+
+    if gpt_response.get('overloaded'):
+        # Очереди к провайдерам заполнены - отказываем сразу, клиент повторит позже
+        return 429, {
+            'success': False,
+            'error': 'Service overloaded',
+            'message': 'Сейчас слишком много запросов. Пожалуйста, повторите через несколько секунд.',
+            'session_id': session_id,
+            'retry_after': 5
+        }
+
+    # Проверяем, является ли это ошибкой rate limit
+    if "rate" in error_details.lower() or "limit" in error_details.lower() or "429" in str(error_details):
+        return 429, {
+            'success': False,
+            'error': 'Rate limit exceeded',
+            'message': 'Слишком много запросов. Пожалуйста, подождите немного и попробуйте снова.',
+            'session_id': session_id,
+            'retry_after': 30
+        }
+
+    return 503, {
+        'success': False,
+        'error': error_details,
+        'message': error_message,
+        'session_id': session_id
+    }
+
+
+async def _cached_response(message, conversation_history):
+    # Redis и (для похожих вопросов) база - синхронные вызовы в потоке Django
+    return await sync_to_async(chat_cache.lookup)(message, conversation_history)
+
+
+async def _remember_response(message, conversation_history, gpt_response, chat_message):
+    # Общий ответ уже закэширован лидером
+    if not gpt_response.get('cached') and not gpt_response.get('coalesced'):
+        await sync_to_async(chat_cache.store)(message, conversation_history, gpt_response, chat_message.id)
+
+
+def _critical_error_payload(e):
+    return {
+        'success': False,
+        'error': 'Внутренняя ошибка сервера',
+        'message': 'Извините, произошла ошибка при обработке вашего запроса. Попробуйте еще раз.',
+        'details': str(e) if settings.DEBUG else None  # Показываем детали только в режиме отладки
+    }
+
+
+async def handle_message(user, message, session_id=None):
+    """Обработать сообщение чата: контекст -> GPT -> сохранение
+
+    Общий асинхронный конвейер для HTTP и WebSocket. user должен быть уже
+    загружен (не ленивый объект). Возвращает (HTTP-статус, данные ответа).
+    """
+    session_id = new_session(user, session_id)
+
+    try:
+        summary, conversation_history = await build_context(user, session_id)
+
+        logger.info(f"Chat request: user={_user_label(user)}, "
+                   f"session={session_id}, msg_len={len(message)}, history_len={len(conversation_history)}, summary_len={len(summary)}")
+
+        gpt_response = await _cached_response(message, conversation_history)
+        if gpt_response is None:
+            gpt_response = await _coalesced_response(message, conversation_history, summary)
+
+        if not gpt_response['success']:
+            return _error_result(session_id, gpt_response)
+
+        # Даже ответ из кэша сохраняется: история разговора должна быть полной
+        chat_message = await _save_message(user, session_id, message, gpt_response)
+        await _remember_response(message, conversation_history, gpt_response, chat_message)
+        logger.info(f"Chat success: provider={gpt_response.get('provider_used', 'unknown')}, "
+                   f"response_len={len(gpt_response['response'])}")
+        return 200, _success_payload(message, session_id, gpt_response, chat_message)
+
+    except Exception as e:
+        logger.error(f"Critical chat error: {str(e)}, user={_user_label(user)}, "
+                    f"session={session_id}, msg_len={len(message)}")
+        return 500, _critical_error_payload(e)
+
+
+async def _coalesced_response(message, conversation_history, summary):
+    """Ответ GPT с объединением одинаковых одновременных запросов
+
+    Один запрос (лидер) обращается к провайдерам, остальные с тем же вопросом
+    и контекстом ждут его ответ - в этом процессе и в других воркерах.
+    """
+    flight = None
+    gpt_response = None
+    try:
+        flight = await single_flight.join(single_flight.flight_key(message, conversation_history, summary))
+        shared = await flight.wait()
+        if shared is not None:
+            return shared
+
+        gpt_response = await gpt_service.get_response_async(message, conversation_history, summary)
+        return gpt_response
+    finally:
+        # Без ответа (ошибка, отмена) ожидающие получают None и запрашивают сами
+        if flight is not None:
+            await flight.publish(gpt_response)
+
+
+async def _shared_events(shared):
+    """Готовый ответ (из кэша или от другого запроса) в виде событий потока"""
+    if not shared['success']:
+        yield {'type': 'error', **shared}
+        return
+    yield {'type': 'delta', 'content': shared['response']}
+    yield {'type': 'done', **shared}
+
+
+async def stream_message(user, message, session_id=None):
+    """Потоковый вариант handle_message
+
+    Асинхронный генератор событий для WebSocket и SSE: 'start' с session_id,
+    'delta' с фрагментами текста, в конце 'done' (данные как у handle_message,
+    сообщение уже сохранено) или 'error' (с HTTP-статусом в поле status).
+    """
+    session_id = new_session(user, session_id)
+    yield {'type': 'start', 'session_id': session_id}
+
+    try:
+        summary, conversation_history = await build_context(user, session_id)
+
+        logger.info(f"Chat stream: user={_user_label(user)}, "
+                   f"session={session_id}, msg_len={len(message)}, history_len={len(conversation_history)}, summary_len={len(summary)}")
+
+        flight = None
+        try:
+            shared = await _cached_response(message, conversation_history)
+            if shared is None:
+                flight = await single_flight.join(single_flight.flight_key(message, conversation_history, summary))
+                shared = await flight.wait()
+
+            if shared is not None:
+                events = _shared_events(shared)
+            else:
+                events = gpt_service.stream_response_async(message, conversation_history, summary)
+
+            async for event in events:
+                if event['type'] == 'delta':
+                    yield event
+                    continue
+
+                result = {key: value for key, value in event.items() if key != 'type'}
+                if flight is not None:
+                    await flight.publish({'success': event['type'] == 'done', **result})
+
+                if event['type'] == 'done':
+                    chat_message = await _save_message(user, session_id, message, event)
+                    await _remember_response(message, conversation_history, event, chat_message)
+                    logger.info(f"Chat stream success: provider={event.get('provider_used', 'unknown')}, "
+                               f"response_len={len(event['response'])}")
+                    yield {'type': 'done', **_success_payload(message, session_id, event, chat_message)}
+                else:
+                    status_code, payload = _error_result(session_id, event)
+                    yield {'type': 'error', 'status': status_code, **payload}
+        finally:
+            if flight is not None:
+                await flight.publish(None)
+
+    except Exception as e:
+        logger.error(f"Critical chat stream error: {str(e)}, user={_user_label(user)}, "
+                    f"session={session_id}, msg_len={len(message)}")
+        yield {'type': 'error', 'status': 500, 'session_id': session_id, **_critical_error_payload(e)}
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+from functools import wraps
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+from .models import Video, Favorite, ChatMessage
+from . import catalog_cache, progress_counters
+
+logger = logging.getLogger(__name__)
+
+
+def _safe(func):
+    """Ошибка при вычислении валидатора не должна ломать сам запрос"""
+    @wraps(func)
+    def inner(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        try:
+            return func(request, *args, **kwargs)
+        except Exception as e:
+            logger.warning(f"Не удалось вычислить валидатор для {request.path}: {e}")
+            return None
+    return inner
+
+
+def _digest(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def revalidate(etag_func=None, last_modified_func=None, private=False):
+    """Условный GET: 304 без выполнения view, если у клиента актуальные данные
+
+    Ставится под @api_view / на метод get: DRF сначала выполняет аутентификацию
+    и троттлинг, а при совпадении валидаторов уже не выполняются ни запросы, ни
+    сериализация. Ответы помечаются no-cache, чтобы браузер всегда
+    переспрашивал сервер с If-None-Match.
+    """
+    def decorator(view_func):
+        conditional_view = condition(
+            etag_func=_safe(etag_func) if etag_func else None,
+            last_modified_func=_safe(last_modified_func) if last_modified_func else None
+        )(view_func)
+
+        @wraps(view_func)
+        def inner(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+                if private:
+                    patch_cache_control(response, no_cache=True, private=True)
+                    patch_vary_headers(response, ('Cookie',))
+                else:
+                    patch_cache_control(response, no_cache=True)
+            return response
+        return inner
+    return decorator
+
+
+# Каталог видео: валидаторы из версии каталога в Redis, без запросов к БД
+
+def _catalog_fallback():
+    return Video.objects.aggregate(count=Count('id'), last_modified=Max('updated_at'))
+
+
+def catalog_etag(request, *args, **kwargs):
+    try:
+        version = catalog_cache.get_version()
+    except Exception:
+        fallback = _catalog_fallback()
+        return _digest('catalog', fallback['count'], fallback['last_modified'])
+    return f"catalog-{version}"
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    try:
+        last_modified = catalog_cache.get_last_modified()
+    except Exception:
+        last_modified = None
+    if last_modified is None:
+        last_modified = _catalog_fallback()['last_modified']
+    return last_modified
+
+
+# Избранное: удаление из избранного не меняет максимальную дату, поэтому только ETag
+
+def favorites_etag(request):
+    if not request.user.is_authenticated:
+        return "favorites-anonymous"
+    favorites = Favorite.objects.filter(user=request.user).aggregate(
+        count=Count('id'),
+        last_added=Max('created_at'),
+        max_id=Max('id')
+    )
+    return _digest(
+        'favorites', request.user.id, favorites['count'], favorites['last_added'],
+        favorites['max_id'], catalog_etag(request)
+    )
+
+
+# Прогресс: счетчики в Redis, хэшируем сами данные ответа
+
+def progress_etag(request):
+    if request.user.is_authenticated:
+        stats = progress_counters.get_category_stats(user=request.user)
+        return _digest('progress', request.user.id, json.dumps(stats, sort_keys=True))
+    watched_videos = sorted(request.GET.getlist('watched_videos'))
+    return _digest('progress-anonymous', catalog_etag(request), ','.join(watched_videos))
+
+
+# История чата: сообщения только добавляются или очищаются целиком
+
+def _chat_messages(request):
+    if request.user.is_authenticated:
+        return ChatMessage.objects.filter(user=request.user)
+    session_id = request.GET.get('session_id')
+    if session_id:
+        return ChatMessage.objects.filter(session_id=session_id)
+    return None
+
+
+def _chat_history_state(request):
+    # ETag и Last-Modified считаются по одному агрегату на запрос
+    if not hasattr(request, '_chat_history_state'):
+        messages = _chat_messages(request)
+        request._chat_history_state = None if messages is None else messages.aggregate(
+            count=Count('id'),
+            max_id=Max('id'),
+            last_modified=Max('created_at')
+        )
+    return request._chat_history_state
+
+
+def chat_history_etag(request):
+    state = _chat_history_state(request)
+    if state is None:
+        return "chat-history-empty"
+    owner = request.user.id if request.user.is_authenticated else request.GET.get('session_id')
+    return _digest('chat-history', owner, request.GET.urlencode(), state['count'], state['max_id'])
+
+
+def chat_history_last_modified(request):
+    state = _chat_history_state(request)
+    return state['last_modified'] if state else None
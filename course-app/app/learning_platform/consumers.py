@@ -1,15 +1,23 @@
+import asyncio
 import json
 import django
+from types import SimpleNamespace
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from asgiref.sync import sync_to_async
 from django.core.serializers import serialize
+from rest_framework.exceptions import NotFound
 
 # Ensure Django is set up
 if not django.apps.apps.ready:
     django.setup()
 
-from .models import Video, Category, UserProgress
-from .serializers import VideoSerializer
+from .models import Video, Category
+from .serializers import FastVideoSerializer, ChatRequestSerializer
+from . import chat_jobs, chat_service, progress_counters, video_snapshot
+from .pagination import KeysetPagination
+from .progress_service import CATEGORY_MAP
+from .video_snapshot import RECENT_VIDEOS_LIMIT
 
 
 class VideoConsumer(AsyncWebsocketConsumer):
@@ -29,19 +37,20 @@ class VideoConsumer(AsyncWebsocketConsumer):
         
         if message_type == 'request_videos':
             category = data.get('category')
-            await self.send_videos_by_category(category)
+            if 'cursor' in data or 'limit' in data:
+                await self.send_videos_page(category, data.get('cursor'), data.get('limit'))
+            else:
+                await self.send_videos_by_category(category)
         elif message_type == 'request_recent':
             await self.send_recent_videos()
 
     async def send_initial_data(self):
-        """Отправляем все начальные данные"""
-        # Отправляем последние видео
-        await self.send_recent_videos()
-        
-        # Отправляем видео по категориям
-        categories = ['html', 'js', 'php', 'wordpress']
-        for category in categories:
-            await self.send_videos_by_category(category)
+        """Отправляем все начальные данные одним сообщением
+
+        Кадр общий для всех подключений и уже закодирован - уходит как есть,
+        в бинарном виде (см. video_snapshot).
+        """
+        await self.send(bytes_data=await video_snapshot.get_initial_frame())
 
     async def send_recent_videos(self):
         """Отправляем последние видео"""
@@ -60,34 +69,45 @@ class VideoConsumer(AsyncWebsocketConsumer):
             'videos': videos
         }))
 
-    @database_sync_to_async
-    def get_recent_videos(self):
+    async def send_videos_page(self, category, cursor=None, limit=None):
+        """Отправляем страницу видео по категории (пагинация по курсору)"""
+        try:
+            videos, next_cursor = await self.get_videos_page(category, cursor, limit)
+        except NotFound:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': KeysetPagination.invalid_cursor_message
+            }))
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'category_videos',
+            'category': category,
+            'videos': videos,
+            'cursor': cursor,
+            'next_cursor': next_cursor
+        }))
+
+    async def get_recent_videos(self):
         """Получаем последние видео из БД"""
-        videos = Video.objects.filter(is_published=True).order_by('-created_at')[:10]
-        serializer = VideoSerializer(videos, many=True)
-        return serializer.data
+        videos = Video.objects.catalog().values(*FastVideoSerializer.values_fields)[:RECENT_VIDEOS_LIMIT]
+        return FastVideoSerializer([row async for row in videos], many=True).data
 
-    @database_sync_to_async
-    def get_videos_by_category(self, category):
+    async def get_videos_by_category(self, category):
         """Получаем видео по категории"""
-        category_map = {
-            'html': 'html_css',
-            'js': 'javascript', 
-            'php': 'php',
-            'wordpress': 'wordpress'
-        }
-        
-        if category not in category_map:
+        if category not in CATEGORY_MAP:
             return []
         
-        db_category = category_map[category]
-        videos = Video.objects.filter(
-            category__name=db_category,
-            is_published=True
-        ).order_by('-created_at')
+        videos = Video.objects.catalog(CATEGORY_MAP[category]).values(*FastVideoSerializer.values_fields)
+        return FastVideoSerializer([row async for row in videos], many=True).data
+
+    async def get_videos_page(self, category, cursor=None, limit=None):
+        """Получаем страницу видео по категории"""
+        if category not in CATEGORY_MAP:
+            return [], None
         
-        serializer = VideoSerializer(videos, many=True)
-        return serializer.data
+        videos = Video.objects.catalog(CATEGORY_MAP[category]).values(*FastVideoSerializer.values_fields)
+        page, next_cursor = await KeysetPagination().apaginate(videos, cursor=cursor, limit=limit)
+        return FastVideoSerializer(page, many=True).data, next_cursor
 
     # Методы для получения сообщений от group
     async def video_added(self, event):
@@ -149,43 +169,11 @@ class ProgressConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def get_user_progress(self):
-        """Получаем прогресс пользователя из БД"""
+        """Получаем прогресс пользователя из счетчиков в Redis"""
         if not self.user.is_authenticated:
             return {}
-            
-        progress_data = {}
-        categories = ['html_css', 'javascript', 'php', 'wordpress']
-        category_mapping = {
-            'html_css': 'html',
-            'javascript': 'js', 
-            'php': 'php',
-            'wordpress': 'wordpress'
-        }
         
-        for db_category in categories:
-            api_key = category_mapping[db_category]
-            
-            # Получаем все видео в категории
-            total_videos = Video.objects.filter(
-                category__name=db_category,
-                is_published=True
-            ).count()
-            
-            if total_videos > 0:
-                # Получаем просмотренные видео пользователем
-                watched_videos = UserProgress.objects.filter(
-                    user=self.user,
-                    video__category__name=db_category,
-                    video__is_published=True,
-                    completed=True
-                ).count()
-                
-                progress_percentage = int((watched_videos / total_videos) * 100)
-                progress_data[api_key] = progress_percentage
-            else:
-                progress_data[api_key] = 0
-        
-        return progress_data
+        return progress_counters.get_user_progress(user=self.user)
 
     # Методы для получения сообщений от group
     async def progress_updated(self, event):
@@ -194,3 +182,120 @@ class ProgressConsumer(AsyncWebsocketConsumer):
             'type': 'progress_updated',
             'progress': event['progress']
         }))
+
+
+class ChatConsumer(AsyncWebsocketConsumer):
+    """Потоковый чат с GPT: фрагменты ответа отправляются по мере генерации"""
+
+    async def connect(self):
+        self.user = self.scope["user"]
+        self.stream_task = None
+        self.job_groups = set()
+        self.delivered_jobs = set()
+        if self.user.is_authenticated:
+            # Результаты задач из очереди (async_mode) приходят во все сокеты пользователя
+            await self.channel_layer.group_add(chat_jobs.user_group(self.user.id), self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        # Клиент ушел - не ждем провайдера впустую
+        if self.stream_task and not self.stream_task.done():
+            self.stream_task.cancel()
+        if self.user.is_authenticated:
+            await self.channel_layer.group_discard(chat_jobs.user_group(self.user.id), self.channel_name)
+        for group in self.job_groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            await self.send_error(400, 'Invalid JSON')
+            return
+
+        if data.get('type') == 'subscribe_job':
+            await self.subscribe_job(str(data.get('job_id', '')), data.get('session_id'))
+            return
+
+        if data.get('type') != 'chat_message':
+            return
+
+        if self.stream_task and not self.stream_task.done():
+            await self.send_error(409, 'Предыдущий ответ еще генерируется')
+            return
+
+        serializer = ChatRequestSerializer(data=data)
+        if not serializer.is_valid():
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'status': 400,
+                'errors': serializer.errors
+            }, ensure_ascii=False))
+            return
+
+        wait = await self.throttle_wait()
+        if wait is not None:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'status': 429,
+                'error': 'Rate limit exceeded',
+                'retry_after': int(wait)
+            }))
+            return
+
+        # Отдельная задача: receive не блокируется, и поток можно отменить при отключении
+        self.stream_task = asyncio.create_task(self.stream_reply(
+            serializer.validated_data['message'],
+            serializer.validated_data.get('session_id')
+        ))
+
+    async def stream_reply(self, message, session_id):
+        async for event in chat_service.stream_message(self.user, message, session_id):
+            await self.send(text_data=json.dumps(event, ensure_ascii=False))
+
+    async def subscribe_job(self, job_id, session_id=None):
+        """Подписка на результат задачи; готовый результат отправляется сразу"""
+        get_job = sync_to_async(chat_jobs.get_job, thread_sensitive=False)
+        job = await get_job(job_id) if job_id else None
+        if job is None or not chat_jobs.can_access(job, self.user, session_id):
+            await self.send_error(404, 'Задача не найдена')
+            return
+
+        if job['user_id'] is None:
+            # Задачи пользователя и так приходят в его группу
+            group = chat_jobs.job_group(job_id)
+            await self.channel_layer.group_add(group, self.channel_name)
+            self.job_groups.add(group)
+            # Задача могла завершиться до подписки на группу
+            job = await get_job(job_id) or job
+        if job['status'] == chat_jobs.DONE:
+            await self.chat_job_result({'job': chat_jobs.public_state(job)})
+
+    async def chat_job_result(self, event):
+        """Результат задачи из очереди chat_worker"""
+        job_id = event['job']['job_id']
+        if job_id in self.delivered_jobs:
+            return
+        self.delivered_jobs.add(job_id)
+        group = chat_jobs.job_group(job_id)
+        if group in self.job_groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+            self.job_groups.discard(group)
+        await self.send(text_data=json.dumps({'type': 'job_result', **event['job']}, ensure_ascii=False))
+
+    async def send_error(self, status, message):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'status': status,
+            'message': message
+        }, ensure_ascii=False))
+
+    @database_sync_to_async
+    def throttle_wait(self):
+        """Те же лимиты, что и у HTTP-чата"""
+        client = self.scope.get('client') or ('', 0)
+        headers = dict(self.scope.get('headers', []))
+        meta = {'REMOTE_ADDR': client[0]}
+        if b'x-forwarded-for' in headers:
+            meta['HTTP_X_FORWARDED_FOR'] = headers[b'x-forwarded-for'].decode('latin-1')
+        return chat_service.throttle_wait(SimpleNamespace(user=self.user, META=meta))
@@ -1,63 +1,110 @@
-import g4f
 import asyncio
+import inspect
 import logging
 import random
+import re
+import threading
 import time
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from . import gpt_state, provider_health, provider_limits
+from .chat_context import estimate_tokens, MESSAGE_OVERHEAD_TOKENS
 
 logger = logging.getLogger(__name__)
 
+_g4f = None
+
+
+def _load_g4f():
+    """Ленивый импорт g4f: тяжелый пакет нужен только процессам, которые ведут чат
+
+    Миграции, populate_data и другие команды загружают views без чата.
+    """
+    global _g4f
+    if _g4f is None:
+        import g4f
+        _g4f = g4f
+    return _g4f
+
+# Разметка ответа (format_response): шаблоны компилируются один раз
+_FENCE = '```'
+_FENCE_LANGUAGE = re.compile(r'(\w+)\n')
+_LIST_ITEM = re.compile(r'\d+\.\s+|[-*+]\s+')
+_TITLE_KEYWORDS = re.compile(
+    'пример|example|результат|вывод|output|result|решение|ответ|объяснение|концепции|'
+    'моменты|использование|применение|как|что|зачем'
+)
+# Слова в КАПСЕ -> **жирный текст**; ключевые подписи -> **Подпись:** с новой строки
+_EMPHASIS = re.compile(r'\b(?P<caps>[А-ЯЁ]{3,})\b|\b(?P<label>Результат|Вывод|Output|Result|Пример|Example):\s*')
+_BLANK_LINES = re.compile(r'\n{3,}')
+
+
+def _emphasize(match):
+    if match.group('caps'):
+        return f"**{match.group('caps')}**"
+    return f"**{match.group('label')}:**\n"
+
+
+def _normalize_code_fences(text):
+    """Пары ``` с ровно одним переводом строки внутри ограждений
+
+    Язык после открывающего ``` (```python) остается на строке ограждения.
+    Непарное ``` в конце текста не меняется.
+    """
+    result = []
+    position = 0
+    while True:
+        opening = text.find(_FENCE, position)
+        if opening == -1:
+            break
+        start = opening + len(_FENCE)
+        language = ''
+        match = _FENCE_LANGUAGE.match(text, start)
+        if match:
+            language = match.group(1)
+            start = match.end()
+        elif text.startswith('\n', start):
+            start += 1
+        
+        closing = text.find(_FENCE, start)
+        if closing == -1:
+            break
+        end = closing - 1 if closing > start and text[closing - 1] == '\n' else closing
+        
+        result.append(text[position:opening])
+        result.append(f"{_FENCE}{language}\n{text[start:end]}\n{_FENCE}")
+        position = closing + len(_FENCE)
+    
+    result.append(text[position:])
+    return ''.join(result)
+
+
 class GPTService:
-    def get_all_providers(self) -> List[str]:
-        """Получить список всех провайдеров (по кругу, в правильном порядке)"""
-        # Возвращает список: быстрые + средние + медленные (без дубликатов, в порядке обхода)
-        seen = set()
-        ordered = []
-        for p in self.fast_providers + self.medium_providers + self.slow_providers:
-            if p not in seen:
-                ordered.append(p)
-                seen.add(p)
-        return ordered
     """Сервис для работы с GPT через библиотеку g4f"""
     
+    # Рабочие провайдеры g4f. Порядок - только начальный, пока о провайдере нет
+    # наблюдений: дальше порядок определяет provider_health по живой статистике
+    DEFAULT_PROVIDERS = [
+        'Chatai',
+        'AnyProvider',
+        'Blackbox',
+        'OpenAIFM',
+        'Qwen_Qwen_2_5_Max',
+        'OIVSCodeSer0501',
+        'WeWordle',
+        'CohereForAI_C4AI_Command',
+        'OIVSCodeSer2',
+        'Free2GPT',
+        'Qwen_Qwen_2_5',
+        'Yqcloud',
+        'ImageLabs',
+        'Qwen_Qwen_3',
+        'LambdaChat',
+        'BlackForestLabs_Flux1Dev',
+    ]
+    
     def __init__(self):
-        # ПРОВЕРЕННЫЕ РАБОЧИЕ ПРОВАЙДЕРЫ (протестировано 2025-07-05, 16 из 90)
-        
-        # Быстрые провайдеры (до 3 секунд)
-        self.fast_providers = [
-            'Chatai',             # 0.78с - самый быстрый
-            'AnyProvider',        # 0.98с - очень быстрый
-            'Blackbox',           # 2.14с - стабильный для кода
-            'OpenAIFM',           # 2.34с - быстрый
-            'Qwen_Qwen_2_5_Max',  # 2.46с - быстрый
-            'OIVSCodeSer0501',    # 2.53с - стабильный
-            'WeWordle',           # 2.54с - быстрый
-            'CohereForAI_C4AI_Command', # 2.58с - стабильный
-        ]
-        
-        # Средние провайдеры (3-6 секунд)
-        self.medium_providers = [
-            'OIVSCodeSer2',       # 4.76с - стабильный
-            'Free2GPT',           # 4.77с - бесплатный
-            'Qwen_Qwen_2_5',      # 5.25с - хороший
-            'Yqcloud',            # 5.64с - работает
-        ]
-        
-        # Медленные провайдеры (больше 6 секунд, но работают)
-        self.slow_providers = [
-            'ImageLabs',          # 8.27с - для изображений
-            'Qwen_Qwen_3',        # 15.45с - умный но медленный
-            'LambdaChat',         # 16.67с - с рассуждениями
-            'BlackForestLabs_Flux1Dev', # 23.02с - для изображений
-        ]
-        
-        # Основные рабочие провайдеры (быстрые + средние)
-        self.working_providers = self.fast_providers + self.medium_providers
-        
-        # Резервные провайдеры (медленные, но работают)
-        self.backup_providers = self.slow_providers
-        
         # Нерабочие провайдеры (для справки)
         self.blocked_providers = [
             'You',                # Заблокирован Cloudflare
@@ -71,151 +118,335 @@ class GPTService:
             'HuggingFace',        # Требует API key
         ]
         
-        self.current_provider = 'Chatai'  # Самый быстрый
-        self.default_model = g4f.models.default
+        # Текущий провайдер, выбранный вручную, флаг прокси, порядок провайдеров и
+        # счетчики успехов общие для всех воркеров - см. свойства ниже
+        self._state = gpt_state.SharedState({
+            'current_provider': 'Chatai',
+            # Провайдер, выбранный вручную, пробуется первым (если его автомат не открыт)
+            'preferred_provider': None,
+            'use_proxy': False,  # Прямое соединение работает лучше
+            'providers': list(self.DEFAULT_PROVIDERS),
+        })
         
         # Настройки прокси - отключаем по умолчанию
         self.proxy = "http://95.164.200.12:9459"
-        self.use_proxy = False  # Прямое соединение работает лучше
-        
-        # Статистика провайдеров
-        self.provider_stats = {}
         self.max_retries = 3
         
+        # Классы провайдеров g4f по имени (None - провайдера нет в установленной версии)
+        self._resolved_providers = {}
+        
+    @property
+    def default_model(self):
+        return _load_g4f().models.default
+    
+    @property
+    def providers(self) -> List[str]:
+        return list(self._state.get()['providers'])
+    
+    @providers.setter
+    def providers(self, value: List[str]):
+        self._state.update(providers=list(value))
+    
+    @property
+    def current_provider(self) -> str:
+        return self._state.get()['current_provider']
+    
+    @current_provider.setter
+    def current_provider(self, value: str):
+        self._state.update(current_provider=value)
+    
+    @property
+    def preferred_provider(self) -> Optional[str]:
+        return self._state.get()['preferred_provider']
+    
+    @preferred_provider.setter
+    def preferred_provider(self, value: Optional[str]):
+        self._state.update(preferred_provider=value)
+    
+    @property
+    def use_proxy(self) -> bool:
+        return self._state.get()['use_proxy']
+    
+    @use_proxy.setter
+    def use_proxy(self, value: bool):
+        self._state.update(use_proxy=bool(value))
+    
+    @property
+    def provider_stats(self) -> Dict[str, int]:
+        """Успешные ответы по провайдерам во всех воркерах"""
+        return self._state.stats()
+    
     def get_all_providers(self) -> List[str]:
         """Получить все провайдеры"""
-        return self.working_providers + self.backup_providers
+        return list(self.providers)
         
-    def trim_history(self, history: list, max_length: int = 50000) -> list:
-        """Обрезка истории разговора - МИНИМАЛЬНАЯ обрезка только при критической длине"""
+    def trim_history(self, history: list, max_tokens: int = None) -> list:
+        """Обрезка сообщений g4f по бюджету токенов
+
+        Удаляются самые старые сообщения разговора; системные сообщения в начале
+        (краткое содержание) и последнее сообщение пользователя сохраняются.
+        """
         if not history:
             return history
-            
-        # Увеличиваем лимиты во много раз!
-        if len(history) > 100:  # Максимум 100 сообщений в истории (было 6)
-            history = history[-100:]
-        
-        # Проверяем общую длину - критический лимит
-        current_length = sum(len(str(message.get("content", ""))) for message in history)
-        
-        # Только если КРИТИЧЕСКИ длинно, удаляем старые сообщения
-        while history and current_length > max_length:
-            removed_message = history.pop(0)
-            current_length -= len(str(removed_message.get("content", "")))
-        
-        # НЕ ограничиваем длину отдельных сообщений!
-        # for message in history:
-        #     content = str(message.get("content", ""))
-        #     if len(content) > 800:
-        #         message["content"] = content[:800] + "..."
-                
-        return history
+        if max_tokens is None:
+            max_tokens = getattr(settings, 'CHAT_CONTEXT_TOKEN_BUDGET', 3000)
+
+        head = [msg for msg in history[:-1] if msg.get("role") == "system"]
+        middle = [msg for msg in history[:-1] if msg.get("role") != "system"]
+        current_tokens = sum(
+            estimate_tokens(msg.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for msg in middle
+        )
+
+        while middle and current_tokens > max_tokens:
+            removed_message = middle.pop(0)
+            current_tokens -= estimate_tokens(removed_message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+        return head + middle + history[-1:]
     
-    async def get_response_async(self, message: str, conversation_history: list = None) -> Dict[str, Any]:
-        """Асинхронное получение ответа от GPT с множественными попытками"""
-        # Подготавливаем историю разговора
+    def _build_chat_history(self, message: str, conversation_history: list = None, summary: str = None) -> list:
+        """История разговора в формате сообщений g4f + текущее сообщение
+
+        conversation_history - уже отобранные последние ходы (chat_context.build_context),
+        summary - краткое содержание более ранних ходов.
+        """
         chat_history = []
+
+        if summary:
+            chat_history.append({
+                "role": "system",
+                "content": f"Краткое содержание предыдущей части разговора:\n{summary}"
+            })
         
-        # Добавляем ВСЮ историю разговора (БЕЗ ОГРАНИЧЕНИЙ!)
         if conversation_history:
-            # Берем ВСЕ сообщения из истории
             for msg in conversation_history:  
                 if msg.get("message"):
-                    user_content = str(msg.get("message", ""))
-                    # НЕ ограничиваем длину - используем как есть!
-                    chat_history.append({"role": "user", "content": user_content})
+                    chat_history.append({"role": "user", "content": str(msg.get("message", ""))})
                 
                 if msg.get("response"):
-                    ai_content = str(msg.get("response", ""))
-                    # НЕ ограничиваем длину - используем как есть!
-                    chat_history.append({"role": "assistant", "content": ai_content})
+                    chat_history.append({"role": "assistant", "content": str(msg.get("response", ""))})
         
-        # Добавляем текущее сообщение (БЕЗ ОГРАНИЧЕНИЙ!)
         chat_history.append({"role": "user", "content": str(message)})
         
-        # НЕ обрезаем историю - используем всю как есть!
-        # chat_history = self.trim_history(chat_history, max_length=1500)
+        # Страховка для вызовов с полной историей (get_response_sync и т.п.)
+        return self.trim_history(chat_history)
+    
+    async def _load_state(self) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        """Общее состояние сервиса и здоровье провайдеров для одного запроса
+
+        Оба читаются из Redis вне цикла событий; дальше запрос работает только
+        с этими копиями и к свойствам providers/use_proxy не обращается.
+        """
+        def load():
+            state = self._state.get()
+            return state, provider_health.get_snapshot(state['providers'])
+        return await sync_to_async(load, thread_sensitive=False)()
+    
+    async def _record_success(self, provider_name: str):
+        await sync_to_async(self._state.record_success, thread_sensitive=False)(provider_name)
+    
+    def _providers_to_try(self, state: Dict[str, Any], snapshot: Dict[str, Dict[str, Any]]) -> List[str]:
+        """Провайдеры по ожидаемому времени до успешного ответа, несколько кругов"""
+        ordered = provider_health.order_providers(state['providers'], snapshot)
+        
+        # Выбранный вручную провайдер - первым
+        preferred = state['preferred_provider']
+        if preferred in ordered:
+            ordered.remove(preferred)
+            ordered.insert(0, preferred)
+        
+        # Повторные круги: провайдер с единичной ошибкой может ответить со второй попытки,
+        # а провайдеры с открытым автоматом отсеиваются при запуске
+        max_cycles = 3  # Максимум 3 полных круга по всем провайдерам
+        return (ordered * max_cycles)[:30]  # Максимум 30 попыток
+    
+    def _latency_budget(self, provider_name: str, snapshot: Dict[str, Dict[str, Any]]) -> float:
+        """Сколько ждать провайдера, прежде чем параллельно запустить следующего
+
+        Бюджет - медиана (p50) времени ответа провайдера по гистограмме с запасом.
+        """
+        health = snapshot.get(provider_name)
+        if not health or health['p50'] is None:
+            return getattr(settings, 'GPT_HEDGE_DEFAULT_BUDGET', 8.0)
+        budget = health['p50'] * getattr(settings, 'GPT_HEDGE_P50_MULTIPLIER', 1.5)
+        return max(budget, getattr(settings, 'GPT_HEDGE_MIN_BUDGET', 1.0))
+    
+    async def _acquire_provider(self, provider_name: str, snapshot: Dict[str, Dict[str, Any]]) -> bool:
+        """Пропускает ли автомат провайдера запрос прямо сейчас"""
+        health = snapshot.get(provider_name)
+        if not health or health['state'] == provider_health.CLOSED:
+            return True
+        return await sync_to_async(provider_health.acquire, thread_sensitive=False)(provider_name, health)
+    
+    async def _record_outcome(self, provider_name: str, outcome: str, latency: float, snapshot: Dict[str, Dict[str, Any]]):
+        await sync_to_async(provider_health.record, thread_sensitive=False)(
+            provider_name, outcome, latency, snapshot.get(provider_name)
+        )
+    
+    async def _release_provider(self, provider_name: str, snapshot: Dict[str, Dict[str, Any]]):
+        """Попытка не дошла до провайдера - вернуть пробный запрос полуоткрытого автомата"""
+        if snapshot.get(provider_name, {}).get('trial_token'):
+            await sync_to_async(provider_health.release, thread_sensitive=False)(provider_name, snapshot[provider_name])
+    
+    def _classify_error(self, provider_name: str, error: Exception) -> str:
+        """Исход неудачной попытки для provider_health (с логированием причины)"""
+        if isinstance(error, asyncio.TimeoutError):
+            logger.warning(f"[TIMEOUT] {provider_name}: превышен таймаут")
+            return provider_health.FAILURE
+        if isinstance(error, ConnectionError):
+            logger.warning(f"[CONNECTION] {provider_name}: ошибка соединения - {str(error)}")
+            return provider_health.FAILURE
+        
+        error_msg = str(error) or error.__class__.__name__
+        if "proxy" in error_msg.lower():
+            logger.warning(f"[PROXY] {provider_name}: проблема с прокси - {error_msg}")
+        elif "connection" in error_msg.lower() or "network" in error_msg.lower():
+            logger.warning(f"[CONNECTION] {provider_name}: проблема соединения - {error_msg}")
+        elif "rate" in error_msg.lower() or "limit" in error_msg.lower() or "429" in error_msg:
+            logger.warning(f"[RATE_LIMIT] {provider_name}: превышен лимит запросов - {error_msg}")
+            return provider_health.RATE_LIMITED
+        elif "block" in error_msg.lower() or "forbidden" in error_msg.lower():
+            logger.warning(f"[BLOCKED] {provider_name}: заблокирован - {error_msg}")
+        elif "available in" in error_msg.lower():
+            logger.warning(f"[RATE_LIMIT] {provider_name}: провайдер временно недоступен - {error_msg}")
+            return provider_health.RATE_LIMITED
+        else:
+            logger.warning(f"[ERROR] {provider_name}: {error_msg}")
+        return provider_health.FAILURE
+    
+    def _create_completion(self, request_kwargs: Dict[str, Any]):
+        """Вызов g4f (в бенчмарке подменяется имитацией провайдеров)"""
+        return _load_g4f().ChatCompletion.create_async(**request_kwargs)
+    
+    async def _request_provider(self, provider_name: str, attempt: int, chat_history: list,
+                                use_proxy: bool = False) -> Dict[str, Any]:
+        """Одна попытка запроса к провайдеру
+
+        Возвращает {"status": исход из provider_health, "response_time": ...}; ошибки
+        не пробрасываются, чтобы параллельные попытки не мешали друг другу.
+        """
+        provider = self._get_provider_by_name(provider_name)
+        if not provider:
+            logger.warning(f"[ERROR] Провайдер {provider_name} не найден в g4f")
+            return {"status": provider_health.FAILURE, "response_time": 0}
+        
+        # Подготавливаем параметры запроса
+        request_kwargs = {
+            "model": self.default_model,
+            "messages": chat_history,
+            "provider": provider,
+            "timeout": getattr(settings, 'GPT_PROVIDER_TIMEOUT', 120),  # 2 минуты по умолчанию
+        }
         
-        # Создаем циклический список провайдеров
-        all_providers = self.fast_providers + self.medium_providers + self.backup_providers
+        # Добавляем прокси только если включен и попытка > 2
+        if use_proxy and self.proxy and attempt > 2:
+            request_kwargs["proxy"] = self.proxy
+            logger.info(f"[PROXY] Используем прокси: {self.proxy}")
+        else:
+            logger.info(f"[DIRECT] Прямое соединение (без прокси)")
         
-        # Начинаем с текущего провайдера, затем идем по кругу
-        current_index = 0
-        if self.current_provider in all_providers:
-            current_index = all_providers.index(self.current_provider)
+        try:
+            async with provider_limits.slot(provider_name):
+                start_time = time.time()
+                try:
+                    response = await self._create_completion(request_kwargs)
+                except Exception as e:
+                    return {
+                        "status": self._classify_error(provider_name, e),
+                        "response_time": round(time.time() - start_time, 2)
+                    }
+                response_time = round(time.time() - start_time, 2)
+        except provider_limits.ProviderBusy as e:
+            logger.warning(f"[BUSY] {e} - переходим к следующему провайдеру")
+            return {"status": provider_limits.BUSY, "response_time": 0}
         
-        # Создаем циклический список провайдеров (можем пройти несколько кругов)
-        providers_to_try = []
-        max_cycles = 3  # Максимум 3 полных круга по всем провайдерам
-        total_providers = len(all_providers)
+        # Проверяем ответ
+        if not response or not str(response).strip():
+            logger.warning(f"[WARNING] {provider_name} вернул пустой ответ")
+            return {"status": provider_health.FAILURE, "response_time": response_time}
         
-        for cycle in range(max_cycles):
-            for i in range(total_providers):
-                provider_index = (current_index + i) % total_providers
-                provider = all_providers[provider_index]
-                
-                # Если это первый цикл, добавляем всех провайдеров
-                # Если не первый цикл, добавляем только если провайдер еще не пробовался в этой сессии
-                if cycle == 0 or provider not in [p for p in providers_to_try[:total_providers]]:
-                    providers_to_try.append(provider)
+        return {
+            "status": provider_health.SUCCESS,
+            "response_text": str(response).strip(),
+            "response_time": response_time
+        }
+    
+    async def get_response_async(self, message: str, conversation_history: list = None, summary: str = None) -> Dict[str, Any]:
+        """Асинхронное получение ответа от GPT с множественными попытками
+
+        Запросы хеджируются: если провайдер не ответил за свой бюджет (p50 с запасом),
+        параллельно запускается следующий. Берется первый непустой ответ, остальные
+        запросы отменяются. Одновременно выполняется не больше GPT_HEDGE_MAX_IN_FLIGHT.
+        """
+        # Подготавливаем историю разговора
+        chat_history = self._build_chat_history(message, conversation_history, summary)
         
-        # Ограничиваем общее количество попыток
-        providers_to_try = providers_to_try[:30]  # Максимум 30 попыток
+        state, snapshot = await self._load_state()
+        providers_to_try = self._providers_to_try(state, snapshot)
         
         logger.info(f"[START] Начинаем обработку сообщения: '{message[:50]}...'")
         logger.info(f"[HISTORY] История содержит {len(chat_history)} сообщений")
-        logger.info(f"[PROVIDERS] Будем пробовать {len(providers_to_try)} провайдеров циклически")
+        logger.info(f"[PROVIDERS] Будем пробовать {len(providers_to_try)} попыток, порядок: {', '.join(providers_to_try[:5])}...")
         
-        rate_limited_providers = set()  # Отслеживаем провайдеров с rate limit
-        total_providers = len(all_providers)
+        rate_limited_count = 0
+        busy_count = 0
+        reached_count = 0  # попытки, дошедшие до провайдера
+        max_in_flight = max(1, getattr(settings, 'GPT_HEDGE_MAX_IN_FLIGHT', 2))
         
-        for attempt, provider_name in enumerate(providers_to_try):
-            try:
-                # Если прошли полный круг по всем провайдерам, сбрасываем rate limit список
-                if attempt > 0 and attempt % total_providers == 0:
-                    logger.info(f"[RESET] Прошли полный круг, сбрасываем rate limit список")
-                    rate_limited_providers.clear()
-                
-                # Пропускаем провайдеров, которые недавно показали rate limit
-                if provider_name in rate_limited_providers:
-                    logger.info(f"[SKIP] Пропускаем {provider_name} - недавно был rate limit")
+        candidates = iter(enumerate(providers_to_try))
+        in_flight = {}  # задача -> (номер попытки, провайдер)
+        
+        async def launch_next() -> bool:
+            for attempt, provider_name in candidates:
+                # Провайдер со второго круга может еще выполнять запрос с первого
+                if any(name == provider_name for _, name in in_flight.values()):
                     continue
-                    
-                logger.info(f"[ATTEMPT] Попытка {attempt + 1}/{len(providers_to_try)}: {provider_name}")
                 
-                # Получаем провайдера
-                provider = self._get_provider_by_name(provider_name)
-                if not provider:
-                    logger.warning(f"[ERROR] Провайдер {provider_name} не найден в g4f")
+                # Автомат мог открыться уже во время этого запроса (общий для всех воркеров)
+                if not await self._acquire_provider(provider_name, snapshot):
+                    logger.info(f"[SKIP] Пропускаем {provider_name} - автомат открыт")
                     continue
                 
-                # Подготавливаем параметры запроса
-                request_kwargs = {
-                    "model": g4f.models.default,
-                    "messages": chat_history,
-                    "provider": provider,
-                    "timeout": 120,  # Увеличиваем таймаут до 2 минут!
-                }
-                
-                # Добавляем прокси только если включен и попытка > 2
-                if self.use_proxy and self.proxy and attempt > 2:
-                    request_kwargs["proxy"] = self.proxy
-                    logger.info(f"[PROXY] Используем прокси: {self.proxy}")
-                else:
-                    logger.info(f"[DIRECT] Прямое соединение (без прокси)")
-                
-                # Засекаем время
-                start_time = time.time()
+                logger.info(f"[ATTEMPT] Попытка {attempt + 1}/{len(providers_to_try)}: {provider_name}")
+                task = asyncio.ensure_future(self._request_provider(provider_name, attempt, chat_history, state['use_proxy']))
+                in_flight[task] = (attempt, provider_name)
+                return True
+            return False
+        
+        has_candidates = await launch_next()
+        try:
+            while in_flight:
+                # Бюджет отсчитывается от последнего запущенного провайдера
+                timeout = None
+                if has_candidates and len(in_flight) < max_in_flight:
+                    _, newest_provider = max(in_flight.values())
+                    timeout = self._latency_budget(newest_provider, snapshot)
                 
-                # Делаем запрос как в примере
-                response = await g4f.ChatCompletion.create_async(**request_kwargs)
+                done, _ = await asyncio.wait(in_flight, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
                 
-                end_time = time.time()
-                response_time = round(end_time - start_time, 2)
+                if not done:
+                    logger.info(f"[HEDGE] {newest_provider} не ответил за {timeout:.1f}с - запускаем следующего параллельно")
+                    has_candidates = await launch_next()
+                    continue
                 
-                # Проверяем ответ
-                if response and len(str(response).strip()) > 0:
-                    response_text = str(response).strip()
+                for task in done:
+                    attempt, provider_name = in_flight.pop(task)
+                    result = task.result()
+                    if result["status"] == provider_limits.BUSY:
+                        # Провайдер не вызывался - его здоровье не меняется
+                        busy_count += 1
+                        await self._release_provider(provider_name, snapshot)
+                        continue
+                    reached_count += 1
+                    await self._record_outcome(provider_name, result["status"], result["response_time"], snapshot)
+                    
+                    if result["status"] == provider_health.RATE_LIMITED:
+                        # НЕ делаем паузу - сразу переходим к следующему провайдеру
+                        rate_limited_count += 1
+                    if result["status"] != provider_health.SUCCESS:
+                        continue
+                    
+                    response_text = result["response_text"]
+                    response_time = result["response_time"]
                     
                     # Применяем форматирование как в ChatGPT
                     formatted_response = self.format_response(response_text)
@@ -223,8 +454,7 @@ class GPTService:
                     logger.info(f"[SUCCESS] Успех! Провайдер: {provider_name}, время: {response_time}с")
                     
                     # Обновляем статистику
-                    self.provider_stats[provider_name] = self.provider_stats.get(provider_name, 0) + 1
-                    self.current_provider = provider_name
+                    await self._record_success(provider_name)
                     
                     return {
                         "success": True,
@@ -234,77 +464,252 @@ class GPTService:
                         "provider_used": provider_name,
                         "attempt_number": attempt + 1,
                         "response_time": response_time,
-                        "proxy_used": self.use_proxy,
+                        "proxy_used": state['use_proxy'],
                         "message_length": len(message),
                         "history_length": len(chat_history)
                     }
-                else:
-                    logger.warning(f"[WARNING] {provider_name} вернул пустой ответ")
-                    
-            except asyncio.TimeoutError:
-                logger.warning(f"[TIMEOUT] {provider_name}: превышен таймаут")
+                
+                # Все выполнявшиеся попытки неудачны - сразу пробуем следующего
+                if not in_flight and has_candidates:
+                    has_candidates = await launch_next()
+        finally:
+            # Первый ответ получен (или запрос отменен) - остальные запросы не нужны
+            for task in in_flight:
+                task.cancel()
+            # Отмененная попытка не запишет исход - пробный запрос автомата освобождаем сами,
+            # иначе провайдер не восстановится до истечения ключа пробы
+            for _, provider_name in in_flight.values():
+                await self._release_provider(provider_name, snapshot)
+        
+        if busy_count and not reached_count:
+            return self._overloaded_response(busy_count)
+        
+        # Если все провайдеры не сработали
+        logger.error(f"[FAILED] Все провайдеры недоступны! Попробовано: {len(providers_to_try)}, rate limited: {rate_limited_count}")
+        
+        return {
+            "success": False,
+            "error": "Все провайдеры недоступны",
+            "response": "Извините, сейчас все AI провайдеры недоступны. Попробуйте позже или проверьте подключение к интернету.",
+            "total_attempts": len(providers_to_try),
+            "rate_limited_count": rate_limited_count,
+            "provider_stats": await sync_to_async(self._state.stats, thread_sensitive=False)()
+        }
+    
+    def _overloaded_response(self, busy_count: int) -> Dict[str, Any]:
+        """Все провайдеры заняты запросами этого процесса - быстрый отказ вместо ожидания"""
+        logger.warning(f"[OVERLOADED] Очереди ко всем провайдерам заполнены ({busy_count})")
+        return {
+            "success": False,
+            "overloaded": True,
+            "error": "Провайдеры перегружены",
+            "response": "Сейчас слишком много запросов. Попробуйте через несколько секунд.",
+            "total_attempts": busy_count,
+            "rate_limited_count": 0
+        }
+    
+    async def _stream_chunks(self, request_kwargs: Dict[str, Any]) -> AsyncIterator[str]:
+        """Текстовые фрагменты потоковой генерации g4f"""
+        response = self._create_completion(request_kwargs)
+        if inspect.isawaitable(response):
+            response = await response
+        
+        if isinstance(response, str):
+            # Провайдер без поддержки потока вернул ответ целиком
+            yield response
+            return
+        
+        async for chunk in response:
+            # Кроме текста g4f может отдавать служебные объекты (причина остановки и т.п.)
+            if isinstance(chunk, str) and chunk:
+                yield chunk
+    
+    async def stream_response_async(self, message: str, conversation_history: list = None, summary: str = None) -> AsyncIterator[Dict[str, Any]]:
+        """Потоковое получение ответа от GPT
+
+        Отдает события {"type": "delta", "content": ...} по мере генерации и в конце
+        {"type": "done", ...} с отформатированным ответом (поля как у get_response_async)
+        либо {"type": "error", ...}. На следующего провайдера переключаемся только
+        до первого фрагмента: после него клиент уже показывает текст.
+        """
+        chat_history = self._build_chat_history(message, conversation_history, summary)
+        
+        state, snapshot = await self._load_state()
+        providers_to_try = self._providers_to_try(state, snapshot)
+        rate_limited_count = 0
+        busy_count = 0
+        reached_count = 0
+        
+        logger.info(f"[STREAM] Потоковая обработка сообщения: '{message[:50]}...', история: {len(chat_history)}")
+        
+        for attempt, provider_name in enumerate(providers_to_try):
+            if not await self._acquire_provider(provider_name, snapshot):
                 continue
-            except ConnectionError as e:
-                logger.warning(f"[CONNECTION] {provider_name}: ошибка соединения - {str(e)}")
+            
+            provider = self._get_provider_by_name(provider_name)
+            if not provider:
+                logger.warning(f"[ERROR] Провайдер {provider_name} не найден в g4f")
+                await self._release_provider(provider_name, snapshot)
                 continue
-            except Exception as e:
-                error_msg = str(e)
-                if "proxy" in error_msg.lower():
-                    logger.warning(f"[PROXY] {provider_name}: проблема с прокси - {error_msg}")
-                elif "connection" in error_msg.lower() or "network" in error_msg.lower():
-                    logger.warning(f"[CONNECTION] {provider_name}: проблема соединения - {error_msg}")
-                elif "rate" in error_msg.lower() or "limit" in error_msg.lower() or "429" in error_msg:
-                    logger.warning(f"[RATE_LIMIT] {provider_name}: превышен лимит запросов - {error_msg}")
-                    # Добавляем провайдера в список с rate limit
-                    rate_limited_providers.add(provider_name)
-                    # НЕ делаем паузу - сразу переходим к следующему провайдеру
-                    continue
-                elif "block" in error_msg.lower() or "forbidden" in error_msg.lower():
-                    logger.warning(f"[BLOCKED] {provider_name}: заблокирован - {error_msg}")
-                elif "available in" in error_msg.lower():
-                    logger.warning(f"[RATE_LIMIT] {provider_name}: провайдер временно недоступен - {error_msg}")
-                    # Добавляем провайдера в список с rate limit
-                    rate_limited_providers.add(provider_name)
-                    # НЕ делаем паузу - сразу переходим к следующему провайдеру
-                    continue
-                else:
-                    logger.warning(f"[ERROR] {provider_name}: {error_msg}")
+            
+            request_kwargs = {
+                "model": self.default_model,
+                "messages": chat_history,
+                "provider": provider,
+                "stream": True,
+                "timeout": getattr(settings, 'GPT_PROVIDER_TIMEOUT', 120),
+            }
+            if state['use_proxy'] and self.proxy and attempt > 2:
+                request_kwargs["proxy"] = self.proxy
+            
+            chunks = []
+            error = None
+            
+            try:
+                async with provider_limits.slot(provider_name):
+                    start_time = time.time()
+                    try:
+                        async for chunk in self._stream_chunks(request_kwargs):
+                            if not chunks:
+                                logger.info(f"[FIRST_TOKEN] {provider_name}: первый фрагмент через {round(time.time() - start_time, 2)}с")
+                            chunks.append(chunk)
+                            yield {"type": "delta", "content": chunk}
+                    except Exception as e:
+                        error = e
+            except provider_limits.ProviderBusy as e:
+                logger.warning(f"[BUSY] {e} - переходим к следующему провайдеру")
+                busy_count += 1
+                await self._release_provider(provider_name, snapshot)
+                continue
+            reached_count += 1
+            
+            if error is not None:
+                outcome = self._classify_error(provider_name, error)
+                await self._record_outcome(provider_name, outcome, round(time.time() - start_time, 2), snapshot)
+                if chunks:
+                    # Часть ответа уже у клиента - начинать заново с другим провайдером нельзя
+                    error_msg = str(error) or error.__class__.__name__
+                    logger.warning(f"[STREAM] {provider_name}: поток прерван - {error_msg}")
+                    yield {
+                        "type": "error",
+                        "success": False,
+                        "error": error_msg,
+                        "response": "Ответ был прерван. Попробуйте еще раз.",
+                        "provider_used": provider_name
+                    }
+                    return
+                
+                if outcome == provider_health.RATE_LIMITED:
+                    rate_limited_count += 1
                 continue
             
-            # Минимальная пауза только для сетевых ошибок
-            if "connection" in str(e).lower() or "network" in str(e).lower():
-                await asyncio.sleep(0.1)  # Очень короткая пауза только для сетевых проблем
+            response_time = round(time.time() - start_time, 2)
+            response_text = "".join(chunks).strip()
+            if not response_text:
+                logger.warning(f"[WARNING] {provider_name} вернул пустой ответ")
+                await self._record_outcome(provider_name, provider_health.FAILURE, response_time, snapshot)
+                continue
+            
+            await self._record_outcome(provider_name, provider_health.SUCCESS, response_time, snapshot)
+            logger.info(f"[SUCCESS] Поток завершен! Провайдер: {provider_name}, время: {response_time}с")
+            
+            await self._record_success(provider_name)
+            
+            # Форматирование применяется один раз к полному тексту
+            yield {
+                "type": "done",
+                "success": True,
+                "response": self.format_response(response_text),
+                "raw_response": response_text,
+                "model_used": "gpt-3.5-turbo",
+                "provider_used": provider_name,
+                "attempt_number": attempt + 1,
+                "response_time": response_time,
+                "proxy_used": state['use_proxy'],
+                "message_length": len(message),
+                "history_length": len(chat_history)
+            }
+            return
         
-        # Если все провайдеры не сработали
-        logger.error(f"[FAILED] Все провайдеры недоступны! Попробовано: {len(providers_to_try)}, rate limited: {len(rate_limited_providers)}")
+        if busy_count and not reached_count:
+            yield {"type": "error", **self._overloaded_response(busy_count)}
+            return
         
-        return {
+        logger.error(f"[FAILED] Поток: все провайдеры недоступны! Попробовано: {len(providers_to_try)}")
+        yield {
+            "type": "error",
             "success": False,
             "error": "Все провайдеры недоступны",
             "response": "Извините, сейчас все AI провайдеры недоступны. Попробуйте позже или проверьте подключение к интернету.",
             "total_attempts": len(providers_to_try),
-            "rate_limited_count": len(rate_limited_providers),
-            "provider_stats": self.provider_stats
+            "rate_limited_count": rate_limited_count
         }
     
     def _get_provider_by_name(self, provider_name: str):
-        """Получить провайдера по имени"""
+        """Получить провайдера по имени (результат поиска кэшируется, включая отсутствие)"""
+        if provider_name in self._resolved_providers:
+            return self._resolved_providers[provider_name]
         try:
-            if hasattr(g4f.Provider, provider_name):
-                return getattr(g4f.Provider, provider_name)
-            return None
+            provider = getattr(_load_g4f().Provider, provider_name, None)
         except Exception as e:
             logger.error(f"Ошибка получения провайдера {provider_name}: {e}")
             return None
+        self._resolved_providers[provider_name] = provider
+        return provider
+    
+    def resolve_providers(self) -> Dict[str, bool]:
+        """Импортировать g4f и найти классы всех настроенных провайдеров"""
+        return {name: self._get_provider_by_name(name) is not None for name in self.providers}
+    
+    async def _probe_provider(self, provider_name: str, timeout: float) -> str:
+        start_time = time.time()
+        try:
+            result = await asyncio.wait_for(
+                self._request_provider(provider_name, 0, [{"role": "user", "content": "ping"}]),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            result = {"status": provider_health.FAILURE, "response_time": round(time.time() - start_time, 2)}
+            await self._record_outcome(provider_name, result["status"], result["response_time"], {})
+            return "timeout"
+        await self._record_outcome(provider_name, result["status"], result["response_time"], {})
+        return result["status"]
     
-    def get_response_sync(self, message: str, conversation_history: list = None) -> Dict[str, Any]:
+    async def warm_up(self, probe: bool = False, timeout: float = None) -> Dict[str, str]:
+        """Прогрев до первого запроса чата
+
+        Импортирует g4f и разрешает провайдеров в отдельном потоке. С probe
+        все доступные провайдеры параллельно получают короткий запрос (не дольше
+        timeout секунд); исходы записываются в provider_health, и первый чат
+        сразу начинает с живых провайдеров. Возвращает {провайдер: результат}.
+        """
+        started = time.time()
+        resolved = await sync_to_async(self.resolve_providers, thread_sensitive=False)()
+        results = {name: "resolved" if found else "missing" for name, found in resolved.items()}
+        
+        if probe:
+            if timeout is None:
+                timeout = getattr(settings, 'GPT_WARMUP_TIMEOUT', 10)
+            _, snapshot = await self._load_state()
+            names = [
+                name for name, found in resolved.items()
+                if found and not provider_health.is_open(snapshot.get(name))
+            ]
+            outcomes = await asyncio.gather(*(self._probe_provider(name, timeout) for name in names))
+            results.update(zip(names, outcomes))
+        
+        logger.info(f"[WARMUP] {sum(resolved.values())}/{len(resolved)} провайдеров найдено"
+                   f"{', проверка запросом' if probe else ''} за {round(time.time() - started, 2)}с")
+        return results
+    
+    def get_response_sync(self, message: str, conversation_history: list = None, summary: str = None) -> Dict[str, Any]:
         """Синхронное получение ответа от GPT"""
         try:
             # Простое выполнение асинхронной функции
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             try:
-                result = loop.run_until_complete(self.get_response_async(message, conversation_history))
+                result = loop.run_until_complete(self.get_response_async(message, conversation_history, summary))
                 return result
             finally:
                 loop.close()
@@ -328,9 +733,11 @@ class GPTService:
             "model": str(self.default_model),
             "proxy": self.proxy if self.use_proxy else None,
             "proxy_enabled": self.use_proxy,
-            "working_providers": len(self.working_providers),
-            "backup_providers": len(self.backup_providers),
+            "providers": len(self.providers),
+            "preferred": self.preferred_provider,
             "provider_stats": self.provider_stats,
+            "health": provider_health.get_snapshot(self.providers),
+            "queues": provider_limits.get_stats(),
             "all": self.get_all_providers(),
         }
     
@@ -343,89 +750,51 @@ class GPTService:
         return self.use_proxy
     
     def format_response(self, response_text: str) -> str:
-        """Форматирование ответа как в ChatGPT с markdown разметкой"""
+        """Форматирование ответа как в ChatGPT с markdown разметкой
+
+        Линейное время: ограждения кода нормализуются одним проходом, строки
+        размечаются за один проход, выделение - одним регулярным выражением
+        на участок вне кода. Образцы - format_response_golden.json.
+        """
         if not response_text:
             return response_text
-            
-        formatted_text = response_text
-        
-        # 1. Обрабатываем блоки кода (многострочные)
-        import re
-        
-        # Сначала блоки кода с языком
-        formatted_text = re.sub(r'```(\w+)\n(.*?)\n```', r'```\1\n\2\n```', formatted_text, flags=re.DOTALL)
-        # Потом блоки кода без языка
-        formatted_text = re.sub(r'```\n?(.*?)\n?```', r'```\n\1\n```', formatted_text, flags=re.DOTALL)
         
-        # 2. Инлайн код (только если не внутри блока кода)
-        def replace_inline_code(match):
-            code = match.group(1)
-            if '\n' not in code and len(code.strip()) < 100:
-                return f'`{code}`'
-            return match.group(0)
+        # 1. Блоки кода: ровно один перевод строки после открывающего и перед закрывающим ```
+        formatted_text = _normalize_code_fences(response_text)
         
-        # Применяем только вне блоков кода
-        parts = formatted_text.split('```')
-        for i in range(0, len(parts), 2):  # Только четные индексы (вне блоков кода)
-            parts[i] = re.sub(r'`([^`\n]+)`', replace_inline_code, parts[i])
-        formatted_text = '```'.join(parts)
-        
-        # 3. Обрабатываем строки по отдельности для заголовков и списков
+        # 2. Построчно: заголовки и элементы списков вне блоков кода
         lines = formatted_text.split('\n')
         formatted_lines = []
         in_code_block = False
         
-        for line in lines:
+        for index, line in enumerate(lines):
+            stripped = line.strip()
+            
             # Проверяем, находимся ли мы в блоке кода
-            if line.strip().startswith('```'):
+            if stripped.startswith('```'):
                 in_code_block = not in_code_block
                 formatted_lines.append(line)
                 continue
                 
-            if in_code_block:
+            if in_code_block or not stripped or stripped.startswith('#'):
                 formatted_lines.append(line)
                 continue
             
-            stripped = line.strip()
-            
             # Заголовки (строки заканчивающиеся двоеточием, которые выглядят как заголовки)
-            if (stripped.endswith(':') and 
-                len(stripped) < 80 and 
-                not stripped.startswith('#') and
-                len(stripped.split()) <= 8):
-                
-                # Проверяем, что это действительно заголовок
-                title_keywords = ['пример', 'example', 'результат', 'вывод', 'output', 'result',
-                                'решение', 'ответ', 'объяснение', 'концепции', 'моменты',
-                                'использование', 'применение', 'как', 'что', 'зачем']
-                
-                is_title = any(keyword in stripped.lower() for keyword in title_keywords)
-                
-                if is_title:
+            if stripped.endswith(':') and len(stripped) < 80 and len(stripped.split()) <= 8:
+                if _TITLE_KEYWORDS.search(stripped.lower()):
                     formatted_lines.append(f"## {stripped}")
                 else:
                     formatted_lines.append(line)
-            # Нумерованные списки
-            elif re.match(r'^\d+\.\s+', stripped):
+            # Нумерованные списки и списки с дефисами
+            elif _LIST_ITEM.match(stripped):
                 formatted_lines.append(line)
-            # Списки с дефисами
-            elif re.match(r'^[-\*\+]\s+', stripped):
-                formatted_lines.append(line)
-            # Обычные строки, которые могут быть элементами списка
-            elif (stripped and 
-                  not stripped.startswith('#') and
-                  len(stripped) < 200):
-                # Если предыдущая или следующая строка - элемент списка, делаем эту строку тоже элементом
+            # Обычные строки рядом с элементами списка тоже становятся элементами
+            elif len(stripped) < 200:
                 prev_line = formatted_lines[-1].strip() if formatted_lines else ""
-                next_idx = lines.index(line) + 1
-                next_line = lines[next_idx].strip() if next_idx < len(lines) else ""
+                next_line = lines[index + 1].strip() if index + 1 < len(lines) else ""
                 
-                is_list_context = (
-                    re.match(r'^\d+\.\s+', prev_line) or
-                    re.match(r'^[-\*\+]\s+', prev_line) or
-                    re.match(r'^\d+\.\s+', next_line) or
-                    re.match(r'^[-\*\+]\s+', next_line)
-                )
+                is_list_context = _LIST_ITEM.match(prev_line) or _LIST_ITEM.match(next_line)
                 
                 if is_list_context and len(stripped.split()) < 15:
                     formatted_lines.append(f"- {stripped}")
@@ -434,30 +803,21 @@ class GPTService:
             else:
                 formatted_lines.append(line)
         
-        formatted_text = '\n'.join(formatted_lines)
-        
-        # 4. Обрабатываем выделение важного текста (только вне блоков кода)
-        parts = formatted_text.split('```')
+        # 3. Выделение важного текста (только вне блоков кода)
+        parts = '\n'.join(formatted_lines).split('```')
         for i in range(0, len(parts), 2):  # Только четные индексы (вне блоков кода)
-            # Слова в КАПСЕ превращаем в **жирный текст**
-            parts[i] = re.sub(r'\b([А-ЯЁ]{3,})\b', r'**\1**', parts[i])
-            # Ключевые результаты
-            parts[i] = re.sub(r'\b(Результат|Вывод|Output|Result):\s*', r'**\1:**\n', parts[i])
-            parts[i] = re.sub(r'\b(Пример|Example):\s*', r'**\1:**\n', parts[i])
-        
+            parts[i] = _EMPHASIS.sub(_emphasize, parts[i])
         formatted_text = '```'.join(parts)
         
-        # 5. Убираем лишние пустые строки
-        formatted_text = re.sub(r'\n{3,}', '\n\n', formatted_text)
-        
-        return formatted_text.strip()
+        # 4. Убираем лишние пустые строки
+        return _BLANK_LINES.sub('\n\n', formatted_text).strip()
     
     def change_provider(self, provider_name: str) -> bool:
         """Изменить текущего провайдера"""
         try:
             all_providers = self.get_all_providers()
             if provider_name in all_providers:
-                self.current_provider = provider_name
+                self._state.update(current_provider=provider_name, preferred_provider=provider_name)
                 logger.info(f"Провайдер изменен на {provider_name}")
                 return True
             else:
@@ -470,8 +830,10 @@ class GPTService:
     def shuffle_fallback_providers(self):
         """Перемешать список запасных провайдеров"""
         try:
-            random.shuffle(self.working_providers)
-            random.shuffle(self.backup_providers)
+            # Порядок важен только для провайдеров без наблюдений
+            providers = self.providers
+            random.shuffle(providers)
+            self.providers = providers
             logger.info("Список провайдеров перемешан")
         except Exception as e:
             logger.error(f"Ошибка при перемешивании провайдеров: {e}")
@@ -479,17 +841,9 @@ class GPTService:
     def reset_to_recommended(self):
         """Сбросить провайдеры к рекомендуемым"""
         try:
-            self.current_provider = 'Chatai'  # Самый быстрый
-            # Восстанавливаем оригинальные списки
-            self.fast_providers = [
-                'Chatai', 'AnyProvider', 'Blackbox', 'OpenAIFM',
-                'Qwen_Qwen_2_5_Max', 'OIVSCodeSer0501', 'WeWordle',
-                'CohereForAI_C4AI_Command'
-            ]
-            self.medium_providers = [
-                'OIVSCodeSer2', 'Free2GPT', 'Qwen_Qwen_2_5', 'Yqcloud'
-            ]
-            self.working_providers = self.fast_providers + self.medium_providers
+            # Восстанавливаем исходный список и сбрасываем статистику и автоматы
+            self._state.reset()
+            provider_health.reset(self.providers)
             logger.info("Провайдеры сброшены к рекомендуемым")
         except Exception as e:
             logger.error(f"Ошибка при сбросе провайдеров: {e}")
@@ -498,9 +852,10 @@ class GPTService:
         """Переключиться на GPT-4 режим"""
         try:
             # Для GPT-4 используем более мощные провайдеры
-            self.current_provider = 'Blackbox'  # Хорош для сложных задач
+            state = {'current_provider': 'Blackbox', 'preferred_provider': 'Blackbox'}  # Хорош для сложных задач
             if use_vpn and self.proxy:
-                self.use_proxy = True
+                state['use_proxy'] = True
+            self._state.update(**state)
             logger.info("Переключено на GPT-4 режим")
         except Exception as e:
             logger.error(f"Ошибка при переключении на GPT-4: {e}")
@@ -508,11 +863,30 @@ class GPTService:
     def set_gpt35_mode(self):
         """Переключиться на GPT-3.5 режим"""
         try:
-            self.current_provider = 'Chatai'  # Быстрый провайдер
-            self.use_proxy = False  # Прямое соединение для скорости
+            self._state.update(
+                current_provider='Chatai',  # Быстрый провайдер
+                preferred_provider='Chatai',
+                use_proxy=False,  # Прямое соединение для скорости
+            )
             logger.info("Переключено на GPT-3.5 режим")
         except Exception as e:
             logger.error(f"Ошибка при переключении на GPT-3.5: {e}")
 
 # Создаем глобальный экземпляр сервиса
 gpt_service = GPTService()
+
+
+def start_background_warm_up():
+    """Прогрев gpt_service в фоновом потоке (при старте ASGI-сервера)
+
+    Старт сервера не ждет g4f; пробные запросы - только с GPT_WARMUP_PROBE.
+    """
+    def run():
+        try:
+            asyncio.run(gpt_service.warm_up(probe=getattr(settings, 'GPT_WARMUP_PROBE', False)))
+        except Exception as e:
+            logger.warning(f"[WARMUP] Прогрев не удался: {e}")
+    
+    thread = threading.Thread(target=run, name='gpt-warm-up', daemon=True)
+    thread.start()
+    return thread
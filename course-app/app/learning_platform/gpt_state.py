@@ -0,0 +1,162 @@
+import json
+import logging
+import threading
+import time
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# Ключи Redis (без KEY_PREFIX кэша - работаем с соединением напрямую)
+STATE_KEY = 'learning_platform:gpt:state'
+STATS_KEY = 'learning_platform:gpt:provider_stats'
+INVALIDATE_CHANNEL = 'learning_platform:gpt:state:invalidate'
+
+# Пауза перед повторной подпиской после обрыва соединения, секунды
+RESUBSCRIBE_DELAY = 5
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class SharedState:
+    """Настройки GPTService, общие для всех воркеров (хэш в Redis)
+
+    Чтение идет через локальный кэш на GPT_STATE_CACHE_TTL секунд. Каждое
+    изменение публикуется в канал, и фоновый подписчик в каждом процессе
+    сразу сбрасывает свой кэш. Без Redis состояние живет в памяти процесса.
+    """
+
+    def __init__(self, defaults):
+        self.defaults = dict(defaults)
+        # Последнее известное состояние; оно же запасное при недоступном Redis
+        self._local = dict(defaults)
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def _connection(self):
+        return get_redis_connection('default')
+
+    def get(self):
+        """Текущее состояние (не изменять - только через update)"""
+        self._ensure_listener()
+        if time.monotonic() - self._loaded_at < _setting('GPT_STATE_CACHE_TTL', 5):
+            return self._local
+
+        try:
+            raw = self._connection().hgetall(STATE_KEY)
+        except Exception as e:
+            logger.warning(f"Состояние GPT недоступно в Redis: {e}")
+            # Не обращаемся к Redis на каждом чтении, пока он недоступен
+            self._loaded_at = time.monotonic()
+            return self._local
+
+        state = dict(self.defaults)
+        for field, value in raw.items():
+            state[_decode(field)] = json.loads(value)
+        self._local = state
+        self._loaded_at = time.monotonic()
+        return state
+
+    def update(self, **fields):
+        """Изменить поля состояния во всех воркерах"""
+        self._local = {**self._local, **fields}
+        try:
+            pipe = self._connection().pipeline()
+            pipe.hset(STATE_KEY, mapping={field: json.dumps(value) for field, value in fields.items()})
+            pipe.publish(INVALIDATE_CHANNEL, ','.join(fields))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить состояние GPT в Redis: {e}")
+
+    def record_success(self, provider):
+        """Учесть успешный ответ: счетчик провайдера и текущий провайдер"""
+        changed = self.get().get('current_provider') != provider
+        if changed:
+            self._local = {**self._local, 'current_provider': provider}
+        try:
+            pipe = self._connection().pipeline()
+            pipe.hincrby(STATS_KEY, provider, 1)
+            if changed:
+                pipe.hset(STATE_KEY, 'current_provider', json.dumps(provider))
+                pipe.publish(INVALIDATE_CHANNEL, 'current_provider')
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить статистику провайдера {provider}: {e}")
+
+    def stats(self):
+        """Число успешных ответов по провайдерам (все воркеры)"""
+        try:
+            raw = self._connection().hgetall(STATS_KEY)
+        except Exception as e:
+            logger.warning(f"Статистика провайдеров недоступна в Redis: {e}")
+            return {}
+        return {_decode(provider): int(count) for provider, count in raw.items()}
+
+    def reset(self):
+        """Вернуть состояние по умолчанию и обнулить статистику"""
+        self._local = dict(self.defaults)
+        try:
+            pipe = self._connection().pipeline()
+            pipe.delete(STATE_KEY, STATS_KEY)
+            pipe.publish(INVALIDATE_CHANNEL, '*')
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Не удалось сбросить состояние GPT в Redis: {e}")
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+    def _ensure_listener(self):
+        if self._listener is not None or not _setting('GPT_STATE_PUBSUB', True):
+            return
+        with self._lock:
+            if self._listener is None:
+                # Поток создается при первом чтении - уже после fork воркера
+                self._listener = threading.Thread(target=self._listen, name='gpt-state-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._connection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATE_CHANNEL)
+                for _ in pubsub.listen():
+                    self.invalidate()
+            except Exception as e:
+                logger.warning(f"Подписка на изменения состояния GPT прервана: {e}")
+            # Пока подписки нет, изменения могли пройти мимо
+            self.invalidate()
+            time.sleep(RESUBSCRIBE_DELAY)
+
+
+class LocalState:
+    """То же состояние только в памяти процесса (бенчмарки, отдельные экземпляры)"""
+
+    def __init__(self, defaults):
+        self.defaults = dict(defaults)
+        self._local = dict(defaults)
+        self._stats = {}
+
+    def get(self):
+        return self._local
+
+    def update(self, **fields):
+        self._local = {**self._local, **fields}
+
+    def record_success(self, provider):
+        self._stats[provider] = self._stats.get(provider, 0) + 1
+        self._local = {**self._local, 'current_provider': provider}
+
+    def stats(self):
+        return dict(self._stats)
+
+    def reset(self):
+        self._local = dict(self.defaults)
+        self._stats = {}
@@ -0,0 +1,69 @@
+import json
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from learning_platform.gpt_service import gpt_service
+
+GOLDEN_PATH = Path(__file__).resolve().parents[2] / 'format_response_golden.json'
+
+# Типичный ответ модели: текст, списки, заголовки, код и повторяющиеся строки
+SAMPLE_BLOCK = """Как подключить PHP к MySQL:
+
+1. Установите расширение
+php-mysql
+2. Создайте подключение
+- проверьте логин
+- проверьте пароль
+
+Пример:
+```php
+$pdo = new PDO($dsn, $user, $pass);
+$stmt = $pdo->query('SELECT * FROM users');
+```
+
+Результат: соединение УСТАНОВЛЕНО, используйте `PDO::prepare` для запросов.
+Это ВАЖНО для безопасности приложения и защиты от SQL-инъекций.
+
+
+
+"""
+
+
+class Command(BaseCommand):
+    help = 'Check GPTService.format_response against the golden corpus and time it on large responses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=50,
+                          help='Size of the synthetic response in KB.')
+        parser.add_argument('--iterations', type=int, default=20,
+                          help='Number of timed runs.')
+
+    def handle(self, *args, **options):
+        self.check_golden()
+
+        text = self.build_response(options['size'] * 1024)
+        iterations = max(options['iterations'], 1)
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            gpt_service.format_response(text)
+            timings.append(time.perf_counter() - started)
+
+        mean = sum(timings) / len(timings)
+        size_kb = len(text.encode('utf-8')) / 1024
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"format_response on {size_kb:.0f} KB ({text.count(chr(10))} lines), {iterations} runs:"
+        ))
+        self.stdout.write(f"  mean={mean * 1000:.2f}ms min={min(timings) * 1000:.2f}ms "
+                          f"max={max(timings) * 1000:.2f}ms throughput={size_kb / 1024 / mean:.1f} MB/s")
+
+    def check_golden(self):
+        cases = json.loads(GOLDEN_PATH.read_text(encoding='utf-8'))
+        failed = [case['name'] for case in cases if gpt_service.format_response(case['input']) != case['expected']]
+        if failed:
+            raise CommandError(f"format_response differs from the golden output for: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS(f"Golden corpus: {len(cases)} cases match."))
+
+    def build_response(self, size):
+        block_size = len(SAMPLE_BLOCK.encode('utf-8'))
+        return SAMPLE_BLOCK * max(size // block_size, 1)
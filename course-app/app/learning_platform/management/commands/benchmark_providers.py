@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from learning_platform import provider_benchmark, provider_health, provider_limits
+
+# Логгеры, которые пишут по строке на каждую попытку
+NOISY_LOGGERS = ('learning_platform.gpt_service', 'learning_platform.provider_health',
+                 'learning_platform.provider_limits')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark GPT provider failover offline against simulated providers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                          help='Number of get_response_async calls.')
+        parser.add_argument('--concurrency', type=int, default=20,
+                          help='Calls running at the same time.')
+        parser.add_argument('--profiles',
+                          help='JSON file with a list of simulated providers '
+                               '(name, latency, jitter, empty_rate, rate_limit_rate, error_rate, hang_rate).')
+        parser.add_argument('--seed', type=int, default=None,
+                          help='Random seed for reproducible runs.')
+        parser.add_argument('--provider-timeout', type=float, default=10,
+                          help='Seconds before a hanging provider times out.')
+        parser.add_argument('--max-in-flight', type=int, default=None,
+                          help='Override GPT_HEDGE_MAX_IN_FLIGHT (1 disables hedging).')
+
+    def handle(self, *args, **options):
+        try:
+            profiles = provider_benchmark.ProviderProfile.load(options['profiles'])
+        except (OSError, ValueError, TypeError) as e:
+            raise CommandError(f"Cannot load provider profiles: {e}")
+        if not profiles:
+            raise CommandError("At least one provider profile is required.")
+
+        backend = provider_benchmark.FakeBackend(profiles, seed=options['seed'])
+        service = provider_benchmark.BenchmarkGPTService(backend)
+        names = [profile.name for profile in profiles]
+
+        overrides = {'GPT_PROVIDER_TIMEOUT': options['provider_timeout']}
+        if options['max_in_flight'] is not None:
+            overrides['GPT_HEDGE_MAX_IN_FLIGHT'] = options['max_in_flight']
+
+        if options['verbosity'] < 2:
+            for name in NOISY_LOGGERS:
+                logging.getLogger(name).setLevel(logging.ERROR)
+
+        # Имитируемые провайдеры начинают без истории; их здоровье не смешивается с боевым
+        provider_health.reset(names)
+        provider_limits.reset_stats()
+        try:
+            with override_settings(**overrides):
+                report = asyncio.run(provider_benchmark.run(service, options['requests'], options['concurrency']))
+        finally:
+            provider_health.reset(names)
+
+        self.print_report(report)
+
+    def print_report(self, report):
+        def seconds(value):
+            return f"{value:.2f}s" if value is not None else '-'
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{report['requests']} requests, concurrency {report['concurrency']}, {report['elapsed']:.1f}s:"
+        ))
+        self.stdout.write(
+            f"  success={report['successes']} failed={report['failures']} overloaded={report['overloaded']} "
+            f"throughput={report['throughput']:.2f} req/s"
+        )
+        self.stdout.write(
+            f"  latency p50={seconds(report['p50'])} p95={seconds(report['p95'])} p99={seconds(report['p99'])}"
+        )
+        per_success = report['attempts_per_success']
+        per_success = f"{per_success:.2f}" if per_success is not None else '-'
+        self.stdout.write(f"  attempts={report['attempts']} attempts_per_success={per_success}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Attempts by provider:"))
+        for name, outcomes in report['providers'].items():
+            counters = ' '.join(f"{outcome}={count}" for outcome, count in outcomes.items())
+            self.stdout.write(f"  {name:<20} {counters}")
@@ -0,0 +1,100 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from learning_platform.models import Category, Video
+from learning_platform.serializers import VideoSerializer, FastVideoSerializer
+
+
+def benchmark_request(path='/api/videos/'):
+    """GET-запрос с хостом из ALLOWED_HOSTS (RequestFactory шлет testserver)"""
+    host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+    return RequestFactory().get(path, HTTP_HOST=host)
+
+
+def build_rows(count):
+    """Одинаковые данные в виде моделей (для DRF) и строк .values() (для быстрого пути)"""
+    category = Category(id=2, name='javascript')
+    now = timezone.now()
+    instances = []
+    rows = []
+    for i in range(count):
+        video = Video(
+            id=i + 1,
+            title=f'Lesson {i}: «Тема» "{i}"',
+            description='Описание урока\nс переносом строки и юникодом  ',
+            video_url=f'https://www.youtube.com/watch?v=example{i}',
+            preview_image=f'previews/lesson_{i}.png' if i % 3 else '',
+            category=category,
+            duration=timedelta(minutes=i % 90, seconds=i % 60) if i % 2 else None,
+            views=i * 7,
+            is_published=True,
+            created_at=now - timedelta(hours=i),
+            updated_at=now - timedelta(minutes=i),
+        )
+        instances.append(video)
+        rows.append({
+            'id': video.id,
+            'title': video.title,
+            'description': video.description,
+            'video_url': video.video_url,
+            'preview_image': video.preview_image.name,
+            'category': category.id,
+            'category__name': category.name,
+            'duration': video.duration,
+            'views': video.views,
+            'is_published': video.is_published,
+            'created_at': video.created_at,
+            'updated_at': video.updated_at,
+        })
+    return instances, rows
+
+
+class Command(BaseCommand):
+    help = 'Compare VideoSerializer and FastVideoSerializer throughput on synthetic videos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500,
+                          help='Number of videos per serialized list.')
+        parser.add_argument('--iterations', type=int, default=50,
+                          help='Number of timed runs for each serializer.')
+
+    def _measure(self, render, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            render()
+        return time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        rows_count = options['rows']
+        iterations = options['iterations']
+        context = {'request': benchmark_request()}
+        renderer = JSONRenderer()
+
+        instances, rows = build_rows(rows_count)
+
+        def render_drf():
+            return renderer.render(VideoSerializer(instances, many=True, context=context).data)
+
+        def render_fast():
+            return renderer.render(FastVideoSerializer(rows, many=True, context=context).data)
+
+        if render_drf() != render_fast():
+            raise CommandError("FastVideoSerializer output differs from VideoSerializer")
+        self.stdout.write(self.style.SUCCESS("Output is byte-identical."))
+
+        drf_time = self._measure(render_drf, iterations)
+        fast_time = self._measure(render_fast, iterations)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{iterations} runs x {rows_count} videos (serialization + JSON rendering):"
+        ))
+        for name, elapsed in (('VideoSerializer', drf_time), ('FastVideoSerializer', fast_time)):
+            per_run_ms = elapsed / iterations * 1000
+            videos_per_sec = rows_count * iterations / elapsed if elapsed else 0
+            self.stdout.write(f"  {name:<20} {per_run_ms:8.2f} ms/run  {videos_per_sec:10.0f} videos/s")
+        if fast_time:
+            self.stdout.write(self.style.SUCCESS(f"Speedup: {drf_time / fast_time:.1f}x"))
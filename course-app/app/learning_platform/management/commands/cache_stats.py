@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from learning_platform import catalog_cache, chat_cache
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the video catalog and chat response caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                          help='Reset the counters after printing them.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.MIGRATE_HEADING("Catalog cache:"))
+        self.stdout.write(f"  Catalog version: {catalog_cache.get_version()}")
+
+        stats = catalog_cache.get_stats()
+        if not stats:
+            self.stdout.write("  No requests recorded yet.")
+        for endpoint, counters in sorted(stats.items()):
+            self.stdout.write(
+                f"  {endpoint}: hits={counters['hits']} misses={counters['misses']} "
+                f"hit_ratio={counters['hit_ratio']:.2%}"
+            )
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Chat response cache:"))
+        chat = chat_cache.get_stats()
+        self.stdout.write(
+            f"  entries={chat['entries']} exact_hits={chat['exact_hits']} fuzzy_hits={chat['fuzzy_hits']} "
+            f"misses={chat['misses']} bypassed={chat['bypassed']} hit_ratio={chat['hit_ratio']:.2%}"
+        )
+
+        if options['reset']:
+            catalog_cache.reset_stats()
+            chat_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
@@ -0,0 +1,41 @@
+import asyncio
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from learning_platform import chat_jobs
+from learning_platform.gpt_service import gpt_service
+
+
+class Command(BaseCommand):
+    help = 'Process queued GPT chat jobs (requests sent to /api/chat/ with async_mode)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.CHAT_WORKER_CONCURRENCY,
+                          help='Maximum number of chat jobs processed at once.')
+        parser.add_argument('--max-jobs', type=int, default=None,
+                          help='Exit after processing this many jobs.')
+
+    def handle(self, *args, **options):
+        if settings.CHAT_JOB_BACKEND == 'memory':
+            self.stdout.write(self.style.WARNING(
+                "CHAT_JOB_BACKEND is 'memory': this worker only sees jobs queued by its own process."
+            ))
+
+        pool = chat_jobs.WorkerPool(concurrency=max(options['concurrency'], 1))
+        self.stdout.write(self.style.SUCCESS(
+            f"Processing chat jobs with concurrency {pool.concurrency}. Press Ctrl+C to stop."
+        ))
+        asyncio.run(self._run(pool, options['max_jobs']))
+        self.stdout.write(self.style.SUCCESS(f"Stopped after {pool.processed} jobs."))
+
+    async def _run(self, pool, max_jobs):
+        loop = asyncio.get_running_loop()
+        # Останавливаемся мягко: новые задачи не берем, текущие дорабатываем
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, pool.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+        if settings.GPT_WARMUP:
+            await gpt_service.warm_up(probe=settings.GPT_WARMUP_PROBE)
+        await pool.run(max_jobs=max_jobs)
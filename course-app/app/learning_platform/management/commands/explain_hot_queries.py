@@ -0,0 +1,117 @@
+import json
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from django.utils import timezone
+from learning_platform.models import Video, UserProgress, Favorite, ChatMessage
+from learning_platform.progress_service import category_stats_queryset
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on the hot queries and fail if a large table is read with a sequential scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=int, default=1000,
+                          help='Fail on sequential scans of tables with more rows than this.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                          help='Database to explain the queries on.')
+        parser.add_argument('--verbose-plans', action='store_true',
+                          help='Print the full plan of every query.')
+
+    def _hot_queries(self, database):
+        """Запросы, которые выполняются на каждый запрос к API / WebSocket"""
+        user = User.objects.using(database).order_by('id').first()
+        user_id = user.id if user else 0
+        if user is None:
+            # Для EXPLAIN пользователь может и не существовать
+            user = User(id=user_id)
+        now = timezone.now()
+
+        videos = Video.objects.using(database)
+        messages = ChatMessage.objects.using(database)
+
+        return [
+            ('catalog by category', videos.catalog('javascript')),
+            ('catalog keyset page', videos.catalog('javascript').filter(
+                Q(created_at__lt=now) | Q(created_at=now, id__lt=1)
+            ).order_by('-created_at', '-id')[:21]),
+            ('recent videos', videos.catalog()[:10]),
+            ('progress aggregate (user)', category_stats_queryset(user=user).using(database)),
+            ('progress aggregate (anonymous)', category_stats_queryset(
+                user=AnonymousUser(), watched_video_ids=[1, 2, 3]
+            ).using(database)),
+            ('users completed video', UserProgress.objects.using(database).filter(
+                video_id=1, completed=True
+            ).values_list('user_id', flat=True)),
+            ('favorites', videos.catalog().filter(
+                lp_video_favorites__user_id=user_id
+            ).order_by('-lp_video_favorites__created_at')),
+            ('favorite status', Favorite.objects.using(database).filter(user_id=user_id, video_id=1)),
+            ('chat history (user)', messages.filter(user_id=user_id).order_by('-created_at', '-id')[:21]),
+            ('chat history (session)', messages.filter(session_id='session').order_by('-created_at', '-id')[:21]),
+        ]
+
+    def _table_rows(self, connection, table):
+        """Оценка числа строк таблицы (None, если таблица еще не анализировалась)"""
+        with connection.cursor() as cursor:
+            # to_regclass ищет таблицу по search_path, как и планировщик, - без
+            # одноименных таблиц из других схем
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)",
+                [connection.ops.quote_name(table)]
+            )
+            row = cursor.fetchone()
+        # reltuples = -1 (PostgreSQL 14+): VACUUM/ANALYZE еще не выполнялись
+        if row is None or row[0] < 0:
+            return None
+        return int(row[0])
+
+    def _seq_scans(self, plan):
+        """Все узлы Seq Scan в дереве плана"""
+        if plan.get('Node Type') == 'Seq Scan':
+            yield plan
+        for child in plan.get('Plans', []):
+            yield from self._seq_scans(child)
+
+    def handle(self, *args, **options):
+        database = options['database']
+        threshold = options['threshold']
+        connection = connections[database]
+
+        if connection.vendor != 'postgresql':
+            raise CommandError(
+                f"Plan checks need PostgreSQL row estimates, got '{connection.vendor}'."
+            )
+
+        failures = []
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Explaining hot queries (threshold: {threshold} rows):"))
+
+        for name, queryset in self._hot_queries(database):
+            plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+            if options['verbose_plans']:
+                self.stdout.write(json.dumps(plan, indent=2))
+
+            offending = []
+            unknown = []
+            for node in self._seq_scans(plan):
+                table = node.get('Relation Name')
+                rows = self._table_rows(connection, table)
+                if rows is None:
+                    unknown.append(f"{table} (rows unknown)")
+                elif rows > threshold:
+                    offending.append(f"{table} (~{rows} rows)")
+
+            if offending:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"  ✗ {name}: sequential scan on {', '.join(offending)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"  ✓ {name}: total cost {plan.get('Total Cost')}"))
+            if unknown:
+                self.stdout.write(self.style.WARNING(
+                    f"    sequential scan on {', '.join(unknown)} - run ANALYZE for row estimates"
+                ))
+
+        if failures:
+            raise CommandError(f"Sequential scans above threshold in: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("All hot queries use indexes."))
@@ -0,0 +1,36 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from learning_platform import view_counter
+
+
+class Command(BaseCommand):
+    help = 'Write video view counts buffered in Redis to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                          help='Keep running and flush every --interval seconds.')
+        parser.add_argument('--interval', type=int, default=settings.VIEW_COUNTS_FLUSH_INTERVAL,
+                          help='Seconds between flushes in --loop mode.')
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            updated = view_counter.flush()
+            self.stdout.write(self.style.SUCCESS(f"Updated views for {updated} videos."))
+            return
+
+        interval = max(options['interval'], 1)
+        self.stdout.write(self.style.SUCCESS(f"Flushing view counts every {interval}s. Press Ctrl+C to stop."))
+        try:
+            while True:
+                try:
+                    updated = view_counter.flush()
+                    if updated:
+                        self.stdout.write(f"Updated views for {updated} videos.")
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"Flush failed: {e}"))
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            # Дописываем остаток перед выходом
+            view_counter.flush()
+            self.stdout.write(self.style.SUCCESS("Stopped."))
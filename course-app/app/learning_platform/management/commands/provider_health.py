@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand
+from learning_platform import provider_health
+from learning_platform.gpt_service import gpt_service
+
+
+class Command(BaseCommand):
+    help = 'Show the shared GPT provider health: latency, success rates and circuit breakers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                          help='Reset all provider statistics and close every breaker.')
+
+    def handle(self, *args, **options):
+        providers = gpt_service.get_all_providers()
+
+        if options['reset']:
+            provider_health.reset(providers)
+            self.stdout.write(self.style.SUCCESS("Provider health reset."))
+            return
+
+        snapshot = provider_health.get_snapshot(providers)
+        now = time.time()
+        ordered = provider_health.order_providers(providers, snapshot, now)
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Providers by expected time to success:"))
+        for provider in ordered + [p for p in providers if p not in ordered]:
+            health = snapshot.get(provider)
+            if not health or health['latency_ewma'] is None:
+                self.stdout.write(f"  {provider:<28} no observations")
+                continue
+
+            state = health['state']
+            if provider_health.is_open(health, now):
+                state = f"open ({int(health['open_until'] - now)}s left)"
+            p50 = f"{health['p50']:.1f}s" if health['p50'] is not None else '-'
+            self.stdout.write(
+                f"  {provider:<28} expected={provider_health.expected_time_to_success(health):6.1f}s "
+                f"ewma={health['latency_ewma']:5.1f}s p50={p50:>6} "
+                f"success={health['success_rate']:.0%} rate_limited={health['rate_limit_rate']:.0%} "
+                f"ok/fail/429={health['successes']}/{health['failures']}/{health['rate_limits']} {state}"
+            )
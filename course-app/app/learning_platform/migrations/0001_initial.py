@@ -0,0 +1,124 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(choices=[('html_css', 'HTML + CSS'), ('javascript', 'JavaScript'), ('php', 'PHP'), ('wordpress', 'WordPress')], max_length=20, unique=True, verbose_name='Категория')),
+                ('description', models.TextField(blank=True, verbose_name='Описание')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Категория',
+                'verbose_name_plural': 'Категории',
+            },
+        ),
+        migrations.CreateModel(
+            name='Video',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='Название видео')),
+                ('description', models.TextField(verbose_name='Описание')),
+                ('video_url', models.URLField(verbose_name='Ссылка на видео')),
+                ('preview_image', models.ImageField(upload_to='previews/', verbose_name='Превью изображение')),
+                ('duration', models.DurationField(blank=True, null=True, verbose_name='Длительность')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотры')),
+                ('is_published', models.BooleanField(default=True, verbose_name='Опубликовано')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lp_videos', to='learning_platform.category', verbose_name='Категория')),
+            ],
+            options={
+                'verbose_name': 'Видео',
+                'verbose_name_plural': 'Видео',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DatabaseBackup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('file_path', models.CharField(max_length=500, verbose_name='Путь к файлу')),
+                ('uploaded_file', models.FileField(blank=True, null=True, upload_to='backups/uploaded/', verbose_name='Загруженный файл')),
+                ('file_size', models.BigIntegerField(verbose_name='Размер файла (байт)')),
+                ('backup_type', models.CharField(choices=[('auto', 'Автоматический'), ('manual', 'Ручной'), ('uploaded', 'Загруженный')], default='manual', max_length=20, verbose_name='Тип бэкапа')),
+                ('status', models.CharField(choices=[('created', 'Создан'), ('uploaded', 'Загружен'), ('restored', 'Восстановлен'), ('failed', 'Ошибка'), ('processing', 'Обработка')], default='created', max_length=20, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('restored_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата восстановления')),
+                ('notes', models.TextField(blank=True, verbose_name='Заметки')),
+                ('md5_hash', models.CharField(blank=True, max_length=32, verbose_name='MD5 хеш')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Создан пользователем')),
+                ('restored_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='restored_backups', to=settings.AUTH_USER_MODEL, verbose_name='Восстановлен пользователем')),
+            ],
+            options={
+                'verbose_name': 'Резервная копия БД',
+                'verbose_name_plural': 'Резервные копии БД',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(help_text='Уникальный идентификатор сессии для анонимных пользователей', max_length=100, verbose_name='ID сессии')),
+                ('message', models.TextField(verbose_name='Сообщение пользователя')),
+                ('response', models.TextField(verbose_name='Ответ AI')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('model_used', models.CharField(default='gpt-3.5-turbo', max_length=50, verbose_name='Используемая модель')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Сообщение чата',
+                'verbose_name_plural': 'Сообщения чата',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('progress_percentage', models.FloatField(default=0.0, verbose_name='Прогресс (%)')),
+                ('completed', models.BooleanField(default=False, verbose_name='Завершено')),
+                ('last_watched', models.DateTimeField(auto_now=True, verbose_name='Последний просмотр')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lp_progress', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lp_user_progress', to='learning_platform.video', verbose_name='Видео')),
+            ],
+            options={
+                'verbose_name': 'Прогресс пользователя',
+                'verbose_name_plural': 'Прогресс пользователей',
+                'db_table': 'lp_user_progress',
+                'unique_together': {('user', 'video')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Favorite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Добавлено в избранное')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lp_favorites', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lp_video_favorites', to='learning_platform.video', verbose_name='Видео')),
+            ],
+            options={
+                'verbose_name': 'Избранное видео',
+                'verbose_name_plural': 'Избранные видео',
+                'db_table': 'lp_user_favorites',
+                'ordering': ['-created_at'],
+                'unique_together': {('user', 'video')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_platform', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(condition=models.Q(('user__isnull', False)), fields=['user', '-created_at', '-id'], name='lp_chat_user_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session_id', '-created_at', '-id'], name='lp_chat_session_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprogress',
+            index=models.Index(condition=models.Q(('completed', True)), fields=['user', 'video'], name='lp_progress_user_done_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprogress',
+            index=models.Index(condition=models.Q(('completed', True)), fields=['video', 'user'], name='lp_progress_video_done_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['category', '-created_at', '-id'], name='lp_video_category_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-created_at', '-id'], name='lp_video_recent_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('learning_platform', '0002_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(blank=True, max_length=100, verbose_name='ID сессии')),
+                ('summary', models.TextField(blank=True, verbose_name='Краткое содержание')),
+                ('covered_until_id', models.PositiveBigIntegerField(default=0, verbose_name='Учтены сообщения до ID включительно')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chat_summaries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Краткое содержание чата',
+                'verbose_name_plural': 'Краткое содержание чатов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='chatsummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('user',), name='lp_chat_summary_user_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='chatsummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('session_id',), name='lp_chat_summary_session_uniq'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learning_platform', '0003_chat_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ViewCountFlush',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=32, unique=True, verbose_name='ID пачки')),
+                ('applied_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата применения')),
+            ],
+            options={
+                'verbose_name': 'Сброс просмотров',
+                'verbose_name_plural': 'Сбросы просмотров',
+            },
+        ),
+    ]
@@ -21,6 +21,25 @@ class Category(models.Model):
     def __str__(self):
         return self.get_name_display()
 
+class VideoQuerySet(models.QuerySet):
+    # Колонки, которые отдает VideoSerializer
+    CATALOG_FIELDS = (
+        'id', 'title', 'description', 'video_url', 'preview_image', 'category',
+        'duration', 'views', 'is_published', 'created_at', 'updated_at',
+    )
+    
+    def published(self):
+        return self.filter(is_published=True)
+    
+    def catalog(self, category_name=None):
+        """Опубликованные видео для каталога: категория подтягивается тем же запросом"""
+        queryset = self.published().select_related('category').only(
+            *self.CATALOG_FIELDS, 'category__name'
+        )
+        if category_name is not None:
+            queryset = queryset.filter(category__name=category_name)
+        return queryset.order_by('-created_at', '-id')
+
 class Video(models.Model):
     title = models.CharField(max_length=200, verbose_name="Название видео")
     description = models.TextField(verbose_name="Описание")
@@ -33,13 +52,40 @@ class Video(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
     
+    objects = VideoQuerySet.as_manager()
+    
     class Meta:
         verbose_name = "Видео"
         verbose_name_plural = "Видео"
         ordering = ['-created_at']
+        indexes = [
+            # Каталог по категории и постраничная выдача по курсору (created_at, id):
+            # все горячие запросы читают только опубликованные видео
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                condition=models.Q(is_published=True),
+                name='lp_video_category_keyset_idx'
+            ),
+            # Последние видео и общий список каталога
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_published=True),
+                name='lp_video_recent_keyset_idx'
+            ),
+        ]
     
     def __str__(self):
         return self.title
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженное состояние для инкрементального пересчета счетчиков прогресса.
+        # После only()/defer() без этих полей состояние неизвестно - сигналы перестроят счетчики
+        loaded = instance.__dict__
+        if 'category_id' in loaded and 'is_published' in loaded:
+            instance._loaded_publication = (loaded['category_id'], loaded['is_published'])
+        return instance
 
 class UserProgress(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь", related_name="lp_progress")
@@ -53,9 +99,32 @@ class UserProgress(models.Model):
         verbose_name_plural = "Прогресс пользователей"
         unique_together = ['user', 'video']
         db_table = 'lp_user_progress'  # Add unique table name
+        indexes = [
+            # Подсчет и JOIN завершенных видео пользователя
+            models.Index(
+                fields=['user', 'video'],
+                condition=models.Q(completed=True),
+                name='lp_progress_user_done_idx'
+            ),
+            # Пользователи, завершившие видео (пересчет счетчиков при изменении видео)
+            models.Index(
+                fields=['video', 'user'],
+                condition=models.Q(completed=True),
+                name='lp_progress_video_done_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.video.title} ({self.progress_percentage}%)"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженное состояние для инкрементального пересчета счетчиков прогресса
+        # (без поля completed - после only()/defer() - состояние неизвестно)
+        if 'completed' in instance.__dict__:
+            instance._loaded_completed = instance.__dict__['completed']
+        return instance
 
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь", related_name="lp_favorites")
@@ -178,7 +247,67 @@ class ChatMessage(models.Model):
         verbose_name = "Сообщение чата"
         verbose_name_plural = "Сообщения чата"
         ordering = ['-created_at']
+        indexes = [
+            # История чата по курсору (created_at, id)
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                condition=models.Q(user__isnull=False),
+                name='lp_chat_user_keyset_idx'
+            ),
+            models.Index(fields=['session_id', '-created_at', '-id'], name='lp_chat_session_keyset_idx'),
+        ]
     
     def __str__(self):
         username = self.user.username if self.user else f"Anonymous:{self.session_id[:8]}"
         return f"{username} - {self.message[:50]}..."
+
+
+class ChatSummary(models.Model):
+    """Накопленное краткое содержание старых сообщений разговора
+
+    Один объект на пользователя (или на session_id анонимного клиента).
+    Старые ходы, не поместившиеся в бюджет контекста, дописываются сюда,
+    чтобы провайдер видел суть разговора без полной истории.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь", related_name="chat_summaries", null=True, blank=True)
+    session_id = models.CharField(max_length=100, blank=True, verbose_name="ID сессии")
+    summary = models.TextField(blank=True, verbose_name="Краткое содержание")
+    covered_until_id = models.PositiveBigIntegerField(default=0, verbose_name="Учтены сообщения до ID включительно")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Краткое содержание чата"
+        verbose_name_plural = "Краткое содержание чатов"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(user__isnull=False),
+                name='lp_chat_summary_user_uniq'
+            ),
+            models.UniqueConstraint(
+                fields=['session_id'],
+                condition=models.Q(user__isnull=True),
+                name='lp_chat_summary_session_uniq'
+            ),
+        ]
+
+    def __str__(self):
+        username = self.user.username if self.user else f"Anonymous:{self.session_id[:8]}"
+        return f"{username} - до #{self.covered_until_id}"
+
+
+class ViewCountFlush(models.Model):
+    """Пачка просмотров, уже перенесенная из Redis в БД
+
+    Записывается в той же транзакции, что и UPDATE счетчиков: если сброс
+    упал до удаления пачки из Redis, повторный сброс ее не применит.
+    """
+    batch_id = models.CharField(max_length=32, unique=True, verbose_name="ID пачки")
+    applied_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата применения")
+
+    class Meta:
+        verbose_name = "Сброс просмотров"
+        verbose_name_plural = "Сбросы просмотров"
+
+    def __str__(self):
+        return f"{self.batch_id} - {self.applied_at}"
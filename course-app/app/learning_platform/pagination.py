@@ -0,0 +1,115 @@
+import base64
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу (created_at, id) от новых к старым
+
+    В отличие от OFFSET, стоимость любой страницы одинакова: следующая
+    страница выбирается условием по последней строке предыдущей и идет
+    по составному индексу (..., -created_at, -id).
+    Работает как с моделями, так и со строками .values().
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = 20
+    max_limit = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_requested(self, request):
+        """Клиент запросил постраничную выдачу (иначе отдаем полный список как раньше)"""
+        return self.cursor_query_param in request.GET or self.limit_query_param in request.GET
+
+    @staticmethod
+    def encode_cursor(created_at, pk):
+        raw = f'{created_at.isoformat()}|{pk}'
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            # Курсор из WebSocket - произвольный JSON, не обязательно строка
+            if not isinstance(cursor, str):
+                raise ValueError(cursor)
+            raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+            created_at, pk = raw.rsplit('|', 1)
+            created_at = parse_datetime(created_at)
+            if created_at is None:
+                raise ValueError(raw)
+            return created_at, int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(KeysetPagination.invalid_cursor_message)
+
+    def get_limit(self, limit):
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            return self.default_limit
+        if limit <= 0:
+            return self.default_limit
+        return min(limit, self.max_limit)
+
+    def _page_queryset(self, queryset, cursor, limit):
+        queryset = queryset.order_by('-created_at', '-id')
+
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+
+        # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+        return queryset[:limit + 1]
+
+    def paginate(self, queryset, cursor=None, limit=None):
+        """Страница и курсор следующей страницы (None, если это последняя)"""
+        limit = self.get_limit(limit)
+        page = list(self._page_queryset(queryset, cursor, limit))
+        return self._split_page(page, limit)
+
+    async def apaginate(self, queryset, cursor=None, limit=None):
+        """То же, что paginate, через асинхронный ORM"""
+        limit = self.get_limit(limit)
+        page = [row async for row in self._page_queryset(queryset, cursor, limit)]
+        return self._split_page(page, limit)
+
+    def _split_page(self, page, limit):
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            last = page[-1]
+            if isinstance(last, dict):
+                next_cursor = self.encode_cursor(last['created_at'], last['id'])
+            else:
+                next_cursor = self.encode_cursor(last.created_at, last.id)
+        return page, next_cursor
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page, self.next_cursor = self.paginate(
+            queryset,
+            cursor=request.GET.get(self.cursor_query_param),
+            limit=request.GET.get(self.limit_query_param)
+        )
+        return self.page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
@@ -0,0 +1,225 @@
+import logging
+from django.conf import settings
+from django_redis import get_redis_connection
+from .models import Category, Video, UserProgress
+from . import catalog_cache, progress_service
+from .progress_service import CATEGORY_MAP, API_CATEGORY_KEYS
+
+logger = logging.getLogger(__name__)
+
+# Ключи Redis (без KEY_PREFIX кэша - работаем с соединением напрямую)
+TOTALS_KEY = 'learning_platform:progress:totals'
+USER_KEY_TEMPLATE = 'learning_platform:progress:user:{user_id}'
+
+# HINCRBY только если хэш уже существует: иначе частичный хэш
+# выглядел бы как полный и ленивое перестроение никогда бы не случилось
+_INCREMENT_IF_EXISTS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+end
+return nil
+"""
+
+
+def _user_key(user_id):
+    return USER_KEY_TEMPLATE.format(user_id=user_id)
+
+
+def _ttl():
+    return getattr(settings, 'PROGRESS_COUNTERS_TTL', 86400)
+
+
+def _connection():
+    return get_redis_connection('default')
+
+
+def _increment(client, key, api_key, delta):
+    client.eval(_INCREMENT_IF_EXISTS, 1, key, api_key, delta)
+
+
+def _read_hash(client, key):
+    raw = client.hgetall(key)
+    if not raw:
+        return None
+    counters = {api_key: 0 for api_key in CATEGORY_MAP}
+    for field, value in raw.items():
+        field = field.decode() if isinstance(field, bytes) else field
+        if field in counters:
+            counters[field] = max(int(value), 0)
+    return counters
+
+
+def _write_hash(client, key, counters):
+    pipe = client.pipeline()
+    pipe.delete(key)
+    pipe.hset(key, mapping=counters)
+    pipe.expire(key, _ttl())
+    pipe.execute()
+
+
+def get_category_stats(user=None, watched_video_ids=None):
+    """Счетчики прогресса из Redis, с ленивым перестроением из БД
+
+    Формат совпадает с progress_service.get_category_stats.
+    Для анонимного пользователя просмотренные считаются по переданным ID
+    через закэшированный список опубликованных видео.
+    При недоступности Redis считаем напрямую по БД.
+    """
+    is_authenticated = user is not None and user.is_authenticated
+    if not is_authenticated and watched_video_ids:
+        try:
+            stats = get_category_stats()
+            for api_key in published_categories(watched_video_ids).values():
+                if api_key in stats:
+                    stats[api_key]['watched'] += 1
+            return stats
+        except Exception as e:
+            logger.warning(f"Кэш опубликованных видео недоступен: {e}")
+            return progress_service.get_category_stats(watched_video_ids=watched_video_ids)
+
+    try:
+        client = _connection()
+        totals = _read_hash(client, TOTALS_KEY)
+        watched = _read_hash(client, _user_key(user.id)) if is_authenticated else None
+
+        if totals is None or (is_authenticated and watched is None):
+            stats = progress_service.get_category_stats(user=user if is_authenticated else None)
+            totals = {api_key: counts['total'] for api_key, counts in stats.items()}
+            _write_hash(client, TOTALS_KEY, totals)
+            if is_authenticated:
+                watched = {api_key: counts['watched'] for api_key, counts in stats.items()}
+                _write_hash(client, _user_key(user.id), watched)
+    except Exception as e:
+        logger.warning(f"Счетчики прогресса в Redis недоступны: {e}")
+        return progress_service.get_category_stats(user=user if is_authenticated else None)
+
+    return {
+        api_key: {
+            'total': totals[api_key],
+            'watched': min(watched[api_key], totals[api_key]) if watched else 0,
+        }
+        for api_key in CATEGORY_MAP
+    }
+
+
+def get_user_progress(user=None, watched_video_ids=None):
+    """Прогресс пользователя по категориям в процентах"""
+    return progress_service.get_progress_percentages(get_category_stats(user, watched_video_ids))
+
+
+def parse_video_ids(video_ids):
+    """ID видео из данных клиента: только целые, без повторов"""
+    parsed = []
+    for video_id in video_ids or []:
+        try:
+            parsed.append(int(video_id))
+        except (ValueError, TypeError):
+            continue
+    return list(dict.fromkeys(parsed))
+
+
+def published_categories(video_ids):
+    """Опубликованные видео из списка ID -> ключ категории"""
+    return catalog_cache.published_video_categories(parse_video_ids(video_ids))
+
+
+def _category_keys(category_ids):
+    """ID категорий -> ключи API"""
+    names = dict(Category.objects.filter(pk__in=category_ids).values_list('id', 'name'))
+    return {category_id: API_CATEGORY_KEYS.get(names.get(category_id)) for category_id in category_ids}
+
+
+def _invalidate(client, *keys):
+    try:
+        client.delete(*keys)
+    except Exception as e:
+        logger.error(f"Не удалось сбросить счетчики прогресса {keys}: {e}")
+
+
+def progress_changed(user_id, video_id, delta):
+    """Изменение числа завершенных видео пользователя (delta = +1 / -1)"""
+    if not delta:
+        return
+
+    try:
+        client = _connection()
+    except Exception as e:
+        logger.warning(f"Счетчики прогресса в Redis недоступны: {e}")
+        return
+
+    key = _user_key(user_id)
+    try:
+        category_name = Video.objects.filter(
+            pk=video_id,
+            is_published=True
+        ).values_list('category__name', flat=True).first()
+        api_key = API_CATEGORY_KEYS.get(category_name)
+        if api_key:
+            _increment(client, key, api_key, delta)
+    except Exception as e:
+        logger.error(f"Ошибка обновления счетчиков прогресса пользователя {user_id}: {e}")
+        _invalidate(client, key)
+
+
+def video_publication_changed(video_id, previous, current):
+    """Изменение категории или публикации видео
+
+    previous и current - пары (category_id, is_published); None для
+    несуществующего состояния (создание / удаление видео).
+    """
+    was_counted = previous is not None and previous[1]
+    is_counted = current is not None and current[1]
+
+    if not was_counted and not is_counted:
+        return
+    if was_counted and is_counted and previous[0] == current[0]:
+        return
+
+    try:
+        client = _connection()
+    except Exception as e:
+        logger.warning(f"Счетчики прогресса в Redis недоступны: {e}")
+        return
+
+    user_ids = []
+    try:
+        changes = []
+        category_ids = []
+        if was_counted:
+            changes.append((previous[0], -1))
+            category_ids.append(previous[0])
+        if is_counted:
+            changes.append((current[0], 1))
+            category_ids.append(current[0])
+        api_keys = _category_keys(category_ids)
+
+        # Пользователи, завершившие видео: при удалении их строки прогресса
+        # уже удалены каскадом и учтены в progress_changed
+        if current is not None:
+            user_ids = list(UserProgress.objects.filter(
+                video_id=video_id,
+                completed=True
+            ).values_list('user_id', flat=True))
+
+        pipe = client.pipeline(transaction=False)
+        for category_id, delta in changes:
+            api_key = api_keys.get(category_id)
+            if not api_key:
+                continue
+            _increment(pipe, TOTALS_KEY, api_key, delta)
+            for user_id in user_ids:
+                _increment(pipe, _user_key(user_id), api_key, delta)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Ошибка обновления счетчиков прогресса для видео {video_id}: {e}")
+        _invalidate(client, TOTALS_KEY, *[_user_key(user_id) for user_id in user_ids])
+
+
+def invalidate(user_id=None):
+    """Сбросить счетчики: они будут перестроены из БД при следующем чтении"""
+    try:
+        client = _connection()
+    except Exception as e:
+        logger.warning(f"Счетчики прогресса в Redis недоступны: {e}")
+        return
+    _invalidate(client, _user_key(user_id) if user_id is not None else TOTALS_KEY)
@@ -0,0 +1,80 @@
+from django.db.models import Count, FilteredRelation, Q
+from .models import Video
+
+# Соответствие ключей API и категорий в БД
+CATEGORY_MAP = {
+    'html': 'html_css',
+    'js': 'javascript',
+    'php': 'php',
+    'wordpress': 'wordpress',
+}
+
+# Обратное соответствие: категория в БД -> ключ API
+API_CATEGORY_KEYS = {db_category: api_key for api_key, db_category in CATEGORY_MAP.items()}
+
+
+def category_stats_queryset(user=None, watched_video_ids=None):
+    """Сгруппированный запрос: всего и просмотрено опубликованных видео по категориям"""
+    videos = Video.objects.filter(is_published=True)
+
+    if user is not None and user.is_authenticated:
+        # LEFT JOIN только на завершенный прогресс этого пользователя:
+        # не больше одной строки на видео благодаря unique_together (user, video)
+        videos = videos.alias(
+            completed_progress=FilteredRelation(
+                'lp_user_progress',
+                condition=Q(lp_user_progress__user=user, lp_user_progress__completed=True),
+            )
+        )
+        watched = Count('completed_progress')
+    elif watched_video_ids:
+        ids = set()
+        for video_id in watched_video_ids:
+            try:
+                ids.add(int(video_id))
+            except (ValueError, TypeError):
+                continue
+        watched = Count('id', filter=Q(id__in=ids))
+    else:
+        watched = None
+
+    annotations = {'total': Count('id')}
+    if watched is not None:
+        annotations['watched'] = watched
+
+    return videos.values('category__name').annotate(**annotations).order_by()
+
+
+def get_category_stats(user=None, watched_video_ids=None):
+    """Количество опубликованных и просмотренных видео по категориям одним запросом
+
+    Для авторизованного пользователя просмотренные видео берутся из UserProgress,
+    для анонимного - из переданного списка ID (localStorage на клиенте).
+    Возвращает {'html': {'total': 10, 'watched': 3}, ...}
+    """
+    stats = {api_key: {'total': 0, 'watched': 0} for api_key in CATEGORY_MAP}
+
+    for row in category_stats_queryset(user, watched_video_ids):
+        api_key = API_CATEGORY_KEYS.get(row['category__name'])
+        if api_key is None:
+            continue
+        stats[api_key]['total'] = row['total']
+        stats[api_key]['watched'] = row.get('watched', 0)
+
+    return stats
+
+
+def get_progress_percentages(stats):
+    """Процент просмотренных видео по категориям"""
+    progress_data = {}
+    for api_key, counts in stats.items():
+        if counts['total'] > 0:
+            progress_data[api_key] = int((counts['watched'] / counts['total']) * 100)
+        else:
+            progress_data[api_key] = 0
+    return progress_data
+
+
+def get_user_progress(user=None, watched_video_ids=None):
+    """Прогресс пользователя по категориям в процентах"""
+    return get_progress_percentages(get_category_stats(user, watched_video_ids))
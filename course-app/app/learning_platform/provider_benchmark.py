@@ -0,0 +1,176 @@
+import asyncio
+import json
+import math
+import random
+import time
+from . import gpt_state
+from .gpt_service import GPTService
+
+# Набор имитируемых провайдеров по умолчанию: типичное поведение бесплатных
+# провайдеров g4f (быстрые, но с 429; медленные; нестабильные; зависающие)
+DEFAULT_PROFILES = [
+    {'name': 'FakeFast', 'latency': 1.5, 'jitter': 0.4, 'empty_rate': 0.05, 'rate_limit_rate': 0.1},
+    {'name': 'FakeSteady', 'latency': 3.0, 'jitter': 0.3, 'error_rate': 0.02},
+    {'name': 'FakeFlaky', 'latency': 2.0, 'jitter': 0.8, 'empty_rate': 0.15, 'error_rate': 0.15, 'hang_rate': 0.05},
+    {'name': 'FakeRateLimited', 'latency': 1.0, 'jitter': 0.3, 'rate_limit_rate': 0.5},
+    {'name': 'FakeSlow', 'latency': 8.0, 'jitter': 0.5},
+    {'name': 'FakeHanging', 'latency': 4.0, 'jitter': 0.5, 'hang_rate': 0.3},
+]
+
+# cancelled - попытка отменена, потому что параллельная (хедж) ответила раньше
+OUTCOMES = ('success', 'empty', 'rate_limited', 'error', 'hang', 'cancelled')
+
+
+class ProviderProfile:
+    """Поведение имитируемого провайдера
+
+    Время ответа - логнормальное с медианой latency и разбросом jitter; доли
+    запросов с пустым ответом, 429, ошибкой соединения и зависанием до таймаута.
+    """
+
+    def __init__(self, name, latency=2.0, jitter=0.5, empty_rate=0.0, rate_limit_rate=0.0,
+                 error_rate=0.0, hang_rate=0.0):
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.empty_rate = empty_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+
+    @classmethod
+    def load(cls, path=None):
+        """Профили из JSON-файла (список объектов с полями конструктора) или по умолчанию"""
+        if path is None:
+            data = DEFAULT_PROFILES
+        else:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        return [cls(**item) for item in data]
+
+
+class FakeBackend:
+    """Имитация g4f: задержка и исход запроса по профилю провайдера"""
+
+    def __init__(self, profiles, seed=None):
+        self.profiles = {profile.name: profile for profile in profiles}
+        self.random = random.Random(seed)
+        self.outcomes = {name: dict.fromkeys(OUTCOMES, 0) for name in self.profiles}
+
+    def _draw(self, profile):
+        roll = self.random.random()
+        for outcome, rate in (('hang', profile.hang_rate), ('rate_limited', profile.rate_limit_rate),
+                              ('error', profile.error_rate), ('empty', profile.empty_rate)):
+            if roll < rate:
+                return outcome
+            roll -= rate
+        return 'success'
+
+    async def complete(self, request_kwargs):
+        profile = self.profiles[request_kwargs['provider']]
+        timeout = request_kwargs.get('timeout', 120)
+        outcome = self._draw(profile)
+        latency = self.random.lognormvariate(0, profile.jitter) * profile.latency
+        if latency > timeout:
+            outcome = 'hang'
+        try:
+            return await self._respond(profile, outcome, latency, timeout)
+        except asyncio.CancelledError:
+            outcome = 'cancelled'
+            raise
+        finally:
+            self.outcomes[profile.name][outcome] += 1
+
+    async def _respond(self, profile, outcome, latency, timeout):
+        if outcome == 'hang':
+            await asyncio.sleep(timeout)
+            raise asyncio.TimeoutError()
+        if outcome == 'rate_limited':
+            # Провайдеры отвечают 429 быстрее, чем обычным ответом
+            await asyncio.sleep(latency * 0.1)
+            raise Exception(f"Response 429: Rate limit exceeded for {profile.name}")
+        if outcome == 'error':
+            await asyncio.sleep(latency * 0.5)
+            raise ConnectionError("Connection reset by peer")
+
+        await asyncio.sleep(latency)
+        return '' if outcome == 'empty' else f"Ответ {profile.name}: **готово**"
+
+    def calls(self):
+        return sum(sum(counters.values()) for counters in self.outcomes.values())
+
+
+class BenchmarkGPTService(GPTService):
+    """GPTService с имитацией провайдеров вместо g4f
+
+    Выбор провайдеров, хеджирование, автоматы provider_health и лимиты
+    provider_limits работают как в бою; состояние сервиса - только в памяти,
+    чтобы не трогать общее состояние воркеров.
+    """
+
+    def __init__(self, backend):
+        super().__init__()
+        self.backend = backend
+        names = list(backend.profiles)
+        self._state = gpt_state.LocalState({
+            'current_provider': names[0],
+            'preferred_provider': None,
+            'use_proxy': False,
+            'providers': names,
+        })
+        self._resolved_providers = {name: name for name in names}
+
+    @property
+    def default_model(self):
+        return 'benchmark'
+
+    def _create_completion(self, request_kwargs):
+        return self.backend.complete(request_kwargs)
+
+
+def percentile(values, quantile):
+    """Перцентиль по ближайшему рангу (None для пустого списка)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(quantile * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+async def run(service, requests, concurrency):
+    """Прогнать requests вызовов get_response_async, не больше concurrency одновременно"""
+    slots = asyncio.Semaphore(max(concurrency, 1))
+    results = []
+
+    async def one(number):
+        async with slots:
+            started = time.monotonic()
+            response = await service.get_response_async(f"Вопрос {number}: как работает async/await?")
+            results.append({
+                'success': response['success'],
+                'overloaded': response.get('overloaded', False),
+                'latency': time.monotonic() - started,
+            })
+
+    started = time.monotonic()
+    await asyncio.gather(*(one(number) for number in range(requests)))
+    elapsed = time.monotonic() - started
+
+    latencies = [result['latency'] for result in results if result['success']]
+    successes = len(latencies)
+    attempts = service.backend.calls()
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'successes': successes,
+        'failures': len(results) - successes,
+        'overloaded': sum(1 for result in results if result['overloaded']),
+        'elapsed': elapsed,
+        'throughput': successes / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'attempts': attempts,
+        'attempts_per_success': attempts / successes if successes else None,
+        'providers': service.backend.outcomes,
+    }
@@ -0,0 +1,296 @@
+import logging
+import time
+import uuid
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# Ключи Redis (без KEY_PREFIX кэша - работаем с соединением напрямую)
+HEALTH_KEY_TEMPLATE = 'learning_platform:providers:health:{provider}'
+TRIAL_KEY_TEMPLATE = 'learning_platform:providers:trial:{provider}'
+
+# Границы корзин гистограммы времени успешного ответа, секунды
+LATENCY_BUCKETS = (0.5, 1, 2, 3, 5, 8, 13, 21, 34, 55, 90, 120)
+
+SUCCESS = 'success'
+FAILURE = 'failure'
+RATE_LIMITED = 'rate_limited'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Атомарное обновление здоровья провайдера: EWMA, счетчики, гистограмма и
+# автомат circuit breaker в одном скрипте, чтобы воркеры не перетирали друг друга
+_RECORD_OUTCOME = """
+local key = KEYS[1]
+local outcome = ARGV[1]
+local latency = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local alpha = tonumber(ARGV[4])
+local threshold = tonumber(ARGV[5])
+local base_backoff = tonumber(ARGV[6])
+local max_backoff = tonumber(ARGV[7])
+local bucket = ARGV[8]
+local max_samples = tonumber(ARGV[9])
+local ttl = tonumber(ARGV[10])
+local trial_token = ARGV[11]
+
+local function ewma(field, value, prior)
+    local current = tonumber(redis.call('HGET', key, field))
+    if current == nil then
+        current = prior
+    end
+    if current == nil then
+        current = value
+    else
+        current = current + alpha * (value - current)
+    end
+    redis.call('HSET', key, field, tostring(current))
+end
+
+local succeeded = 0
+local rate_limited = 0
+if outcome == 'success' then succeeded = 1 end
+if outcome == 'rate_limited' then rate_limited = 1 end
+
+ewma('latency_ewma', latency, nil)
+ewma('success_rate', succeeded, 0.5)
+ewma('rate_limit_rate', rate_limited, 0)
+
+local state = redis.call('HGET', key, 'state') or 'closed'
+
+if outcome == 'success' then
+    redis.call('HINCRBY', key, 'successes', 1)
+    redis.call('HSET', key, 'state', 'closed', 'consecutive_failures', 0, 'backoff', 0)
+    redis.call('HINCRBY', key, bucket, 1)
+    -- Старые замеры постепенно забываются: при переполнении делим корзины пополам
+    if redis.call('HINCRBY', key, 'samples', 1) > max_samples then
+        local fields = redis.call('HGETALL', key)
+        for i = 1, #fields, 2 do
+            if string.sub(fields[i], 1, 2) == 'h:' or fields[i] == 'samples' then
+                redis.call('HSET', key, fields[i], math.floor(tonumber(fields[i + 1]) / 2))
+            end
+        end
+    end
+else
+    if outcome == 'rate_limited' then
+        redis.call('HINCRBY', key, 'rate_limits', 1)
+    else
+        redis.call('HINCRBY', key, 'failures', 1)
+    end
+    local failures = redis.call('HINCRBY', key, 'consecutive_failures', 1)
+    if rate_limited == 1 or state == 'half_open' or failures >= threshold then
+        local backoff = tonumber(redis.call('HGET', key, 'backoff') or '0')
+        if backoff <= 0 then
+            backoff = base_backoff
+        else
+            backoff = math.min(backoff * 2, max_backoff)
+        end
+        redis.call('HSET', key, 'state', 'open', 'open_until', tostring(now + backoff), 'backoff', tostring(backoff))
+    end
+end
+
+redis.call('EXPIRE', key, ttl)
+-- Пробный запрос освобождает только тот, кто его получил
+if trial_token ~= '' and redis.call('GET', KEYS[2]) == trial_token then
+    redis.call('DEL', KEYS[2])
+end
+return {redis.call('HGET', key, 'state'), redis.call('HGET', key, 'open_until') or '0'}
+"""
+
+_RELEASE_TRIAL = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _connection():
+    return get_redis_connection('default')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _health_key(provider):
+    return HEALTH_KEY_TEMPLATE.format(provider=provider)
+
+
+def _trial_key(provider):
+    return TRIAL_KEY_TEMPLATE.format(provider=provider)
+
+
+def _bucket_field(latency):
+    for bound in LATENCY_BUCKETS:
+        if latency <= bound:
+            return f'h:{bound}'
+    return 'h:inf'
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _parse(raw):
+    """Здоровье провайдера из хэша Redis (пустой хэш - провайдер еще не наблюдался)"""
+    raw = {_decode(field): _decode(value) for field, value in raw.items()}
+    histogram = {}
+    for field, value in raw.items():
+        if field.startswith('h:'):
+            histogram[field[2:]] = int(value)
+
+    return {
+        'state': raw.get('state', CLOSED),
+        'open_until': float(raw.get('open_until', 0)),
+        'latency_ewma': float(raw['latency_ewma']) if 'latency_ewma' in raw else None,
+        'success_rate': float(raw.get('success_rate', 0.5)),
+        'rate_limit_rate': float(raw.get('rate_limit_rate', 0)),
+        'successes': int(raw.get('successes', 0)),
+        'failures': int(raw.get('failures', 0)),
+        'rate_limits': int(raw.get('rate_limits', 0)),
+        'p50': _percentile(histogram, 0.5),
+    }
+
+
+def _percentile(histogram, quantile):
+    """Верхняя граница корзины, в которую попадает квантиль (None без замеров)"""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    seen = 0
+    for bound in LATENCY_BUCKETS:
+        seen += histogram.get(str(bound), 0)
+        if seen >= total * quantile:
+            return float(bound)
+    return float(_setting('GPT_PROVIDER_TIMEOUT', 120))
+
+
+def get_snapshot(providers):
+    """Здоровье всех провайдеров одним запросом к Redis
+
+    При недоступности Redis возвращает пустой словарь - провайдеры считаются
+    ненаблюдавшимися и перебираются в исходном порядке.
+    """
+    try:
+        pipe = _connection().pipeline(transaction=False)
+        for provider in providers:
+            pipe.hgetall(_health_key(provider))
+        return {provider: _parse(raw) for provider, raw in zip(providers, pipe.execute())}
+    except Exception as e:
+        logger.warning(f"Здоровье провайдеров недоступно в Redis: {e}")
+        return {}
+
+
+def expected_time_to_success(health):
+    """Ожидаемое время до успешного ответа: средняя длительность попытки / доля успехов"""
+    if not health or health['latency_ewma'] is None:
+        latency = _setting('GPT_PROVIDER_PRIOR_LATENCY', 5.0)
+    else:
+        latency = health['latency_ewma']
+    success_rate = health['success_rate'] if health else 0.5
+    return latency / max(success_rate, 0.05)
+
+
+def is_open(health, now=None):
+    """Провайдер отключен автоматом и время восстановления еще не наступило"""
+    now = time.time() if now is None else now
+    return bool(health) and health['state'] == OPEN and now < health['open_until']
+
+
+def order_providers(providers, snapshot, now=None):
+    """Доступные провайдеры по возрастанию ожидаемого времени до успеха
+
+    Отключенные провайдеры пропускаются; при равенстве сохраняется исходный порядок.
+    """
+    available = [provider for provider in providers if not is_open(snapshot.get(provider), now)]
+    return sorted(available, key=lambda provider: expected_time_to_success(snapshot.get(provider)))
+
+
+def acquire(provider, health, now=None):
+    """Можно ли сейчас отправить запрос провайдеру
+
+    Закрытый автомат пропускает всегда. После истечения паузы автомат
+    полуоткрыт: пробный запрос получает только один воркер, его токен
+    сохраняется в health и передается в record() или release().
+    """
+    now = time.time() if now is None else now
+    if not health or health['state'] == CLOSED:
+        return True
+    if health['state'] == OPEN and now < health['open_until']:
+        return False
+
+    try:
+        client = _connection()
+        trial_ttl = int(_setting('GPT_PROVIDER_TIMEOUT', 120))
+        token = uuid.uuid4().hex
+        if not client.set(_trial_key(provider), token, nx=True, ex=trial_ttl):
+            return False
+        client.hset(_health_key(provider), 'state', HALF_OPEN)
+        health['state'] = HALF_OPEN
+        health['trial_token'] = token
+        return True
+    except Exception as e:
+        logger.warning(f"Не удалось проверить автомат провайдера {provider}: {e}")
+        return True
+
+
+def record(provider, outcome, latency, health=None):
+    """Учесть результат запроса к провайдеру
+
+    Обновляет переданный снимок health, чтобы решения в рамках текущего
+    запроса учитывали только что открытый автомат. Если запрос был пробным
+    (токен от acquire в health), пробный запрос освобождается.
+    """
+    now = time.time()
+    trial_token = health.pop('trial_token', '') if health else ''
+    try:
+        client = _connection()
+        state, open_until = client.eval(
+            _RECORD_OUTCOME, 2, _health_key(provider), _trial_key(provider),
+            outcome,
+            latency,
+            now,
+            _setting('GPT_PROVIDER_EWMA_ALPHA', 0.2),
+            _setting('GPT_BREAKER_FAILURE_THRESHOLD', 3),
+            _setting('GPT_BREAKER_BASE_BACKOFF', 30),
+            _setting('GPT_BREAKER_MAX_BACKOFF', 900),
+            _bucket_field(latency),
+            200,
+            _setting('GPT_PROVIDER_HEALTH_TTL', 7 * 86400),
+            trial_token,
+        )
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить здоровье провайдера {provider}: {e}")
+        return
+
+    state = _decode(state)
+    if state == OPEN:
+        logger.info(f"[BREAKER] {provider}: отключен до {time.strftime('%H:%M:%S', time.localtime(float(open_until)))}")
+    if health is not None:
+        health['state'] = state
+        health['open_until'] = float(open_until)
+
+
+def release(provider, health):
+    """Освободить пробный запрос, который так и не дошел до провайдера"""
+    trial_token = health.pop('trial_token', '') if health else ''
+    if not trial_token:
+        return
+    try:
+        _connection().eval(_RELEASE_TRIAL, 1, _trial_key(provider), trial_token)
+    except Exception as e:
+        logger.warning(f"Не удалось освободить пробный запрос к {provider}: {e}")
+
+
+def reset(providers):
+    """Сбросить накопленную статистику и автоматы провайдеров"""
+    keys = [_health_key(provider) for provider in providers]
+    keys += [_trial_key(provider) for provider in providers]
+    try:
+        _connection().delete(*keys)
+    except Exception as e:
+        logger.warning(f"Не удалось сбросить здоровье провайдеров: {e}")
@@ -0,0 +1,120 @@
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+import weakref
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Исход попытки, до провайдера не дошедшей (см. ProviderBusy)
+BUSY = 'busy'
+
+# Ожидание места дольше этого попадает в лог, секунды
+SLOW_QUEUE_WARNING = 1.0
+
+# Семафоры одновременных запросов: цикл событий -> {провайдер: _Slot}
+_slots = weakref.WeakKeyDictionary()
+
+# Счетчики очереди этого процесса по провайдерам
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class ProviderBusy(Exception):
+    """Все места провайдера заняты: очередь переполнена или ожидание истекло
+
+    Это наша собственная разгрузка, а не ошибка провайдера: в provider_health
+    такая попытка не записывается.
+    """
+
+
+class _Slot:
+    def __init__(self, limit):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _record(provider_name, wait=None, rejected=False):
+    with _stats_lock:
+        stats = _stats.setdefault(provider_name, {
+            'acquired': 0, 'rejected': 0, 'total_wait': 0.0, 'max_wait': 0.0
+        })
+        if rejected:
+            stats['rejected'] += 1
+            return
+        stats['acquired'] += 1
+        stats['total_wait'] += wait
+        stats['max_wait'] = max(stats['max_wait'], wait)
+
+
+@contextlib.asynccontextmanager
+async def slot(provider_name):
+    """Место для одного запроса к провайдеру в этом процессе
+
+    Бесплатные провайдеры быстро отвечают 429 на всплеск запросов, поэтому к
+    каждому одновременно идет не больше GPT_PROVIDER_MAX_CONCURRENCY запросов.
+    Остальные ждут в очереди, но не больше GPT_PROVIDER_MAX_QUEUE запросов и
+    не дольше GPT_PROVIDER_QUEUE_TIMEOUT секунд - иначе ProviderBusy, и
+    запрос сразу переходит к следующему провайдеру. 0 в лимите - без ограничения.
+    """
+    limit = _setting('GPT_PROVIDER_MAX_CONCURRENCY', 4)
+    if limit <= 0:
+        yield
+        return
+
+    slots = _slots.setdefault(asyncio.get_running_loop(), {})
+    if provider_name not in slots:
+        slots[provider_name] = _Slot(limit)
+    current = slots[provider_name]
+
+    if current.semaphore.locked() and current.waiting >= _setting('GPT_PROVIDER_MAX_QUEUE', 8):
+        _record(provider_name, rejected=True)
+        raise ProviderBusy(f"{provider_name}: очередь переполнена")
+
+    started = time.monotonic()
+    current.waiting += 1
+    try:
+        await asyncio.wait_for(current.semaphore.acquire(), timeout=_setting('GPT_PROVIDER_QUEUE_TIMEOUT', 2.0))
+    except asyncio.TimeoutError:
+        _record(provider_name, rejected=True)
+        raise ProviderBusy(f"{provider_name}: нет свободного места")
+    finally:
+        current.waiting -= 1
+
+    wait = time.monotonic() - started
+    _record(provider_name, wait)
+    if wait > SLOW_QUEUE_WARNING:
+        logger.info(f"[QUEUE] {provider_name}: ожидание места {round(wait, 2)}с")
+    try:
+        yield
+    finally:
+        current.semaphore.release()
+
+
+def get_stats():
+    """Очередь к провайдерам в этом процессе: места, ожидание, отказы"""
+    with _stats_lock:
+        stats = {name: dict(counters) for name, counters in _stats.items()}
+
+    try:
+        slots = _slots.get(asyncio.get_running_loop(), {})
+    except RuntimeError:
+        slots = {}
+    for name, counters in stats.items():
+        counters['avg_wait'] = round(counters['total_wait'] / counters['acquired'], 3) if counters['acquired'] else 0.0
+        counters['total_wait'] = round(counters['total_wait'], 3)
+        counters['max_wait'] = round(counters['max_wait'], 3)
+        if name in slots:
+            counters['waiting'] = slots[name].waiting
+    return stats
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
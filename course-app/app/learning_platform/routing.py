@@ -4,4 +4,5 @@ from . import consumers
 websocket_urlpatterns = [
     re_path(r'ws/videos/$', consumers.VideoConsumer.as_asgi()),
     re_path(r'ws/progress/$', consumers.ProgressConsumer.as_asgi()),
+    re_path(r'ws/chat/$', consumers.ChatConsumer.as_asgi()),
 ]
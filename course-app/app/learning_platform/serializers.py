@@ -1,3 +1,5 @@
+from django.db.models.query import ModelIterable, QuerySet
+from django.utils.duration import duration_string
 from rest_framework import serializers
 from .models import Category, Video, UserProgress, ChatMessage
 
@@ -26,6 +28,68 @@ class VideoSerializer(serializers.ModelSerializer):
             return obj.preview_image.url
         return None
 
+class FastVideoSerializer:
+    """Быстрая сериализация списков видео только для чтения
+
+    Работает со строками .values() и заранее подготовленными преобразованиями
+    полей, минуя механизм полей DRF. Выдает тот же JSON, что и VideoSerializer.
+    """
+    values_fields = (
+        'id', 'title', 'description', 'video_url', 'preview_image', 'category',
+        'category__name', 'duration', 'views', 'is_published', 'created_at', 'updated_at',
+    )
+    
+    _datetime_field = serializers.DateTimeField()
+    _category_names = dict(Category.CATEGORY_CHOICES)
+    
+    def __init__(self, instance, many=True, context=None):
+        if isinstance(instance, QuerySet) and instance._iterable_class is ModelIterable:
+            instance = instance.values(*self.values_fields)
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+    
+    @property
+    def data(self):
+        request = self.context.get('request')
+        storage = Video._meta.get_field('preview_image').storage
+        to_datetime = self._datetime_field.to_representation
+        category_names = self._category_names
+        
+        def to_representation(row):
+            preview_image = row['preview_image']
+            if preview_image:
+                preview_image = storage.url(preview_image)
+                if request:
+                    preview_image = request.build_absolute_uri(preview_image)
+            else:
+                preview_image = None
+            
+            category_name = row['category__name']
+            duration = row['duration']
+            created_at = row['created_at']
+            updated_at = row['updated_at']
+            
+            # Порядок ключей совпадает с VideoSerializer.Meta.fields
+            return {
+                'id': row['id'],
+                'title': row['title'],
+                'description': row['description'],
+                'video_url': row['video_url'],
+                'preview_image': preview_image,
+                'category': row['category'],
+                'category_name': category_names.get(category_name, category_name) if category_name is not None else None,
+                'duration': duration_string(duration) if duration is not None else None,
+                'views': row['views'],
+                'is_published': row['is_published'],
+                'created_at': to_datetime(created_at) if created_at is not None else None,
+                'updated_at': to_datetime(updated_at) if updated_at is not None else None,
+            }
+        
+        if not self.many:
+            return to_representation(self.instance)
+        return [to_representation(row) for row in self.instance]
+
 class UserProgressSerializer(serializers.ModelSerializer):
     video_title = serializers.CharField(source='video.title', read_only=True)
     
@@ -42,3 +106,16 @@ class ChatMessageSerializer(serializers.ModelSerializer):
 class ChatRequestSerializer(serializers.Serializer):
     message = serializers.CharField(max_length=2000)
     session_id = serializers.CharField(max_length=100, required=False)
+    # Поставить запрос в очередь и сразу вернуть id задачи
+    async_mode = serializers.BooleanField(required=False, default=False)
+
+class ProgressSyncSerializer(serializers.Serializer):
+    """Локальная история из localStorage для слияния одним запросом"""
+    watched_videos = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), max_length=5000, required=False, default=list
+    )
+    favorites = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), max_length=5000, required=False, default=list
+    )
+    # Аккаунт, с которым этот браузер уже слил историю (маркер из localStorage)
+    synced_user = serializers.CharField(required=False, allow_blank=True, default='')
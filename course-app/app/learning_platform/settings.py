@@ -24,7 +24,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'learning_platform.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -106,6 +106,16 @@ CACHES = {
     }
 }
 
+# Denormalized progress counters in Redis (rebuilt lazily from the database)
+PROGRESS_COUNTERS_TTL = config('PROGRESS_COUNTERS_TTL', default=86400, cast=int)
+
+# Pre-rendered video catalog responses, keyed by the catalog version bumped on Video changes
+CATALOG_CACHE_TTL = config('CATALOG_CACHE_TTL', default=3600, cast=int)
+
+# Video view counts are buffered in Redis and written by `manage.py flush_view_counts`;
+# a flush that changed counts bumps the catalog version, so catalog views lag by at most this interval
+VIEW_COUNTS_FLUSH_INTERVAL = config('VIEW_COUNTS_FLUSH_INTERVAL', default=30, cast=int)
+
 # Session Configuration with Redis
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
@@ -237,6 +247,77 @@ REST_FRAMEWORK = {
     }
 }
 
+# GPT chat: hedged provider requests. When a provider has not answered within
+# its observed p50 latency * multiplier, the next provider is started in parallel.
+GPT_HEDGE_MAX_IN_FLIGHT = config('GPT_HEDGE_MAX_IN_FLIGHT', default=2, cast=int)  # 1 disables hedging
+GPT_HEDGE_P50_MULTIPLIER = config('GPT_HEDGE_P50_MULTIPLIER', default=1.5, cast=float)
+GPT_HEDGE_MIN_BUDGET = config('GPT_HEDGE_MIN_BUDGET', default=1.0, cast=float)  # seconds
+GPT_HEDGE_DEFAULT_BUDGET = config('GPT_HEDGE_DEFAULT_BUDGET', default=8.0, cast=float)  # seconds, before any samples
+
+# GPT provider health shared by all workers through Redis: EWMA latency and success
+# rate order the providers, and a circuit breaker skips failing or rate-limited ones.
+GPT_PROVIDER_EWMA_ALPHA = config('GPT_PROVIDER_EWMA_ALPHA', default=0.2, cast=float)
+GPT_PROVIDER_PRIOR_LATENCY = config('GPT_PROVIDER_PRIOR_LATENCY', default=5.0, cast=float)  # seconds, unobserved providers
+GPT_PROVIDER_TIMEOUT = config('GPT_PROVIDER_TIMEOUT', default=120, cast=int)  # seconds, also the half-open trial lock
+GPT_PROVIDER_HEALTH_TTL = config('GPT_PROVIDER_HEALTH_TTL', default=7 * 86400, cast=int)
+GPT_BREAKER_FAILURE_THRESHOLD = config('GPT_BREAKER_FAILURE_THRESHOLD', default=3, cast=int)  # consecutive failures
+GPT_BREAKER_BASE_BACKOFF = config('GPT_BREAKER_BASE_BACKOFF', default=30, cast=int)  # seconds, doubles on each reopen
+GPT_BREAKER_MAX_BACKOFF = config('GPT_BREAKER_MAX_BACKOFF', default=900, cast=int)
+
+# GPT startup warm-up: the ASGI server imports g4f and resolves providers in a background
+# thread; with GPT_WARMUP_PROBE every provider also gets a short request in parallel.
+GPT_WARMUP = config('GPT_WARMUP', default=True, cast=bool)
+GPT_WARMUP_PROBE = config('GPT_WARMUP_PROBE', default=False, cast=bool)
+GPT_WARMUP_TIMEOUT = config('GPT_WARMUP_TIMEOUT', default=10, cast=float)  # seconds per probe
+
+# Shared GPT service state (current/preferred provider, proxy flag, provider order, success
+# counters) lives in Redis; each worker caches it locally and drops the copy on pub/sub notice.
+GPT_STATE_CACHE_TTL = config('GPT_STATE_CACHE_TTL', default=5, cast=float)  # seconds
+GPT_STATE_PUBSUB = config('GPT_STATE_PUBSUB', default=True, cast=bool)
+
+# GPT chat context: only the latest turns are read from the database and sent to the
+# provider; older turns are folded into a stored per-conversation summary.
+CHAT_CONTEXT_MAX_TURNS = config('CHAT_CONTEXT_MAX_TURNS', default=20, cast=int)
+CHAT_CONTEXT_TOKEN_BUDGET = config('CHAT_CONTEXT_TOKEN_BUDGET', default=3000, cast=int)  # estimated tokens for recent turns
+CHAT_CONTEXT_SUMMARY_TOKENS = config('CHAT_CONTEXT_SUMMARY_TOKENS', default=500, cast=int)
+CHAT_CONTEXT_SUMMARY_LINES = config('CHAT_CONTEXT_SUMMARY_LINES', default=20, cast=int)  # older turns folded in at once
+
+# GPT chat response cache: repeated standalone questions are answered from Redis
+# (exact match on normalized text) or from a local MinHash index of past messages.
+CHAT_CACHE_ENABLED = config('CHAT_CACHE_ENABLED', default=True, cast=bool)
+CHAT_CACHE_TTL = config('CHAT_CACHE_TTL', default=86400, cast=int)  # seconds
+CHAT_CACHE_MAX_ENTRIES = config('CHAT_CACHE_MAX_ENTRIES', default=5000, cast=int)  # least recently used are evicted
+CHAT_CACHE_CONTEXT_TURNS = config('CHAT_CACHE_CONTEXT_TURNS', default=0, cast=int)  # 0: follow-up turns bypass the cache
+CHAT_CACHE_FUZZY = config('CHAT_CACHE_FUZZY', default=True, cast=bool)
+CHAT_CACHE_FUZZY_THRESHOLD = config('CHAT_CACHE_FUZZY_THRESHOLD', default=0.8, cast=float)  # estimated Jaccard similarity
+CHAT_CACHE_FUZZY_ROWS = config('CHAT_CACHE_FUZZY_ROWS', default=2000, cast=int)  # recent messages indexed on startup
+CHAT_CACHE_FUZZY_MAX_ENTRIES = config('CHAT_CACHE_FUZZY_MAX_ENTRIES', default=5000, cast=int)
+
+# GPT chat single-flight: identical concurrent prompts (same normalized text and context)
+# share one upstream call, within a worker and across workers through a Redis lock.
+CHAT_SINGLE_FLIGHT_ENABLED = config('CHAT_SINGLE_FLIGHT_ENABLED', default=True, cast=bool)
+CHAT_SINGLE_FLIGHT_LOCK_TTL = config('CHAT_SINGLE_FLIGHT_LOCK_TTL', default=180, cast=int)  # seconds, also the follower wait limit
+CHAT_SINGLE_FLIGHT_RESULT_TTL = config('CHAT_SINGLE_FLIGHT_RESULT_TTL', default=30, cast=int)  # seconds
+CHAT_SINGLE_FLIGHT_POLL_INTERVAL = config('CHAT_SINGLE_FLIGHT_POLL_INTERVAL', default=0.2, cast=float)  # seconds
+
+# GPT chat job queue: /api/chat/ with async_mode enqueues the request and returns a job id;
+# `manage.py chat_worker` processes the queue. 'memory' keeps jobs in-process (tests).
+CHAT_JOB_BACKEND = config('CHAT_JOB_BACKEND', default='redis')  # 'redis' or 'memory'
+CHAT_JOB_TTL = config('CHAT_JOB_TTL', default=3600, cast=int)  # seconds a job and its result are kept
+CHAT_WORKER_CONCURRENCY = config('CHAT_WORKER_CONCURRENCY', default=8, cast=int)
+# A worker without a heartbeat for this long is considered dead; its taken jobs are requeued
+CHAT_WORKER_HEARTBEAT_TTL = config('CHAT_WORKER_HEARTBEAT_TTL', default=30, cast=int)  # seconds
+GPT_PROVIDER_MAX_CONCURRENCY = config('GPT_PROVIDER_MAX_CONCURRENCY', default=4, cast=int)  # per process, 0 = unlimited
+# Requests over the limit wait for a slot; beyond these bounds the attempt moves on to the
+# next provider, and when every provider is saturated the client gets an immediate 429.
+GPT_PROVIDER_MAX_QUEUE = config('GPT_PROVIDER_MAX_QUEUE', default=8, cast=int)  # waiting requests per provider
+GPT_PROVIDER_QUEUE_TIMEOUT = config('GPT_PROVIDER_QUEUE_TIMEOUT', default=2.0, cast=float)  # seconds
+
+# WebSocket video catalog snapshot: the initial /ws/videos/ frame is encoded once per process
+# and shared by every connection; other processes' catalog changes are noticed via the
+# catalog version in Redis, checked at most once per interval.
+VIDEO_SNAPSHOT_CHECK_INTERVAL = config('VIDEO_SNAPSHOT_CHECK_INTERVAL', default=1.0, cast=float)  # seconds
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
@@ -1,14 +1,23 @@
+from functools import partial
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from .models import Video, UserProgress
 from .serializers import VideoSerializer
+from . import catalog_cache, progress_counters, video_snapshot
 
 
 @receiver(post_save, sender=Video)
 def video_saved(sender, instance, created, **kwargs):
     """Сигнал при сохранении видео"""
+    # Любое изменение видео (включая снятие с публикации) инвалидирует кэш каталога
+    # и снимок для WebSocket. После коммита: иначе параллельный запрос закэширует
+    # старые строки под новой версией
+    transaction.on_commit(catalog_cache.bump_version)
+    transaction.on_commit(video_snapshot.invalidate)
+    
     if not instance.is_published:
         return
         
@@ -38,6 +47,9 @@ def video_saved(sender, instance, created, **kwargs):
 @receiver(post_delete, sender=Video)
 def video_deleted(sender, instance, **kwargs):
     """Сигнал при удалении видео"""
+    transaction.on_commit(catalog_cache.bump_version)
+    transaction.on_commit(video_snapshot.invalidate)
+    
     channel_layer = get_channel_layer()
     
     async_to_sync(channel_layer.group_send)(
@@ -49,49 +61,79 @@ def video_deleted(sender, instance, **kwargs):
     )
 
 
+@receiver(post_save, sender=Video)
+def video_progress_counters(sender, instance, created, **kwargs):
+    """Обновление счетчиков прогресса при изменении категории или публикации видео
+
+    Счетчики в Redis меняются только после коммита: при откате транзакции
+    они не должны сохранить изменение. Это относится ко всем обработчикам ниже.
+    """
+    if created:
+        previous = None
+    elif hasattr(instance, '_loaded_publication'):
+        previous = instance._loaded_publication
+    else:
+        # Предыдущее состояние неизвестно - перестроим счетчики из БД
+        transaction.on_commit(progress_counters.invalidate)
+        return
+    
+    current = (instance.category_id, instance.is_published)
+    transaction.on_commit(partial(progress_counters.video_publication_changed, instance.id, previous, current))
+    instance._loaded_publication = current
+
+
+@receiver(post_delete, sender=Video)
+def video_deleted_progress_counters(sender, instance, **kwargs):
+    """Обновление счетчиков прогресса при удалении видео"""
+    if not hasattr(instance, '_loaded_publication'):
+        # Видео загружено без категории или публикации - строки уже нет, перестроим из БД
+        transaction.on_commit(progress_counters.invalidate)
+        return
+    transaction.on_commit(
+        partial(progress_counters.video_publication_changed, instance.id, instance._loaded_publication, None)
+    )
+
+
 @receiver(post_save, sender=UserProgress)
-def user_progress_updated(sender, instance, **kwargs):
+def user_progress_updated(sender, instance, created, **kwargs):
     """Сигнал при обновлении прогресса пользователя"""
-    channel_layer = get_channel_layer()
+    # Инкрементально обновляем счетчики завершенных видео
+    if created:
+        previous_completed = False
+    else:
+        previous_completed = getattr(instance, '_loaded_completed', None)
     
-    # Пересчитываем прогресс пользователя
-    progress_data = {}
-    categories = ['html_css', 'javascript', 'php', 'wordpress']
-    category_mapping = {
-        'html_css': 'html',
-        'javascript': 'js', 
-        'php': 'php',
-        'wordpress': 'wordpress'
-    }
+    if previous_completed is None:
+        update_counters = partial(progress_counters.invalidate, instance.user_id)
+    else:
+        delta = int(bool(instance.completed)) - int(bool(previous_completed))
+        update_counters = partial(progress_counters.progress_changed, instance.user_id, instance.video_id, delta)
+    instance._loaded_completed = instance.completed
+    user = instance.user
     
-    for db_category in categories:
-        api_key = category_mapping[db_category]
+    def notify():
+        update_counters()
+        # Прогресс читается из счетчиков в Redis без запросов к БД
+        progress_data = progress_counters.get_user_progress(user=user)
         
-        # Получаем все видео в категории
-        total_videos = Video.objects.filter(
-            category__name=db_category,
-            is_published=True
-        ).count()
-        
-        if total_videos > 0:
-            # Получаем просмотренные видео пользователем
-            watched_videos = UserProgress.objects.filter(
-                user=instance.user,
-                video__category__name=db_category,
-                video__is_published=True,
-                completed=True
-            ).count()
-            
-            progress_percentage = int((watched_videos / total_videos) * 100)
-            progress_data[api_key] = progress_percentage
-        else:
-            progress_data[api_key] = 0
+        # Отправляем обновленный прогресс пользователю
+        async_to_sync(get_channel_layer().group_send)(
+            f"progress_{user.id}",
+            {
+                "type": "progress_updated",
+                "progress": progress_data
+            }
+        )
     
-    # Отправляем обновленный прогресс пользователю
-    async_to_sync(channel_layer.group_send)(
-        f"progress_{instance.user.id}",
-        {
-            "type": "progress_updated",
-            "progress": progress_data
-        }
-    )
+    transaction.on_commit(notify)
+
+
+@receiver(post_delete, sender=UserProgress)
+def user_progress_deleted(sender, instance, **kwargs):
+    """Обновление счетчиков прогресса при удалении записи прогресса"""
+    if 'completed' not in instance.__dict__:
+        # Запись загружена через only()/defer() - строки уже нет, перестроим из БД
+        transaction.on_commit(partial(progress_counters.invalidate, instance.user_id))
+        return
+    if instance.completed:
+        transaction.on_commit(partial(progress_counters.progress_changed, instance.user_id, instance.video_id, -1))
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django_redis import get_redis_connection
+from . import chat_cache
+
+logger = logging.getLogger(__name__)
+
+# Ключи Redis (без KEY_PREFIX кэша - работаем с соединением напрямую)
+LOCK_KEY_TEMPLATE = 'learning_platform:chat_flight:lock:{key}'
+RESULT_KEY_TEMPLATE = 'learning_platform:chat_flight:result:{key}'
+
+LEADER = 'leader'
+LOCAL_FOLLOWER = 'local_follower'
+REMOTE_FOLLOWER = 'remote_follower'
+
+# Снять блокировку, только если она все еще наша (могла истечь и достаться другому)
+_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Запросы, выполняемые в этом процессе: ключ -> asyncio.Future с ответом GPT
+_in_flight = {}
+
+
+def _connection():
+    return get_redis_connection('default')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def flight_key(message, history, summary=''):
+    """Ключ одинаковых запросов: нормализованный вопрос + хэш контекста
+
+    Самостоятельные вопросы группируются так же, как в кэше ответов - без
+    учета истории; продолжения разговора - только при совпадающем контексте.
+    """
+    context = chat_cache.cache_context(message, history)
+    if context is None:
+        context = chat_cache.normalize(message), chat_cache.context_hash(history, summary)
+    normalized, ctx_hash = context
+    return hashlib.sha1(f'{ctx_hash}|{normalized}'.encode('utf-8')).hexdigest()
+
+
+def _try_lock(key, token):
+    return _connection().set(
+        LOCK_KEY_TEMPLATE.format(key=key), token,
+        nx=True, ex=_setting('CHAT_SINGLE_FLIGHT_LOCK_TTL', 180)
+    )
+
+
+def _poll(key):
+    """(ответ лидера или None, держит ли лидер блокировку)"""
+    pipe = _connection().pipeline(transaction=False)
+    pipe.get(RESULT_KEY_TEMPLATE.format(key=key))
+    pipe.exists(LOCK_KEY_TEMPLATE.format(key=key))
+    raw, locked = pipe.execute()
+    return (json.loads(raw) if raw is not None else None), bool(locked)
+
+
+def _publish_remote(key, token, result):
+    client = _connection()
+    if result is not None:
+        client.set(
+            RESULT_KEY_TEMPLATE.format(key=key),
+            json.dumps(result, ensure_ascii=False),
+            ex=_setting('CHAT_SINGLE_FLIGHT_RESULT_TTL', 30)
+        )
+    client.eval(_RELEASE_LOCK, 1, LOCK_KEY_TEMPLATE.format(key=key), token)
+
+
+class Flight:
+    """Участие запроса в общем обращении к провайдеру
+
+    Лидер выполняет запрос сам и обязан вызвать publish (в том числе с None
+    при ошибке или отмене - в finally). Последователи получают ответ лидера из
+    wait(); None значит, что лидер не справился или не ответил за
+    CHAT_SINGLE_FLIGHT_LOCK_TTL - запрос выполняется самостоятельно.
+    """
+
+    def __init__(self, key, role, future=None, token=None):
+        self.key = key
+        self.role = role
+        self.future = future
+        self.token = token
+        self.published = False
+
+    async def wait(self):
+        if self.role == LEADER:
+            return None
+
+        if self.role == LOCAL_FOLLOWER:
+            # shield: отмена одного ожидающего не отменяет общий Future
+            try:
+                result = await asyncio.wait_for(
+                    asyncio.shield(self.future), _setting('CHAT_SINGLE_FLIGHT_LOCK_TTL', 180)
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"[SINGLE-FLIGHT] {self.key[:12]}: ответ не дождались, запрашиваем сами")
+                result = None
+        else:
+            try:
+                result = await self._wait_remote()
+            except BaseException:
+                # Отмена: локальные ожидающие не должны ждать этот Future вечно
+                self._resolve_local(None)
+                raise
+            # Локальные ожидающие ждут этот же запрос: передаем ответ или лидерство
+            if result is None:
+                self.role = LEADER
+                return None
+            self._resolve_local(result)
+
+        if result is None:
+            self.role = None
+            return None
+        return {**result, 'coalesced': True}
+
+    async def _wait_remote(self):
+        poll = sync_to_async(_poll, thread_sensitive=False)
+        interval = _setting('CHAT_SINGLE_FLIGHT_POLL_INTERVAL', 0.2)
+        deadline = time.monotonic() + _setting('CHAT_SINGLE_FLIGHT_LOCK_TTL', 180)
+        while time.monotonic() < deadline:
+            try:
+                result, locked = await poll(self.key)
+            except Exception as e:
+                logger.warning(f"Не удалось получить ответ другого воркера: {e}")
+                return None
+            if result is not None:
+                return result
+            if not locked:
+                return None
+            await asyncio.sleep(interval)
+        return None
+
+    def _resolve_local(self, result):
+        if self.future is not None and not self.future.done():
+            self.future.set_result(result)
+        if _in_flight.get(self.key) is self.future:
+            del _in_flight[self.key]
+
+    async def publish(self, result):
+        """Отдать ответ ожидающим (лидер); повторные вызовы игнорируются"""
+        if self.role != LEADER or self.published:
+            return
+        self.published = True
+        self._resolve_local(result)
+        if self.token is None:
+            return
+        try:
+            await sync_to_async(_publish_remote, thread_sensitive=False)(self.key, self.token, result)
+        except Exception as e:
+            logger.warning(f"Не удалось передать ответ другим воркерам: {e}")
+
+
+async def join(key):
+    """Присоединиться к обращению с тем же ключом или стать лидером"""
+    if not _setting('CHAT_SINGLE_FLIGHT_ENABLED', True):
+        return Flight(key, LEADER)
+
+    loop = asyncio.get_running_loop()
+    future = _in_flight.get(key)
+    if future is not None and future.get_loop() is loop and not future.done():
+        return Flight(key, LOCAL_FOLLOWER, future)
+
+    future = loop.create_future()
+    _in_flight[key] = future
+    flight = Flight(key, LEADER, future)
+
+    token = uuid.uuid4().hex
+    try:
+        locked = await sync_to_async(_try_lock, thread_sensitive=False)(key, token)
+    except Exception as e:
+        logger.warning(f"Redis недоступен для объединения запросов: {e}")
+        return flight
+    except BaseException:
+        # Отменены до получения Flight: освобождаем Future для остальных
+        flight._resolve_local(None)
+        raise
+
+    if locked:
+        flight.token = token
+        return flight
+    logger.info(f"[SINGLE-FLIGHT] {key[:12]}: ждем ответ другого воркера")
+    flight.role = REMOTE_FOLLOWER
+    return flight
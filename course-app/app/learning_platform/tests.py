@@ -0,0 +1,440 @@
+import asyncio
+import json
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from .gpt_service import gpt_service
+from .management.commands.benchmark_format_response import GOLDEN_PATH
+from .management.commands.benchmark_serializers import benchmark_request, build_rows
+from .consumers import VideoConsumer
+from .models import Category, Favorite, UserProgress, Video
+from .pagination import KeysetPagination
+from .serializers import FastVideoSerializer, VideoSerializer
+from . import (
+    catalog_cache, chat_jobs, chat_service, progress_counters, provider_benchmark, provider_health, single_flight,
+    video_snapshot, view_counter,
+)
+
+
+class CatalogQueryCountTest(TestCase):
+    """Число запросов каталога не зависит от числа видео (нет N+1)
+
+    Видео создаются через bulk_create, без сигналов; перед каждым тестом
+    версия каталога повышается, чтобы ответы не брались из кэша в Redis.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = {
+            name: Category.objects.create(name=name)
+            for name, _ in Category.CATEGORY_CHOICES
+        }
+        cls.user = User.objects.create_user(username='catalog-test', password='test-password')
+
+    def setUp(self):
+        catalog_cache.bump_version()
+        video_snapshot.invalidate()
+        self.client = APIClient()
+
+    def create_videos(self, count):
+        categories = list(self.categories.values())
+        videos = Video.objects.bulk_create([
+            Video(
+                title=f'Урок {i}',
+                description='Описание',
+                video_url=f'https://www.youtube.com/watch?v=test{i}',
+                preview_image=f'previews/test_{i}.png',
+                category=categories[i % len(categories)],
+            )
+            for i in range(count)
+        ])
+        Favorite.objects.bulk_create([Favorite(user=self.user, video=video) for video in videos])
+        return videos
+
+    def assert_queries_per_size(self, expected, request):
+        for count in (1, 50):
+            with self.subTest(videos=count):
+                Video.objects.all().delete()
+                self.create_videos(count)
+                catalog_cache.bump_version()
+                with self.assertNumQueries(expected):
+                    response = request()
+                self.assertEqual(response.status_code, 200)
+
+    def test_video_list(self):
+        # Страница каталога и COUNT для пагинации
+        self.assert_queries_per_size(2, lambda: self.client.get('/api/videos/'))
+
+    def test_videos_by_category(self):
+        self.assert_queries_per_size(1, lambda: self.client.get('/api/videos/category/js/'))
+
+    def test_recent_videos(self):
+        self.assert_queries_per_size(1, lambda: self.client.get('/api/videos/recent/'))
+
+    def test_user_favorites(self):
+        self.client.force_authenticate(self.user)
+        # Агрегат избранного для ETag и избранные видео вместе с категориями
+        self.assert_queries_per_size(2, lambda: self.client.get('/api/favorites/'))
+
+    def test_unknown_category_is_not_found(self):
+        etag = self.client.get('/api/videos/category/js/')['ETag']
+        response = self.client.get('/api/videos/category/unknown/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_not_modified_is_throttled(self):
+        etag = self.client.get('/api/videos/recent/')['ETag']
+        self.assertEqual(self.client.get('/api/videos/recent/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with mock.patch('rest_framework.throttling.AnonRateThrottle.allow_request', return_value=False), \
+                mock.patch('rest_framework.throttling.AnonRateThrottle.wait', return_value=60):
+            response = self.client.get('/api/videos/recent/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 429)
+
+    def test_consumer_initial_data(self):
+        for count in (1, 50):
+            with self.subTest(videos=count):
+                Video.objects.all().delete()
+                self.create_videos(count)
+                with self.assertNumQueries(1):
+                    data = async_to_sync(video_snapshot.build_initial_data)()
+                self.assertEqual(len(data['recent_videos']), min(count, video_snapshot.RECENT_VIDEOS_LIMIT))
+
+
+class FastVideoSerializerTest(SimpleTestCase):
+    """Быстрый сериализатор отдает те же байты, что и VideoSerializer"""
+
+    @override_settings(ALLOWED_HOSTS=['localhost', '127.0.0.1'])
+    def test_output_is_byte_identical(self):
+        instances, rows = build_rows(50)
+        context = {'request': benchmark_request()}
+        renderer = JSONRenderer()
+        self.assertEqual(
+            renderer.render(FastVideoSerializer(rows, many=True, context=context).data),
+            renderer.render(VideoSerializer(instances, many=True, context=context).data),
+        )
+
+
+class FormatResponseGoldenTest(SimpleTestCase):
+    """format_response совпадает с эталонным корпусом"""
+
+    def test_golden_cases(self):
+        cases = json.loads(GOLDEN_PATH.read_text(encoding='utf-8'))
+        self.assertTrue(cases)
+        for case in cases:
+            with self.subTest(case=case['name']):
+                self.assertEqual(gpt_service.format_response(case['input']), case['expected'])
+
+
+class CatalogCacheTest(TestCase):
+    """Ключи кэша каталога и момент смены его версии"""
+
+    def setUp(self):
+        catalog_cache.bump_version()
+        self.client = APIClient()
+
+    def cached_keys(self, endpoint):
+        pattern = catalog_cache.RESPONSE_KEY_TEMPLATE.format(
+            version=catalog_cache.get_version(), endpoint=endpoint, variant='*'
+        )
+        return catalog_cache._connection().keys(pattern)
+
+    def test_unknown_query_params_do_not_create_entries(self):
+        self.client.get('/api/videos/recent/')
+        for i in range(5):
+            self.assertEqual(self.client.get(f'/api/videos/recent/?junk={i}').status_code, 200)
+        self.assertEqual(len(self.cached_keys('recent_videos')), 1)
+
+        self.client.get('/api/videos/category/js/?limit=5')
+        self.client.get('/api/videos/category/js/?limit=5&junk=1')
+        self.assertEqual(len(self.cached_keys('videos_by_category')), 1)
+
+    def test_version_bumped_after_commit(self):
+        version = catalog_cache.get_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(
+                title='Урок', description='Описание', video_url='https://www.youtube.com/watch?v=commit',
+                preview_image='previews/commit.png', category=Category.objects.create(name='javascript'),
+            )
+            self.assertEqual(catalog_cache.get_version(), version)
+        self.assertGreater(catalog_cache.get_version(), version)
+
+    def test_snapshot_invalidated_after_commit(self):
+        async_to_sync(video_snapshot.get_initial_frame)()
+        generation = video_snapshot._generation
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(
+                title='Урок', description='Описание', video_url='https://www.youtube.com/watch?v=snapshot',
+                preview_image='previews/snapshot.png', category=Category.objects.create(name='wordpress'),
+            )
+            self.assertEqual(video_snapshot._generation, generation)
+        self.assertIsNone(video_snapshot._snapshot)
+        self.assertGreater(video_snapshot._generation, generation)
+
+
+class VideoConsumerCursorTest(TestCase):
+    """Некорректный курсор из WebSocket - ошибка клиенту, а не падение потребителя"""
+
+    def test_malformed_cursor(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(VideoConsumer.as_asgi(), '/ws/videos/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.receive_output()  # начальные данные
+
+            for cursor in (5, {'created_at': 'x'}, 'не-base64'):
+                with self.subTest(cursor=cursor):
+                    await communicator.send_json_to({'type': 'request_videos', 'category': 'js', 'cursor': cursor})
+                    response = await communicator.receive_json_from()
+                    self.assertEqual(response, {
+                        'type': 'error', 'message': KeysetPagination.invalid_cursor_message
+                    })
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+
+class ProgressCountersDeferredTest(TestCase):
+    """Счетчики прогресса меняются после коммита и не искажаются моделями из only()"""
+
+    def setUp(self):
+        progress_counters.invalidate()
+        self.user = User.objects.create_user(username='progress-test', password='test-password')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.video = Video.objects.create(
+                title='Урок', description='Описание', video_url='https://www.youtube.com/watch?v=deferred',
+                preview_image='previews/deferred.png', category=Category.objects.create(name='php'),
+            )
+
+    def test_video_saved_without_publication_fields(self):
+        self.assertEqual(progress_counters.get_category_stats()['php']['total'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            video = Video.objects.only('id', 'title').get(pk=self.video.pk)
+            video.title = 'Новое название'
+            video.save()
+        self.assertEqual(progress_counters.get_category_stats()['php']['total'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.only('id').get(pk=self.video.pk).delete()
+        self.assertEqual(progress_counters.get_category_stats()['php']['total'], 0)
+
+    def test_progress_saved_without_completed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            UserProgress.objects.create(user=self.user, video=self.video, completed=True)
+        self.assertEqual(progress_counters.get_category_stats(user=self.user)['php']['watched'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            progress = UserProgress.objects.only('id', 'user', 'video', 'progress_percentage').get(user=self.user)
+            progress.progress_percentage = 50.0
+            progress.save()
+        self.assertEqual(progress_counters.get_category_stats(user=self.user)['php']['watched'], 1)
+
+    def test_rolled_back_change_keeps_counters(self):
+        self.assertEqual(progress_counters.get_category_stats(user=self.user)['php']['watched'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    UserProgress.objects.create(user=self.user, video=self.video, completed=True)
+                    raise RuntimeError('откат')
+            except RuntimeError:
+                pass
+        self.assertEqual(progress_counters.get_category_stats(user=self.user)['php']['watched'], 0)
+
+
+class ViewCounterFlushTest(TestCase):
+    """Сброс просмотров из Redis в БД"""
+
+    def setUp(self):
+        view_counter._connection().delete(view_counter.PENDING_KEY, view_counter.FLUSHING_KEY,
+                                          view_counter.FLUSH_BATCH_KEY)
+        self.video = Video.objects.create(
+            title='Урок', description='Описание', video_url='https://www.youtube.com/watch?v=views',
+            preview_image='previews/views.png', category=Category.objects.create(name='python'),
+        )
+
+    def test_flush_bumps_catalog_version(self):
+        view_counter.record_view(self.video.id)
+        view_counter.record_view(self.video.id)
+        version = catalog_cache.get_version()
+
+        self.assertEqual(view_counter.flush(), 1)
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.views, 2)
+        self.assertGreater(catalog_cache.get_version(), version)
+
+    def test_flush_after_crash_does_not_apply_batch_twice(self):
+        view_counter.record_view(self.video.id)
+        view_counter.record_view(self.video.id)
+        client = view_counter._connection()
+        # Сброс упал после коммита UPDATE, но до удаления пачки из Redis
+        client.rename(view_counter.PENDING_KEY, view_counter.FLUSHING_KEY)
+        client.set(view_counter.FLUSH_BATCH_KEY, 'crashed-batch')
+        view_counter._increment_in_db({self.video.id: 2}, 'crashed-batch')
+
+        self.assertEqual(view_counter.flush(), 0)
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.views, 2)
+        self.assertFalse(client.exists(view_counter.FLUSHING_KEY, view_counter.FLUSH_BATCH_KEY))
+
+        view_counter.record_view(self.video.id)
+        self.assertEqual(view_counter.flush(), 1)
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.views, 3)
+
+    def test_fallback_write_bumps_catalog_version(self):
+        version = catalog_cache.get_version()
+        with mock.patch.object(view_counter, '_connection', side_effect=ConnectionError('Redis недоступен')):
+            view_counter.record_view(self.video.id)
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.views, 1)
+        self.assertGreater(catalog_cache.get_version(), version)
+
+    def test_empty_flush_keeps_catalog_version(self):
+        version = catalog_cache.get_version()
+        self.assertEqual(view_counter.flush(), 0)
+        self.assertEqual(catalog_cache.get_version(), version)
+
+
+class ProviderTrialTest(TestCase):
+    """Пробный запрос полуоткрытого автомата освобождает только его владелец"""
+
+    def setUp(self):
+        provider_health.reset(['TrialProvider'])
+        self.addCleanup(provider_health.reset, ['TrialProvider'])
+        self.trial_key = provider_health.TRIAL_KEY_TEMPLATE.format(provider='TrialProvider')
+
+    def half_open_health(self):
+        return {'state': provider_health.OPEN, 'open_until': 0}
+
+    def test_only_trial_holder_releases_trial(self):
+        trial = self.half_open_health()
+        self.assertTrue(provider_health.acquire('TrialProvider', trial))
+        self.assertFalse(provider_health.acquire('TrialProvider', self.half_open_health()))
+
+        # Исход запроса другого воркера, начатого до открытия автомата
+        provider_health.record('TrialProvider', provider_health.FAILURE, 1.0, {})
+        self.assertTrue(provider_health._connection().exists(self.trial_key))
+
+        provider_health.record('TrialProvider', provider_health.SUCCESS, 1.0, trial)
+        self.assertFalse(provider_health._connection().exists(self.trial_key))
+
+    def test_release_without_outcome(self):
+        trial = self.half_open_health()
+        self.assertTrue(provider_health.acquire('TrialProvider', trial))
+        provider_health.release('TrialProvider', trial)
+        self.assertTrue(provider_health.acquire('TrialProvider', self.half_open_health()))
+
+
+    @override_settings(GPT_HEDGE_DEFAULT_BUDGET=0.05)
+    def test_cancelled_hedge_releases_trial(self):
+        provider_health.reset(['FastProvider'])
+        self.addCleanup(provider_health.reset, ['FastProvider'])
+        # Автомат TrialProvider открыт, пауза истекла: первая попытка станет пробной
+        provider_health.record('TrialProvider', provider_health.RATE_LIMITED, 1.0)
+        provider_health._connection().hset(provider_health._health_key('TrialProvider'), 'open_until', 0)
+
+        backend = provider_benchmark.FakeBackend([
+            provider_benchmark.ProviderProfile('TrialProvider', latency=5.0, jitter=0),
+            provider_benchmark.ProviderProfile('FastProvider', latency=0.01, jitter=0),
+        ])
+        service = provider_benchmark.BenchmarkGPTService(backend)
+        service.preferred_provider = 'TrialProvider'
+
+        response = async_to_sync(service.get_response_async)('Вопрос')
+        self.assertEqual(response['provider_used'], 'FastProvider')
+        self.assertEqual(backend.outcomes['TrialProvider']['cancelled'], 1)
+        self.assertFalse(provider_health._connection().exists(self.trial_key))
+
+
+@override_settings(CHAT_JOB_BACKEND='memory')
+class ChatJobMemoryBackendTest(TestCase):
+    """Очередь задач чата в памяти: постановка, опрос и выполнение WorkerPool"""
+
+    def setUp(self):
+        chat_jobs._backend = None
+        self.addCleanup(setattr, chat_jobs, '_backend', None)
+        self.client = APIClient()
+        handle_message = mock.patch.object(
+            chat_jobs.chat_service, 'handle_message',
+            new=mock.AsyncMock(return_value=(200, {'success': True, 'response': 'Ответ'}))
+        )
+        self.handle_message = handle_message.start()
+        self.addCleanup(handle_message.stop)
+
+    def run_worker(self, max_jobs):
+        pool = chat_jobs.WorkerPool(concurrency=2, poll_timeout=0.1)
+        async_to_sync(pool.run)(max_jobs=max_jobs)
+        return pool
+
+    def test_anonymous_job_is_polled_by_poll_url(self):
+        response = self.client.post('/api/chat/', {'message': 'Что такое замыкание?', 'async_mode': True},
+                                    format='json')
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertIsInstance(chat_jobs.get_backend(), chat_jobs.InMemoryJobQueue)
+
+        # poll_url уже содержит session_id анонимного автора
+        self.assertEqual(self.client.get(job['poll_url']).status_code, 202)
+        self.assertEqual(self.client.get(f"/api/chat/jobs/{job['job_id']}/").status_code, 404)
+
+        self.assertEqual(self.run_worker(max_jobs=1).processed, 1)
+        self.handle_message.assert_awaited_once_with(None, 'Что такое замыкание?', job['session_id'])
+
+        result = self.client.get(job['poll_url'])
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.json()['result'], {'success': True, 'response': 'Ответ'})
+
+    def test_done_job_is_not_run_again(self):
+        job = chat_jobs.create_job(None, 'Вопрос')
+        self.run_worker(max_jobs=1)
+
+        # Та же задача снова в очереди, как после возврата из списка обработки упавшего воркера
+        chat_jobs.get_backend().push(chat_jobs.get_job(job['id']))
+        self.run_worker(max_jobs=1)
+        self.assertEqual(self.handle_message.await_count, 1)
+        self.assertEqual(chat_jobs.get_job(job['id'])['status'], chat_jobs.DONE)
+
+
+class SingleFlightCancelTest(TestCase):
+    """Отмена запроса, владеющего общим Future, не оставляет остальных ждать вечно"""
+
+    def setUp(self):
+        self.message = 'Что такое single flight?'
+        self.key = single_flight.flight_key(self.message, [])
+        self.lock_key = single_flight.LOCK_KEY_TEMPLATE.format(key=self.key)
+        single_flight._connection().delete(self.lock_key, single_flight.RESULT_KEY_TEMPLATE.format(key=self.key))
+        self.addCleanup(single_flight._connection().delete, self.lock_key)
+
+    def test_local_follower_completes_after_owner_is_cancelled(self):
+        answer = {'success': True, 'response': 'Ответ'}
+        # Тот же запрос выполняет другой воркер: первый запрос процесса ждет его ответа
+        single_flight._connection().set(self.lock_key, 'other-worker')
+
+        async def scenario():
+            owner = asyncio.create_task(chat_service._coalesced_response(self.message, [], ''))
+            await asyncio.sleep(0.05)
+            follower = asyncio.create_task(chat_service._coalesced_response(self.message, [], ''))
+            await asyncio.sleep(0.05)
+
+            # Как при закрытии WebSocket посреди ответа
+            owner.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await owner
+            self.assertEqual(await asyncio.wait_for(follower, 5), answer)
+
+            # Следующий такой же запрос не ждет Future отмененного запроса
+            single_flight._connection().delete(self.lock_key)
+            self.assertEqual(
+                await asyncio.wait_for(chat_service._coalesced_response(self.message, [], ''), 5), answer
+            )
+
+        with mock.patch.object(chat_service.gpt_service, 'get_response_async',
+                               new=mock.AsyncMock(return_value=answer)):
+            async_to_sync(scenario)()
+        self.assertNotIn(self.key, single_flight._in_flight)
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import logging
+import time
+import weakref
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from . import catalog_cache
+from .models import Video
+from .progress_service import API_CATEGORY_KEYS, CATEGORY_MAP
+from .serializers import FastVideoSerializer
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних видео получает клиент
+RECENT_VIDEOS_LIMIT = 10
+
+# Готовый кадр начальных данных: {'version', 'checked_at', 'frame'} или None
+_snapshot = None
+# Растет при каждой инвалидации: снимок, начатый до нее, не сохраняется
+_generation = 0
+# Блокировки перестроения: цикл событий -> asyncio.Lock
+_build_locks = weakref.WeakKeyDictionary()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def invalidate():
+    """Сбросить снимок (вызывается сигналами изменения видео)"""
+    global _snapshot, _generation
+    _generation += 1
+    _snapshot = None
+
+
+async def build_initial_data():
+    """Последние видео и видео всех категорий одним запросом к каталогу
+
+    Каталог уже отсортирован от новых к старым: последние видео - его
+    начало, списки категорий - те же строки, разложенные по категориям.
+    """
+    videos = Video.objects.catalog().values(*FastVideoSerializer.values_fields)
+    rows = [row async for row in videos]
+    serialized = FastVideoSerializer(rows, many=True).data
+
+    categories = {category: [] for category in CATEGORY_MAP}
+    for row, video in zip(rows, serialized):
+        category = API_CATEGORY_KEYS.get(row['category__name'])
+        if category in categories:
+            categories[category].append(video)
+
+    return {
+        'type': 'initial_data',
+        'recent_videos': serialized[:RECENT_VIDEOS_LIMIT],
+        'categories': categories
+    }
+
+
+async def _catalog_version():
+    try:
+        return await sync_to_async(catalog_cache.get_version, thread_sensitive=False)()
+    except Exception as e:
+        logger.warning(f"Версия каталога недоступна, снимок будет перестроен: {e}")
+        return None
+
+
+def _is_fresh(snapshot):
+    interval = _setting('VIDEO_SNAPSHOT_CHECK_INTERVAL', 1.0)
+    return snapshot is not None and time.monotonic() - snapshot['checked_at'] < interval
+
+
+async def get_initial_frame():
+    """Начальные данные VideoConsumer - готовый JSON в байтах
+
+    Снимок общий для всех подключений процесса. Изменения в этом процессе
+    сбрасывают его через сигналы, изменения из других процессов замечаются по
+    версии каталога в Redis (сверяется не чаще раза в
+    VIDEO_SNAPSHOT_CHECK_INTERVAL секунд). Одновременные подключения ждут
+    одного перестроения вместо того, чтобы строить снимок каждое само.
+    """
+    global _snapshot
+    if _is_fresh(_snapshot):
+        return _snapshot['frame']
+
+    loop = asyncio.get_running_loop()
+    if loop not in _build_locks:
+        _build_locks[loop] = asyncio.Lock()
+
+    async with _build_locks[loop]:
+        snapshot = _snapshot
+        if _is_fresh(snapshot):
+            return snapshot['frame']
+
+        generation = _generation
+        version = await _catalog_version()
+        if snapshot is not None and version is not None and version == snapshot['version']:
+            if generation == _generation:
+                _snapshot = {**snapshot, 'checked_at': time.monotonic()}
+            return snapshot['frame']
+
+        started = time.monotonic()
+        frame = json.dumps(await build_initial_data()).encode('utf-8')
+        if generation == _generation:
+            _snapshot = {'version': version, 'checked_at': time.monotonic(), 'frame': frame}
+        logger.info(f"Снимок каталога для WebSocket перестроен: версия {version}, "
+                    f"{len(frame)} байт за {round(time.monotonic() - started, 3)}с")
+        return frame
@@ -0,0 +1,112 @@
+import logging
+import uuid
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+from . import catalog_cache
+from .models import Video, ViewCountFlush
+
+logger = logging.getLogger(__name__)
+
+# Ключи Redis (без KEY_PREFIX кэша - работаем с соединением напрямую)
+PENDING_KEY = 'learning_platform:views:pending'
+FLUSHING_KEY = 'learning_platform:views:flushing'
+FLUSH_LOCK_KEY = 'learning_platform:views:flush-lock'
+# ID пачки в FLUSHING_KEY: по нему повторный сброс узнает уже примененную пачку
+FLUSH_BATCH_KEY = 'learning_platform:views:flushing-batch'
+
+# Сколько хранить записи о примененных пачках
+FLUSH_HISTORY = timedelta(days=1)
+
+
+def _connection():
+    return get_redis_connection('default')
+
+
+def _increment_in_db(counts, batch_id=None):
+    """Один UPDATE ... CASE на все видео; без save(), поэтому без сигналов и updated_at
+
+    С batch_id пачка отмечается примененной в той же транзакции.
+    """
+    if not counts:
+        return 0
+    increments = Case(
+        *[When(pk=video_id, then=Value(count)) for video_id, count in counts.items()],
+        default=Value(0),
+        output_field=PositiveIntegerField()
+    )
+    with transaction.atomic():
+        if batch_id is not None:
+            ViewCountFlush.objects.create(batch_id=batch_id)
+        return Video.objects.filter(pk__in=counts.keys()).update(views=F('views') + increments)
+
+
+def record_view(video_id):
+    """Учесть просмотр видео: счетчик копится в Redis и периодически сбрасывается в БД"""
+    try:
+        _connection().hincrby(PENDING_KEY, video_id, 1)
+    except Exception as e:
+        # Без Redis увеличиваем счетчик атомарно прямо в БД
+        logger.warning(f"Буфер просмотров в Redis недоступен: {e}")
+        if _increment_in_db({video_id: 1}):
+            # Как после flush(): закэшированные ответы каталога показывают старые просмотры
+            catalog_cache.bump_version()
+
+
+def _read_counts(client, key):
+    counts = {}
+    for video_id, count in client.hgetall(key).items():
+        counts[int(video_id)] = int(count)
+    return counts
+
+
+def flush():
+    """Перенести накопленные просмотры в БД; возвращает число обновленных видео"""
+    client = _connection()
+    lock = client.lock(FLUSH_LOCK_KEY, timeout=60, blocking=False)
+    if not lock.acquire():
+        logger.info("Сброс просмотров уже выполняется другим процессом")
+        return 0
+
+    try:
+        # Ключ FLUSHING_KEY остается после сбоя предыдущего сброса - дописываем его первым
+        if not client.exists(FLUSHING_KEY):
+            try:
+                client.rename(PENDING_KEY, FLUSHING_KEY)
+            except ResponseError:
+                # Нет накопленных просмотров
+                return 0
+
+        # Сбой между RENAME и SET оставляет пачку без ID - она еще не применялась
+        client.set(FLUSH_BATCH_KEY, uuid.uuid4().hex, nx=True)
+        batch_id = client.get(FLUSH_BATCH_KEY)
+        batch_id = batch_id.decode() if isinstance(batch_id, bytes) else batch_id
+
+        counts = _read_counts(client, FLUSHING_KEY)
+        if ViewCountFlush.objects.filter(batch_id=batch_id).exists():
+            # Предыдущий сброс упал после коммита, но до удаления пачки из Redis
+            logger.warning(f"Пачка просмотров {batch_id} уже перенесена в БД, удаляем ее")
+            updated = 0
+            catalog_cache.bump_version()
+        else:
+            updated = _increment_in_db(counts, batch_id)
+        client.delete(FLUSHING_KEY, FLUSH_BATCH_KEY)
+        ViewCountFlush.objects.filter(applied_at__lt=timezone.now() - FLUSH_HISTORY).delete()
+        if updated:
+            # Просмотры входят в ответы каталога и его ETag - закэшированные ответы устарели
+            catalog_cache.bump_version()
+            logger.info(f"Сброшены просмотры {sum(counts.values())} для {updated} видео")
+        return updated
+    finally:
+        try:
+            lock.release()
+        except Exception:
+            pass
+
+
+def get_pending_count():
+    """Число видео с несброшенными просмотрами"""
+    return _connection().hlen(PENDING_KEY)
@@ -1,16 +1,32 @@
 
-from rest_framework import generics, status
-from rest_framework.decorators import api_view
+from rest_framework import exceptions, generics, status
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.decorators import api_view, throttle_classes
 from rest_framework.response import Response
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import urlencode
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from django.db import transaction
 from django.db.models import Q, Count
-from django.conf import settings
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync, sync_to_async
 from .models import Category, Video, UserProgress, Favorite, ChatMessage
-from .serializers import CategorySerializer, VideoSerializer, UserProgressSerializer, ChatMessageSerializer, ChatRequestSerializer
+from .serializers import CategorySerializer, VideoSerializer, FastVideoSerializer, UserProgressSerializer, ChatMessageSerializer, ChatRequestSerializer, ProgressSyncSerializer
 from .gpt_service import gpt_service
-import uuid
+from .pagination import KeysetPagination
+from .chat_context import summary_queryset
+from . import catalog_cache, chat_jobs, chat_service, progress_counters, progress_service, view_counter
+from .conditional import (
+    revalidate, catalog_etag, catalog_last_modified, favorites_etag,
+    progress_etag, chat_history_etag, chat_history_last_modified
+)
 import json
+import logging
+import math
+
+logger = logging.getLogger(__name__)
 
 # API для получения списка провайдеров (для фронта)
 @api_view(['GET'])
@@ -25,44 +41,72 @@ def provider_info(request):
             'details': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@method_decorator(revalidate(catalog_etag, catalog_last_modified), name='get')
 class VideoListView(generics.ListAPIView):
-    serializer_class = VideoSerializer
+    serializer_class = FastVideoSerializer
     
     def get_queryset(self):
-        return Video.objects.filter(is_published=True).order_by('-created_at')
+        return Video.objects.catalog().values(*FastVideoSerializer.values_fields)
+    
+    def list(self, request, *args, **kwargs):
+        parent_list = super().list
+        return catalog_cache.cached_response(
+            'video_list', request, lambda: parent_list(request, *args, **kwargs).data,
+            params=(self.paginator.page_query_param,)
+        )
 
+@method_decorator(revalidate(catalog_etag, catalog_last_modified), name='get')
 class VideoDetailView(generics.RetrieveAPIView):
-    queryset = Video.objects.filter(is_published=True)
+    queryset = Video.objects.catalog()
     serializer_class = VideoSerializer
+    
+    def retrieve(self, request, *args, **kwargs):
+        parent_retrieve = super().retrieve
+        return catalog_cache.cached_response(
+            'video_detail', request, lambda: parent_retrieve(request, *args, **kwargs).data
+        )
 
 @api_view(['GET'])
 def videos_by_category(request, category):
     """Получить видео по категории learning_platform"""
-    category_map = {
-        'html': 'html_css',
-        'js': 'javascript', 
-        'php': 'php',
-        'wordpress': 'wordpress'
-    }
+    # Категория проверяется до валидаторов: иначе на неизвестную категорию пришел бы 304
+    if category not in progress_service.CATEGORY_MAP:
+        return Response({'error': 'Invalid category'}, status=404)
     
-    if category not in category_map:
-        return Response({'error': 'Invalid category'}, status=400)
-    
-    db_category = category_map[category]
-    videos = Video.objects.filter(
-        category__name=db_category,
-        is_published=True
-    ).order_by('-created_at')
+    return _category_videos(request, progress_service.CATEGORY_MAP[category])
+
+@revalidate(catalog_etag, catalog_last_modified)
+def _category_videos(request, db_category):
+    def render():
+        videos = Video.objects.catalog(db_category)
+        
+        # Постраничная выдача по курсору, если клиент передал cursor/limit
+        paginator = KeysetPagination()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(
+                videos.values(*FastVideoSerializer.values_fields), request
+            )
+            serializer = FastVideoSerializer(page, many=True, context={'request': request})
+            return paginator.get_paginated_data(serializer.data)
+        
+        serializer = FastVideoSerializer(videos, many=True, context={'request': request})
+        return serializer.data
     
-    serializer = VideoSerializer(videos, many=True, context={'request': request})
-    return Response(serializer.data)
+    return catalog_cache.cached_response(
+        'videos_by_category', request, render,
+        params=(KeysetPagination.cursor_query_param, KeysetPagination.limit_query_param)
+    )
 
 @api_view(['GET'])
+@revalidate(catalog_etag, catalog_last_modified)
 def recent_videos(request):
     """Получить последние видео"""
-    recent = Video.objects.filter(is_published=True).order_by('-created_at')[:10]
-    serializer = VideoSerializer(recent, many=True, context={'request': request})
-    return Response(serializer.data)
+    def render():
+        recent = Video.objects.catalog()[:10]
+        serializer = FastVideoSerializer(recent, many=True, context={'request': request})
+        return serializer.data
+    
+    return catalog_cache.cached_response('recent_videos', request, render)
 
 @api_view(['POST'])
 def mark_video_watched(request):
@@ -79,7 +123,7 @@ def mark_video_watched(request):
         return Response({'error': 'Invalid video_id format'}, status=400)
     
     try:
-        video = Video.objects.get(id=video_id, is_published=True)
+        video = Video.objects.published().only('id').get(id=video_id)
         
         if request.user.is_authenticated:
             progress, created = UserProgress.objects.get_or_create(
@@ -92,27 +136,17 @@ def mark_video_watched(request):
                 progress.progress_percentage = 100.0
                 progress.save()
         
-        # Увеличиваем счетчик просмотров
-        video.views += 1
-        video.save()
+        # Увеличиваем счетчик просмотров в буфере Redis: без save() и сигналов каталога
+        view_counter.record_view(video.id)
         
         return Response({'success': True, 'message': 'Video marked as watched'})
     except Video.DoesNotExist:
         return Response({'error': 'Video not found'}, status=404)
 
 @api_view(['GET', 'POST'])
+@revalidate(progress_etag, private=True)
 def user_progress(request):
     """Получить прогресс пользователя по категориям"""
-    progress_data = {}
-    
-    categories = ['html_css', 'javascript', 'php', 'wordpress']
-    category_mapping = {
-        'html_css': 'html',
-        'javascript': 'js', 
-        'php': 'php',
-        'wordpress': 'wordpress'
-    }
-    
     # Получаем локальные данные о просмотренных видео (для неаутентифицированных пользователей)
     local_watched_videos = []
     if request.method == 'POST':
@@ -120,92 +154,108 @@ def user_progress(request):
     elif request.method == 'GET':
         local_watched_videos = request.GET.getlist('watched_videos')
     
-    # Преобразуем в список строк
-    local_watched_videos = [str(vid_id) for vid_id in local_watched_videos]
+    if request.user.is_authenticated:
+        # Счетчики из Redis, перестраиваются из БД при отсутствии
+        stats = progress_counters.get_category_stats(user=request.user)
+    else:
+        # Итоги из Redis, просмотренные - один HMGET по закэшированному списку опубликованных видео
+        stats = progress_counters.get_category_stats(watched_video_ids=local_watched_videos)
     
-    for db_category in categories:
-        api_key = category_mapping[db_category]
+    return Response({
+        'progress': progress_service.get_progress_percentages(stats),
+        'total_videos': {api_key: counts['total'] for api_key, counts in stats.items()}
+    })
+
+def _merge_local_history(user, watched, favorites):
+    """Добавить в аккаунт просмотры и избранное, которых в нем еще нет
+
+    Уже завершенные просмотры не трогаются (last_watched и порядок "недавних"
+    сохраняются). Счетчики сбрасываются, только если что-то изменилось.
+    """
+    watched, favorites = list(watched), list(favorites)
+    with transaction.atomic():
+        existing = dict(
+            UserProgress.objects.filter(user=user, video_id__in=watched).values_list('video_id', 'completed')
+        )
+        new_watched = [video_id for video_id in watched if video_id not in existing]
+        UserProgress.objects.bulk_create(
+            [
+                UserProgress(user=user, video_id=video_id, completed=True, progress_percentage=100.0)
+                for video_id in new_watched
+            ],
+            ignore_conflicts=True
+        )
+        # update() не трогает last_watched (auto_now срабатывает только в save)
+        completed = UserProgress.objects.filter(
+            user=user, video_id__in=[video_id for video_id, done in existing.items() if not done], completed=False
+        ).update(completed=True, progress_percentage=100.0)
         
-        # Получаем все видео в категории
-        total_videos = Video.objects.filter(
-            category__name=db_category,
-            is_published=True
-        ).count()
+        existing_favorites = set(
+            Favorite.objects.filter(user=user, video_id__in=favorites).values_list('video_id', flat=True)
+        )
+        new_favorites = [video_id for video_id in favorites if video_id not in existing_favorites]
+        Favorite.objects.bulk_create(
+            [Favorite(user=user, video_id=video_id) for video_id in new_favorites],
+            ignore_conflicts=True
+        )
+    
+    synced = {'watched_videos': len(new_watched) + completed, 'favorites': len(new_favorites)}
+    if synced['watched_videos']:
+        # bulk_create и update не вызывают сигналы: счетчики перестроятся при чтении
+        progress_counters.invalidate(user.id)
+    return synced
+
+@api_view(['POST'])
+def sync_progress(request):
+    """Слить локальную историю просмотров и избранное с аккаунтом за один запрос"""
+    serializer = ProgressSyncSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=400)
+    
+    # Неопубликованные и несуществующие ID отбрасываются без запросов к БД
+    watched = progress_counters.published_categories(serializer.validated_data['watched_videos'])
+    favorites = progress_counters.published_categories(serializer.validated_data['favorites'])
+    synced = {'watched_videos': 0, 'favorites': 0}
+    
+    if request.user.is_authenticated:
+        # Слияние - один раз на аккаунт в браузере; дальше история только на сервере,
+        # иначе удаленное на другом устройстве избранное возвращалось бы обратно
+        if serializer.validated_data['synced_user'] != str(request.user.id):
+            synced = _merge_local_history(request.user, watched, favorites)
         
-        if total_videos > 0:
-            if request.user.is_authenticated:
-                # Получаем просмотренные видео пользователем из базы
-                watched_videos = UserProgress.objects.filter(
-                    user=request.user,
-                    video__category__name=db_category,
-                    video__is_published=True,
-                    completed=True
-                ).count()
-            else:
-                # Для неаутентифицированных пользователей используем локальные данные
-                category_videos = Video.objects.filter(
-                    category__name=db_category,
-                    is_published=True
-                ).values_list('id', flat=True)
-                
-                watched_videos = sum(1 for video_id in category_videos 
-                                   if str(video_id) in local_watched_videos)
-            
-            progress_percentage = int((watched_videos / total_videos) * 100)
-            progress_data[api_key] = progress_percentage
-        else:
-            progress_data[api_key] = 0
+        stats = progress_counters.get_category_stats(user=request.user)
+        progress_data = progress_service.get_progress_percentages(stats)
+        if synced['watched_videos']:
+            try:
+                async_to_sync(get_channel_layer().group_send)(
+                    f"progress_{request.user.id}",
+                    {
+                        "type": "progress_updated",
+                        "progress": progress_data
+                    }
+                )
+            except Exception as e:
+                logger.warning(f"Не удалось отправить обновление прогресса: {e}")
+    else:
+        stats = progress_counters.get_category_stats(watched_video_ids=list(watched))
+        progress_data = progress_service.get_progress_percentages(stats)
     
     return Response({
         'progress': progress_data,
-        'total_videos': {
-            'html': Video.objects.filter(category__name='html_css', is_published=True).count(),
-            'js': Video.objects.filter(category__name='javascript', is_published=True).count(),
-            'php': Video.objects.filter(category__name='php', is_published=True).count(),
-            'wordpress': Video.objects.filter(category__name='wordpress', is_published=True).count(),
-        }
+        'total_videos': {api_key: counts['total'] for api_key, counts in stats.items()},
+        'synced': synced,
+        'user_id': request.user.id if request.user.is_authenticated else None
     })
 
 @api_view(['GET'])
 def dashboard_stats(request):
     """Статистика для дашборда"""
-    total_videos = Video.objects.filter(is_published=True).count()
+    stats = progress_counters.get_category_stats(user=request.user)
+    total_videos = sum(counts['total'] for counts in stats.values())
     total_categories = Category.objects.count()
     
-    # Прогресс по категориям (для демонстрации)
-    progress_data = {
-        'html': 0,
-        'js': 0,
-        'php': 0,
-        'wordpress': 0
-    }
-    
-    if request.user.is_authenticated:
-        categories = ['html_css', 'javascript', 'php', 'wordpress']
-        category_mapping = {
-            'html_css': 'html',
-            'javascript': 'js',
-            'php': 'php',
-            'wordpress': 'wordpress'
-        }
-        
-        for db_category in categories:
-            api_key = category_mapping[db_category]
-            
-            total_videos_cat = Video.objects.filter(
-                category__name=db_category,
-                is_published=True
-            ).count()
-            
-            if total_videos_cat > 0:
-                watched_videos = UserProgress.objects.filter(
-                    user=request.user,
-                    video__category__name=db_category,
-                    video__is_published=True,
-                    completed=True
-                ).count()
-                
-                progress_data[api_key] = int((watched_videos / total_videos_cat) * 100)
+    # Для неавторизованных пользователей прогресс нулевой
+    progress_data = progress_service.get_progress_percentages(stats)
     
     return Response({
         'total_videos': total_videos,
@@ -266,13 +316,18 @@ def toggle_favorite(request):
         return Response({'error': 'Video not found'}, status=404)
 
 @api_view(['GET'])
+@revalidate(favorites_etag, private=True)
 def user_favorites(request):
     """Получить избранные видео пользователя"""
     if not request.user.is_authenticated:
         return Response({'favorites': []})
     
-    favorites = Favorite.objects.filter(user=request.user).select_related('video')
-    favorite_videos = [fav.video for fav in favorites if fav.video.is_published]
+    # Порядок как у Favorite: сначала недавно добавленные
+    favorite_videos = list(
+        Video.objects.catalog()
+        .filter(lp_video_favorites__user=request.user)
+        .order_by('-lp_video_favorites__created_at')
+    )
     
     serializer = VideoSerializer(favorite_videos, many=True, context={'request': request})
     return Response({
@@ -293,126 +348,127 @@ def check_favorite_status(request, video_id):
     except Video.DoesNotExist:
         return Response({'error': 'Video not found'}, status=404)
 
-@api_view(['POST'])
-def chat_with_gpt(request):
-    """Чат с GPT - точно как в телеграм боте"""
-    serializer = ChatRequestSerializer(data=request.data)
-    if not serializer.is_valid():
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+def _json_response(data, status=200, headers=None):
+    # Тот же JSON, что у DRF JSONRenderer: кириллица без экранирования
+    return JsonResponse(data, status=status, headers=headers, json_dumps_params={'ensure_ascii': False})
+
+def _check_chat_request(request):
+    """Синхронная часть чата, как у @api_view: пользователь, CSRF и троттлинг
+
+    Возвращает (user, ответ с ошибкой или None). Выполняется в sync_to_async,
+    так как сессия, пользователь и кэш троттлинга работают синхронно.
+    """
+    user = request.user
+    if user.is_authenticated:
+        # DRF проверяет CSRF только для входа по сессии
+        try:
+            SessionAuthentication().enforce_csrf(request)
+        except exceptions.PermissionDenied as e:
+            return user, _json_response({'detail': str(e.detail)}, status=status.HTTP_403_FORBIDDEN)
     
-    message = serializer.validated_data['message']
-    session_id = serializer.validated_data.get('session_id')
+    wait = chat_service.throttle_wait(request)
+    if wait is not None:
+        error = exceptions.Throttled(wait)
+        headers = {'Retry-After': str(int(math.ceil(wait)))}
+        return user, _json_response({'detail': str(error.detail)}, status=error.status_code, headers=headers)
     
-    # Инициализируем логгер
-    import logging
-    logger = logging.getLogger(__name__)
+    # Объект пользователя уже загружен - дальше его можно использовать в async коде
+    return getattr(user, '_wrapped', user), None
+
+def _parse_chat_body(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError as e:
+            raise exceptions.ParseError(f'JSON parse error - {e}')
+    return request.POST
+
+async def _validated_chat_request(request):
+    """Общая часть chat_with_gpt и chat_stream: (user, данные, ответ с ошибкой или None)"""
+    if request.method != 'POST':
+        return None, None, _json_response({'detail': f'Method "{request.method}" not allowed.'},
+                                          status=status.HTTP_405_METHOD_NOT_ALLOWED, headers={'Allow': 'POST'})
     
-    # Если пользователь не авторизован и нет session_id, создаем новый
-    if not request.user.is_authenticated and not session_id:
-        session_id = str(uuid.uuid4())
+    user, error_response = await sync_to_async(_check_chat_request)(request)
+    if error_response is not None:
+        return user, None, error_response
     
     try:
-        # Получаем ВСЮ историю разговора (без ограничений!)
-        conversation_history = []
-        if request.user.is_authenticated:
-            recent_messages = ChatMessage.objects.filter(
-                user=request.user
-            ).order_by('-created_at')  # Убираем все ограничения
-        elif session_id:
-            recent_messages = ChatMessage.objects.filter(
-                session_id=session_id
-            ).order_by('-created_at')  # Убираем все ограничения
-        else:
-            recent_messages = []
-        
-        # Подготавливаем ВСЮ историю для GPT (обращаем порядок как в телеграм боте)
-        for msg in reversed(recent_messages):
-            # НЕ ограничиваем длину сообщений - берем как есть!
-            conversation_history.append({
-                'message': str(msg.message),
-                'response': str(msg.response)
-            })
-        
-        # Получаем ответ от GPT (асинхронно, как в примере)
-        import asyncio
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-        
-        # Логируем информацию о запросе
-        logger.info(f"Chat request: user={request.user if request.user.is_authenticated else 'anonymous'}, "
-                   f"session={session_id}, msg_len={len(message)}, history_len={len(conversation_history)}")
-        
-        # НЕ ограничиваем длину сообщения - используем полное!
-        current_message = message
-        
-        gpt_response = loop.run_until_complete(
-            gpt_service.get_response_async(current_message, conversation_history)
+        data = _parse_chat_body(request)
+    except exceptions.ParseError as e:
+        return user, None, _json_response({'detail': str(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    serializer = ChatRequestSerializer(data=data)
+    if not serializer.is_valid():
+        return user, None, _json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    return user, serializer.validated_data, None
+
+async def chat_with_gpt(request):
+    """Чат с GPT - точно как в телеграм боте
+
+    Нативное async представление: ответ провайдера ожидается в цикле событий
+    ASGI-сервера, поток на время запроса не занимается. С async_mode запрос
+    ставится в очередь chat_worker: сразу возвращается 202 с id задачи, результат
+    доступен по poll_url и приходит в чат-сокет (ws/chat/).
+    """
+    user, data, error_response = await _validated_chat_request(request)
+    if error_response is not None:
+        return error_response
+    
+    if data.get('async_mode'):
+        job = await sync_to_async(chat_jobs.create_job, thread_sensitive=False)(
+            user, data['message'], data.get('session_id')
         )
-        
-        # Проверяем успешность ответа
-        if gpt_response['success']:
-            chat_gpt_response = gpt_response['response']
-            provider_used = gpt_response.get('provider_used', 'unknown')
-            
-            # Сохраняем сообщение в базу данных
-            chat_message = ChatMessage.objects.create(
-                user=request.user if request.user.is_authenticated else None,
-                session_id=session_id or '',
-                message=message,  # Используем полное оригинальное сообщение
-                response=chat_gpt_response,
-                model_used=gpt_response.get('model_used', 'gpt-default')
-            )
-            
-            # Возвращаем успешный ответ
-            logger.info(f"Chat success: provider={provider_used}, response_len={len(chat_gpt_response)}")
-            return Response({
-                'success': True,
-                'message': message,  # Возвращаем полное оригинальное сообщение
-                'response': chat_gpt_response,
-                'session_id': session_id,
-                'chat_id': chat_message.id,
-                'provider_used': provider_used,
-                'created_at': chat_message.created_at.isoformat()
-            })
-        else:
-            # Если GPT не смог ответить, возвращаем ошибку
-            error_message = gpt_response.get('response', 'Извините, произошла ошибка.')
-            error_details = gpt_response.get('error', 'Unknown error')
-            logger.warning(f"Chat GPT error: {error_details}")
-            
-            # Проверяем, является ли это ошибкой rate limit
-            if "rate" in error_details.lower() or "limit" in error_details.lower() or "429" in str(error_details):
-                return Response({
-                    'success': False,
-                    'error': 'Rate limit exceeded',
-                    'message': 'Слишком много запросов. Пожалуйста, подождите немного и попробуйте снова.',
-                    'session_id': session_id,
-                    'retry_after': 30  # Рекомендуем подождать 30 секунд
-                }, status=status.HTTP_429_TOO_MANY_REQUESTS)
-            
-            return Response({
-                'success': False,
-                'error': error_details,
-                'message': error_message,
-                'session_id': session_id
-            }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-        
-    except Exception as e:
-        # Логируем ошибку
-        logger.error(f"Critical chat error: {str(e)}, user={request.user if request.user.is_authenticated else 'anonymous'}, "
-                    f"session={session_id}, msg_len={len(message)}")
-        
-        return Response({
-            'success': False,
-            'error': 'Внутренняя ошибка сервера',
-            'message': 'Извините, произошла ошибка при обработке вашего запроса. Попробуйте еще раз.',
-            'details': str(e) if settings.DEBUG else None  # Показываем детали только в режиме отладки
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return _json_response({
+            'success': True,
+            **chat_jobs.public_state(job),
+            # session_id нужен анонимному клиенту, чтобы can_access узнал автора задачи
+            'poll_url': f"{reverse('lp-chat-job', args=[job['id']])}?{urlencode({'session_id': job['session_id']})}"
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    status_code, payload = await chat_service.handle_message(user, data['message'], data.get('session_id'))
+    return _json_response(payload, status=status_code)
+
+async def chat_stream(request):
+    """Потоковый чат через Server-Sent Events
+
+    События: start, delta (фрагменты текста по мере генерации), затем done
+    с сохраненным сообщением или error. Ошибки до начала потока - обычный JSON.
+    """
+    user, data, error_response = await _validated_chat_request(request)
+    if error_response is not None:
+        return error_response
+    
+    async def events():
+        async for event in chat_service.stream_message(user, data['message'], data.get('session_id')):
+            yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    # Отключаем буферизацию в nginx, иначе фрагменты придут одним куском
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# Как у @api_view: CSRF проверяется в _check_chat_request только для сессий.
+# Декоратор csrf_exempt в Django 4.2 превратил бы корутину в синхронную функцию
+chat_with_gpt.csrf_exempt = True
+chat_stream.csrf_exempt = True
 
 @api_view(['GET'])
+@throttle_classes([])  # Опрос раз в секунду не должен расходовать лимит запросов к чату
+def chat_job_status(request, job_id):
+    """Состояние задачи чата: 202 пока выполняется, затем результат как у /api/chat/"""
+    job = chat_jobs.get_job(job_id)
+    if job is None or not chat_jobs.can_access(job, request.user, request.GET.get('session_id')):
+        return Response({'error': 'Задача не найдена'}, status=status.HTTP_404_NOT_FOUND)
+    
+    state = chat_jobs.public_state(job)
+    if job['status'] != chat_jobs.DONE:
+        return Response(state, status=status.HTTP_202_ACCEPTED)
+    return Response(state)
+
+@api_view(['GET'])
+@revalidate(chat_history_etag, chat_history_last_modified, private=True)
 def chat_history(request):
     """Получить историю чата"""
     session_id = request.GET.get('session_id')
@@ -428,6 +484,19 @@ def chat_history(request):
     else:
         return Response({'messages': []})
     
+    # Постраничная выдача по курсору: от новых страниц к старым
+    paginator = KeysetPagination()
+    if paginator.is_requested(request):
+        page = paginator.paginate_queryset(messages, request)
+        # Внутри страницы - в хронологическом порядке, как и полная история
+        serializer = ChatMessageSerializer(list(reversed(page)), many=True)
+        return Response({
+            'messages': serializer.data,
+            'session_id': session_id,
+            'next': paginator.get_next_link(),
+            'next_cursor': paginator.next_cursor
+        })
+    
     # Разворачиваем список, чтобы показать сначала старые сообщения
     messages = list(reversed(messages))
     
@@ -450,6 +519,7 @@ def clear_chat_history(request):
         else:
             return Response({'error': 'Не указан пользователь или session_id'}, 
                           status=status.HTTP_400_BAD_REQUEST)
+        summary_queryset(request.user, session_id).delete()
         
         return Response({
             'message': f'Удалено {deleted_count} сообщений',
@@ -100,18 +100,8 @@ class GPTChat {
         while (!sent && attemptCount < maxAttempts) {
             try {
                 const csrfToken = document.querySelector('[name=csrf-token]').getAttribute('content');
-                const response = await fetch('/api/chat/', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                        'X-CSRFToken': csrfToken,
-                    },
-                    body: JSON.stringify({
-                        message: message,
-                        session_id: this.sessionId
-                    })
-                });
-                const data = await response.json();
+                const response = await this.requestStream(message, csrfToken);
+                const data = response.data;
                 if (response.ok) {
                     // Убираем индикатор загрузки
                     this.hideLoading();
@@ -155,6 +145,73 @@ class GPTChat {
         }
     }
 
+    // Потоковый ответ через SSE: текст появляется по мере генерации
+    async requestStream(message, csrfToken) {
+        const response = await fetch('/api/chat/stream/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrfToken,
+            },
+            body: JSON.stringify({
+                message: message,
+                session_id: this.sessionId
+            })
+        });
+        if (!response.ok || !response.body) {
+            // Ошибки до начала потока приходят обычным JSON
+            return { ok: false, status: response.status, data: await response.json() };
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let bubble = null;
+        const removeBubble = () => {
+            if (bubble) {
+                bubble.closest('.chat-message').remove();
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+                if (!dataLine) {
+                    continue;
+                }
+                const event = JSON.parse(dataLine.slice(6));
+
+                if (event.type === 'delta') {
+                    if (!bubble) {
+                        this.hideLoading();
+                        this.renderMessage('ai', '');
+                        bubble = this.chatContainer.lastElementChild.querySelector('.message-bubble');
+                    }
+                    text += event.content;
+                    bubble.innerHTML = this.formatMessage(text);
+                    this.scrollToBottom();
+                } else if (event.type === 'done' || event.type === 'error') {
+                    // Черновик заменяется окончательным отформатированным ответом
+                    removeBubble();
+                    return { ok: event.type === 'done', status: event.status || 200, data: event };
+                }
+            }
+        }
+
+        removeBubble();
+        return { ok: false, status: 0, data: { message: 'Ответ был прерван. Попробуйте еще раз.' } };
+    }
+
     async fetchProviderList() {
         try {
             const resp = await fetch('/api/provider_info/');
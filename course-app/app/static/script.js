@@ -289,15 +289,19 @@ function calculateProgress(category) {
 async function loadDashboardData() {
     try {
         // Загружаем прогресс пользователя из learning_platform
-        // Отправляем локальные данные о просмотренных видео для неаутентифицированных пользователей
-        const progressResponse = await fetch(`${API_BASE}/user/progress/`, {
+        // Локальная история одним запросом: для авторизованных сливается с аккаунтом,
+        // для неаутентифицированных используется только для подсчета прогресса
+        const progressResponse = await fetch(`${API_BASE}/user/progress/sync/`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
                 'X-CSRFToken': getCsrfToken()
             },
             body: JSON.stringify({
-                watched_videos: watchedVideos
+                watched_videos: watchedVideos,
+                favorites: favoriteVideos,
+                // Аккаунт, с которым история уже слита: повторно сервер ее не сливает
+                synced_user: localStorage.getItem('progressSyncedUser') || ''
             })
         });
         
@@ -305,6 +309,13 @@ async function loadDashboardData() {
             const progressData = await progressResponse.json();
             console.log('Получены данные прогресса с API:', progressData);
             
+            // Маркер слияния привязан к аккаунту: после входа под другим пользователем слияние повторится
+            if (progressData.user_id) {
+                localStorage.setItem('progressSyncedUser', String(progressData.user_id));
+            } else {
+                localStorage.removeItem('progressSyncedUser');
+            }
+            
             // Обновляем прогресс-бары с данными от API
             if (progressData.progress) {
                 updateProgressBars(progressData.progress);
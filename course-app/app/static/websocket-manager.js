@@ -7,6 +7,7 @@ class WebSocketManager {
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 5;
         this.reconnectInterval = 1000; // 1 секунда
+        this.textDecoder = new TextDecoder();
         
         this.init();
     }
@@ -30,6 +31,8 @@ class WebSocketManager {
             
             // Подключение к WebSocket для видео
             this.videoSocket = new WebSocket(`${protocol}//${host}/ws/videos/`);
+            // Начальные данные приходят бинарным кадром с готовым JSON
+            this.videoSocket.binaryType = 'arraybuffer';
             
             this.videoSocket.onopen = () => {
                 console.log('WebSocket для видео подключен');
@@ -38,7 +41,8 @@ class WebSocketManager {
             };
 
             this.videoSocket.onmessage = (event) => {
-                const data = JSON.parse(event.data);
+                const text = typeof event.data === 'string' ? event.data : this.textDecoder.decode(event.data);
+                const data = JSON.parse(text);
                 this.handleVideoMessage(data);
             };
 
@@ -97,6 +101,9 @@ class WebSocketManager {
 
     handleVideoMessage(data) {
         switch (data.type) {
+            case 'initial_data':
+                this.applyInitialData(data);
+                break;
             case 'recent_videos':
                 this.updateRecentVideos(data.videos);
                 break;
@@ -126,6 +133,14 @@ class WebSocketManager {
         }
     }
 
+    applyInitialData(data) {
+        // Начальные данные приходят одним сообщением: последние видео и все категории
+        this.updateRecentVideos(data.recent_videos);
+        Object.entries(data.categories).forEach(([category, videos]) => {
+            this.updateCategoryVideos(category, videos);
+        });
+    }
+
     updateRecentVideos(videos) {
         console.log('Получены последние видео через WebSocket:', videos);
         